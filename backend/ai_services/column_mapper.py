@@ -230,7 +230,31 @@ def _guess_specialty(columns: List[str]) -> str:
     return "general"
 
 
-def _data_quality(df: pd.DataFrame) -> Tuple[float, Dict[str, Any]]:
+def _catalog_quality(catalog) -> Tuple[float, float, float]:
+    """(completeness, duplicate rate, outlier rate) from a column catalog instead of the rows."""
+    entries = list(catalog.columns.values())
+    completeness = float(1.0 - np.mean([e.missing_pct() for e in entries]))
+    dup_rate = 0.0
+    for e in entries:
+        if _is_id_like(e.name.lower()):
+            dup_rate = float(max(0.0, 1.0 - e.distinct() / max(1, catalog.rows)))
+            break
+    out_rate_parts = []
+    for e in entries:
+        if e.kind != "numeric" or e.count < 10:
+            continue
+        q1, q3 = e.quantile(0.25), e.quantile(0.75)
+        iqr = q3 - q1
+        if iqr == 0:
+            continue
+        out_rate_parts.append(e.fraction_outside(q1 - 1.5 * iqr, q3 + 1.5 * iqr))
+    return completeness, dup_rate, float(np.mean(out_rate_parts)) if out_rate_parts else 0.0
+
+
+def _data_quality(df: pd.DataFrame, catalog=None) -> Tuple[float, Dict[str, Any]]:
+    if catalog is not None and catalog.rows:
+        completeness, dup_rate, out_rate = _catalog_quality(catalog)
+        return _quality_score(completeness, dup_rate, out_rate)
     if df is None or df.empty:
         return 0.0, {"completeness": 0.0, "duplicates": 0.0, "outlier_rate": 0.0}
     completeness = float(1.0 - df.isna().mean().mean())
@@ -257,7 +281,10 @@ def _data_quality(df: pd.DataFrame) -> Tuple[float, Dict[str, Any]]:
         lower, upper = q1 - 1.5 * iqr, q3 + 1.5 * iqr
         out_rate_parts.append(float(((s < lower) | (s > upper)).mean()))
     out_rate = float(np.mean(out_rate_parts)) if out_rate_parts else 0.0
+    return _quality_score(completeness, dup_rate, out_rate)
+
 
+def _quality_score(completeness: float, dup_rate: float, out_rate: float) -> Tuple[float, Dict[str, Any]]:
     # Simple aggregate
     dq = max(0.0, min(1.0, 0.6 * completeness + 0.2 * (1 - dup_rate) + 0.2 * (1 - out_rate)))
     return dq, {
@@ -275,7 +302,8 @@ class IntelligentColumnMapper:
     with a robust heuristic fallback (regex + content ranges).
     """
 
-    async def analyze_medical_data(self, df: pd.DataFrame) -> Dict[str, Any]:
+    async def analyze_medical_data(self, df: pd.DataFrame, catalog=None) -> Dict[str, Any]:
+        """`catalog`: the dataset's column_catalog.ColumnCatalog; quality scores then come from it."""
         if df is None or df.empty:
             return {
                 "column_mappings": {},
@@ -320,7 +348,7 @@ class IntelligentColumnMapper:
                             v.setdefault("confidence", 0.7)
                             v.setdefault("rationale", "LLM-inferred")
                             v["source"] = "gemini"
-                        dq, breakdown = _data_quality(df)
+                        dq, breakdown = _data_quality(df, catalog)
                         return {
                             "column_mappings": parsed["column_mappings"],
                             "medical_specialty": parsed.get("medical_specialty", _guess_specialty(df.columns.tolist())),
@@ -345,7 +373,7 @@ class IntelligentColumnMapper:
                 "source": "heuristic"
             }
 
-        dq, breakdown = _data_quality(df)
+        dq, breakdown = _data_quality(df, catalog)
         return {
             "column_mappings": mappings,
             "medical_specialty": _guess_specialty(df.columns.tolist()),
@@ -26,6 +26,11 @@ try:
 except Exception:
     registry, load_dataframe = None, None
 
+try:
+    from ..api.services import column_catalog  # type: ignore
+except Exception:
+    column_catalog = None
+
 
 def _engine() -> Optional[Engine]:
     if _app_engine is not None:
@@ -61,13 +66,7 @@ def _load_df(dataset_id: str | int) -> pd.DataFrame:
     return pd.DataFrame()
 
 
-def _schema_profile(df: pd.DataFrame) -> Dict[str, Any]:
-    if df is None or df.empty:
-        return {"rows": 0, "columns": [], "numerical": [], "categorical": [], "preview": []}
-    
-    num_cols = df.select_dtypes(include=["number"]).columns.tolist()
-    cat_cols = [c for c in df.columns if c not in num_cols]
-    
+def _preview_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
     # Convert preview to JSON-serializable format
     preview_df = df.head(50).copy()
     
@@ -95,6 +94,17 @@ def _schema_profile(df: pd.DataFrame) -> Dict[str, Any]:
             else:
                 row_dict[col] = str(val)
         preview.append(row_dict)
+    return preview
+
+
+def _schema_profile(df: pd.DataFrame) -> Dict[str, Any]:
+    if df is None or df.empty:
+        return {"rows": 0, "columns": [], "numerical": [], "categorical": [], "preview": []}
+    
+    num_cols = df.select_dtypes(include=["number"]).columns.tolist()
+    cat_cols = [c for c in df.columns if c not in num_cols]
+    datetime_cols = df.select_dtypes(include=['datetime64', 'datetimetz']).columns
+    preview = _preview_records(df)
     
     # lightweight numeric stats (helps the LLM decide targets & bands)
     stats = {}
@@ -125,6 +135,51 @@ def _schema_profile(df: pd.DataFrame) -> Dict[str, Any]:
     }
 
 
+def _load_catalog(dataset_id: str | int):
+    """The column catalog written at ingest (or built once for a file dataset), if any."""
+    if column_catalog is None:
+        return None
+    eng = _engine()
+    if eng is not None:
+        try:
+            cat = column_catalog.load(eng, int(dataset_id))
+            if cat is not None:
+                return cat
+        except Exception:
+            pass
+    if registry and load_dataframe:
+        try:
+            if registry.get(str(dataset_id)):
+                return column_catalog.for_file(str(dataset_id), registry.path_for(str(dataset_id)), load_dataframe)
+        except Exception:
+            pass
+    return None
+
+
+def _catalog_profile(cat) -> Dict[str, Any]:
+    """_schema_profile() from the column catalog: whole-dataset stats without loading the rows."""
+    entries = list(cat.columns.values())
+    num = [e for e in entries if e.kind == "numeric"]
+    cat_cols = [e for e in entries if e.kind != "numeric"]
+    stats = {}
+    for e in num[:40]:
+        stats[e.name] = {"min": e.min, "max": e.max, "mean": e.mean(), "sd": e.std(),
+                         "missing_pct": e.missing_pct()}
+    for e in cat_cols[:40]:
+        top = e.mode()
+        stats[e.name] = {"unique": e.distinct(), "top": None if top is None else str(top),
+                         "missing_pct": e.missing_pct()}
+    return {
+        "rows": cat.rows,
+        "columns": [e.name for e in entries],
+        "numerical": [e.name for e in num],
+        "categorical": [e.name for e in cat_cols],
+        "datetime_columns": [e.name for e in entries if e.kind == "datetime"],
+        "stats": stats,
+        "preview": _preview_records(cat.preview)
+    }
+
+
 _SYSTEM_INSTRUCTIONS = """
 You are a senior clinical data scientist. Produce ONLY valid JSON (no extra text).
 Given a dataset profile, design an analysis plan:
@@ -251,8 +306,8 @@ class GeminiStrategist:
     """
 
     def generate_parsed(self, dataset_id: str | int, objective: Optional[str] = None) -> Tuple[Dict[str, Any], str]:
-        df = _load_df(dataset_id)
-        profile = _schema_profile(df)
+        cat = _load_catalog(dataset_id)
+        profile = _catalog_profile(cat) if cat is not None else _schema_profile(_load_df(dataset_id))
 
         # Build the prompt with system + user content
         payload = {
@@ -2,16 +2,25 @@
 from fastapi import APIRouter, HTTPException, Body
 from ...models.analysis_schemas import AIAnalysisRequest
 from ...core.ai_orchestrator import AIOrchestrator
+from ..services import column_catalog
 import pandas as pd
 
+SAMPLE_PATH = "/mnt/data/medical-intellianalytics-pro/data/joined_training_sample.csv"
+
 router = APIRouter(prefix="/ai-analysis", tags=["AI Analysis"])
 
 @router.post("")
 async def run_ai_analysis(payload: AIAnalysisRequest = Body(...)):
     # For demo, load a sample already on disk (join of patients + outcomes)
     try:
-        df = pd.read_csv("/mnt/data/medical-intellianalytics-pro/data/joined_training_sample.csv")
+        df = pd.read_csv(SAMPLE_PATH)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Sample data not found: {e}")
-    result = await AIOrchestrator().process_dataset(df, {"specialty": "general"})
+    try:
+        # built from df the first time, then reused until the file changes
+        catalog = column_catalog.for_file("ai_sample", SAMPLE_PATH, lambda _: df)
+    except Exception as e:
+        print(f"Column catalog for the AI analysis sample unavailable: {e}")
+        catalog = None
+    result = await AIOrchestrator().process_dataset(df, {"specialty": "general"}, catalog)
     return result
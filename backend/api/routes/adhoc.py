@@ -1,9 +1,11 @@
 # app/routers/adhoc.py
 from __future__ import annotations
 import os, json
+import asyncio
 from typing import Optional, Dict, Any, List
 import pandas as pd
 from fastapi import APIRouter, HTTPException, Query, Depends
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from sqlalchemy import text, create_engine
 from sqlalchemy.engine import Engine
@@ -14,7 +16,8 @@ try:
 except Exception:
     _app_engine, _SessionLocal = None, None
 
-from joblib import load as _load
+from ..services.micro_batcher import batcher
+from ..services import patient_access
 
 router = APIRouter(prefix="/adhoc", tags=["ad-hoc"])
 
@@ -80,23 +83,28 @@ def _fetch_patient(dataset_id: int, patient_id: Optional[str] = None) -> pd.Data
     if patient_id:
         sql = text("""SELECT * FROM patient_records WHERE dataset_id = :d AND patient_id = :pid LIMIT 1""")
         params = {"d": dataset_id, "pid": patient_id}
+        df = pd.read_sql(sql, con=eng, params=params)
     else:
-        sql = text("""SELECT * FROM patient_records WHERE dataset_id = :d ORDER BY random() LIMIT 1""")
-        params = {"d": dataset_id}
-    df = pd.read_sql(sql, con=eng, params=params)
+        df = patient_access.random_patient(eng, dataset_id)
     if df.empty:
         raise HTTPException(status_code=404, detail="Patient not found for dataset")
     return df
 
-def _infer_single_model(model, Xrow: pd.DataFrame, thr: float) -> Dict[str, Any]:
+def _infer_single_model(kind: str, value: float, thr: float) -> Dict[str, Any]:
+    if kind == "classification":
+        return {"kind": "classification", "score": value, "pred": int(value >= thr), "threshold": thr}
+    if kind == "decision":
+        return {"kind": "classification", "score": value, "pred": int(value >= 0.0), "threshold": 0.0}
+    return {"kind": "regression", "prediction": value}
+
+async def _score_patient(m: str, record: Dict[str, Any], thr: float) -> Dict[str, Any]:
     try:
-        if hasattr(model, "predict_proba"):
-            prob = float(model.predict_proba(Xrow)[:, 1][0])
-            return {"kind": "classification", "score": prob, "pred": int(prob >= thr), "threshold": thr}
-        pred = float(model.predict(Xrow)[0])
-        return {"kind": "regression", "prediction": pred}
+        kind, value = await batcher.submit(m, record)
+    except FileNotFoundError:
+        return {"error": "Model file not found. Train/models export required.", "model": m}
     except Exception as e:
-        return {"error": f"inference error: {e.__class__.__name__}: {e}"}
+        return {"error": f"load/predict error: {e.__class__.__name__}: {e}"}
+    return _infer_single_model(kind, value, thr)
 
 @router.get("/random")
 def get_random_patient(dataset_id: int = Query(..., ge=1)) -> Dict[str, Any]:
@@ -109,8 +117,8 @@ def get_patient(patient_id: str, dataset_id: int = Query(..., ge=1)) -> Dict[str
     return {"patient": df.to_dict(orient="records")[0]}
 
 @router.post("/predict")
-def predict_for_patient(req: PatientPredictionRequest, _db = Depends(get_db)) -> Dict[str, Any]:
-    strategy_json = _read_strategy(req.dataset_id, req.strategy_id)
+async def predict_for_patient(req: PatientPredictionRequest, _db = Depends(get_db)) -> Dict[str, Any]:
+    strategy_json = await run_in_threadpool(_read_strategy, req.dataset_id, req.strategy_id)
     extracted = _extract_models_and_thresholds(strategy_json)
     models = extracted["models"]
     thresholds = extracted["thresholds"]
@@ -121,24 +129,13 @@ def predict_for_patient(req: PatientPredictionRequest, _db = Depends(get_db)) ->
             detail="No models listed in strategy. Generate/select a strategy before running ad-hoc predictions."
         )
 
-    df = _fetch_patient(req.dataset_id, req.patient_id)
+    df = await run_in_threadpool(_fetch_patient, req.dataset_id, req.patient_id)
     patient_record = df.to_dict(orient="records")[0]
-    feature_df = df.drop(columns=[c for c in ("id", "dataset_id") if c in df.columns], errors="ignore")
-
-    results: Dict[str, Any] = {}
-    artifacts_dir = os.getenv("ARTIFACTS_DIR", os.path.join("artifacts", "models"))
+    features = {k: v for k, v in patient_record.items() if k not in ("id", "dataset_id")}
 
-    for m in models:
-        path = os.path.join(artifacts_dir, f"{m}.joblib")
-        if not os.path.exists(path):
-            results[m] = {"error": "Model file not found. Train/models export required.", "path": path}
-            continue
-        try:
-            model = _load(path)
-            thr = float(thresholds.get(m, 0.5))
-            results[m] = _infer_single_model(model, feature_df, thr)
-        except Exception as e:
-            results[m] = {"error": f"load/predict error: {e.__class__.__name__}: {e}"}
+    # concurrent requests for the same model are scored together (services/micro_batcher.py)
+    outs = await asyncio.gather(*(_score_patient(m, features, float(thresholds.get(m, 0.5))) for m in models))
+    results: Dict[str, Any] = dict(zip(models, outs))
 
     return {
         "dataset_id": req.dataset_id,
@@ -149,6 +146,6 @@ def predict_for_patient(req: PatientPredictionRequest, _db = Depends(get_db)) ->
     }
 
 @router.get("/predict/random")
-def predict_for_random(dataset_id: int = Query(..., ge=1), strategy_id: int = Query(..., ge=1)):
+async def predict_for_random(dataset_id: int = Query(..., ge=1), strategy_id: int = Query(..., ge=1)):
     req = PatientPredictionRequest(dataset_id=dataset_id, strategy_id=strategy_id, patient_id=None)
-    return predict_for_patient(req)
+    return await predict_for_patient(req)
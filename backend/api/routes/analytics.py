@@ -1,29 +1,36 @@
 # app/routers/analytics.py
 from __future__ import annotations
 
-from typing import Dict, Any, List, Optional, Iterable
-from fastapi import APIRouter, HTTPException, Query
+from typing import Dict, Any, Iterator, List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import os
 import json
+import asyncio
+import threading
 import time
+import shutil
+import tempfile
 from pathlib import Path
-import glob
 
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import IsolationForest
-from sklearn.pipeline import Pipeline
-from sklearn.compose import ColumnTransformer
 
 from ..services.datasets_service import registry, load_dataframe
-from ..services.analysis_service import histograms_for_columns, duckdb_query
+from ..services.analysis_service import histograms_for_columns
+from ...utils.fast_json import FastJSONResponse, dumps, ndjson_line
 
 from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
 
-import joblib
-from ...paths import ARTIFACT_DIR
+from ..services import (
+    model_cache, prediction_service, patient_access, sharded_scoring, threshold_curve, risk_index, anomaly_engine,
+    pushdown_summary, column_catalog, duckdb_catalog,
+)
+from ..services.micro_batcher import batcher
+from ..services.job_queue import analysis_jobs, Job, JobCancelled, FINAL, SUCCEEDED, CANCELLED
 
 
 # -------- json export helper --------
@@ -33,8 +40,8 @@ except Exception:
 
     def _write_json(path: str, payload: Dict[str, Any]) -> None:
         Path(os.path.dirname(path)).mkdir(parents=True, exist_ok=True)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(payload, f, indent=2, default=str)
+        with open(path, "wb") as f:
+            f.write(dumps(payload, indent=True))
 
 
 # -------- DB engine --------
@@ -56,112 +63,6 @@ def _get_engine() -> Engine:
     return create_engine(url, future=True)
 
 
-# ===========================
-# Robust schema alignment
-# ===========================
-
-def _iter_objects(obj) -> Iterable:
-    """Recursively yield nested estimators/transformers inside common sklearn wrappers."""
-    if obj is None:
-        return
-    yield obj
-
-    # Pipelines
-    if hasattr(obj, "named_steps") and isinstance(getattr(obj, "named_steps"), dict):
-        for step in obj.named_steps.values():
-            yield from _iter_objects(step)
-    if hasattr(obj, "steps") and isinstance(getattr(obj, "steps"), (list, tuple)):
-        for _, step in obj.steps:
-            yield from _iter_objects(step)
-
-    # ColumnTransformer (contains transformer list)
-    if hasattr(obj, "transformers"):
-        for _, tr, _ in getattr(obj, "transformers"):
-            yield from _iter_objects(tr)
-    if hasattr(obj, "transformers_"):
-        for _, tr, _ in getattr(obj, "transformers_"):
-            yield from _iter_objects(tr)
-
-    # Common meta-estimators and wrappers
-    for attr in (
-        "best_estimator_", "estimator", "base_estimator",
-        "final_estimator", "classifier", "regressor",
-        "pipeline", "preprocessor_", "model"
-    ):
-        if hasattr(obj, attr):
-            try:
-                yield from _iter_objects(getattr(obj, attr))
-            except Exception:
-                pass
-
-
-def _all_column_transformers(model) -> List[ColumnTransformer]:
-    cts: List[ColumnTransformer] = []
-    for node in _iter_objects(model):
-        if isinstance(node, ColumnTransformer):
-            cts.append(node)
-    return cts
-
-
-def _expected_input_columns(model) -> Optional[List[str]]:
-    """
-    Return the union of ORIGINAL feature columns the ColumnTransformer(s) were fit on.
-    Prefer feature_names_in_ from each CT; otherwise gather selectors from transformers_.
-    """
-    cts = _all_column_transformers(model)
-    if not cts:
-        return None
-
-    expected: List[str] = []
-    seen = set()
-
-    for ct in cts:
-        cols = getattr(ct, "feature_names_in_", None)
-        if cols is not None:
-            for c in list(cols):
-                if c not in seen:
-                    seen.add(c)
-                    expected.append(str(c))
-            continue
-
-        # Fallback: collect declared selectors
-        transformers = getattr(ct, "transformers_", None) or getattr(ct, "transformers", [])
-        for _, _, sel in transformers:
-            if sel in (None, "drop"):
-                continue
-            if isinstance(sel, str):
-                if sel not in seen:
-                    seen.add(sel)
-                    expected.append(sel)
-            else:
-                try:
-                    for c in list(sel):
-                        if c not in seen:
-                            seen.add(c)
-                            expected.append(str(c))
-                except Exception:
-                    pass
-
-    return expected or None
-
-
-def _align_X_to_model(model, X: pd.DataFrame) -> pd.DataFrame:
-    """
-    Ensure X contains every column the preprocessor expects; add missing as NaN
-    and order columns to match fit-time schema. Extra columns are ignored.
-    """
-    exp = _expected_input_columns(model)
-    if not exp:
-        return X  # no CT found; use as-is
-
-    Xin = X.copy()
-    for c in exp:
-        if c not in Xin.columns:
-            Xin[c] = np.nan
-    # Order & restrict to expected schema
-    return Xin[exp]
-
-
 # ===========================
 # DB & dataset helpers
 # ===========================
@@ -276,11 +177,23 @@ def histograms(
     columns: Optional[str] = Query(None),
     bins: int = Query(20, ge=5, le=200)
 ) -> Dict[str, Any]:
-    df = _load_df(dataset_id)
-    cols = None
-    if columns:
-        cols = [c.strip() for c in columns.split(",") if c.strip() in df.columns]
-    hists = histograms_for_columns(df, columns=cols, bins=bins)
+    requested = [c.strip() for c in columns.split(",") if c.strip()] if columns else None
+    hists = None
+    try:
+        eng = _get_engine()
+        # from the column catalog written at ingest, without touching the rows
+        cat = column_catalog.load(eng, dataset_id)
+        if cat is not None and all(c in cat.columns for c in requested or ()):
+            hists = cat.histograms(requested, bins=bins)
+        # computed in Postgres: only bucket counts come back (payload keys allowed by name)
+        elif pushdown_summary.supported(eng):
+            hists = pushdown_summary.histograms(eng, dataset_id, requested, bins=bins)
+    except Exception as e:
+        print(f"Histogram pushdown failed, computing in pandas: {e}")
+    if hists is None:
+        df = _load_df(dataset_id)
+        cols = [c for c in requested if c in df.columns] if requested else None
+        hists = histograms_for_columns(df, columns=cols, bins=bins)
 
     decorated = []
     for h in hists:
@@ -294,15 +207,69 @@ def histograms(
     return {"histograms": decorated}
 
 
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+
 @router.post("/ad-hoc")
-def ad_hoc_sql(body: Dict[str, Any]) -> Dict[str, Any]:
+def ad_hoc_sql(body: Dict[str, Any], request: Request):
+    """
+    Read-only SQL over the dataset (`data`) and any other `data_<id>`, under a timeout and
+    DuckDB memory / thread limits. Body: {dataset_id, sql, page_rows?, cursor?, format?}.
+    JSON responses hold one page and a `next_cursor` for the next one; format "ndjson" or
+    "arrow" (or an Arrow Accept header) streams the whole result instead.
+    """
     dataset_id = body.get("dataset_id")
     sql = body.get("sql")
     if not dataset_id or not sql:
         raise HTTPException(status_code=400, detail="dataset_id and sql required")
-    df = _load_df(int(dataset_id))
-    cols, rows = duckdb_query(df, sql)
-    return {"columns": cols, "rows": rows}
+    fmt = str(body.get("format") or ("arrow" if ARROW_STREAM in request.headers.get("accept", "") else "json"))
+    if fmt not in ("json", "ndjson", "arrow"):
+        raise HTTPException(status_code=400, detail="format must be json, ndjson or arrow")
+    try:
+        eng = _get_engine()
+        versions = {i: patient_access.id_range(eng, i) for i in duckdb_catalog.referenced(sql, int(dataset_id))}
+    except Exception:
+        versions = {}
+    frame = None
+    if versions.get(int(dataset_id)) is None:
+        # not in the database: the in-memory frame, under the same limits
+        frame = _load_df(int(dataset_id))
+    else:
+        missing = sorted(i for i, v in versions.items() if v is None)
+        if missing:
+            raise HTTPException(status_code=404, detail=f"No patient records for dataset(s) {missing}")
+
+    import duckdb
+    try:
+        if fmt != "json":
+            chunks = duckdb_catalog.stream(sql, int(dataset_id), versions, _load_df, fmt=fmt, frame=frame)
+            # run up to the first batch here, so a bad query is still a 400 rather than a broken stream
+            first = next(chunks, b"")
+            return StreamingResponse(_adhoc_chunks(first, chunks, fmt),
+                                     media_type=ARROW_STREAM if fmt == "arrow" else "application/x-ndjson")
+        page_rows = int(body.get("page_rows") or duckdb_catalog.PAGE_ROWS)
+        if frame is not None:
+            return FastJSONResponse(duckdb_catalog.query_frame(frame, sql, int(dataset_id), page_rows, body.get("cursor")))
+        # Parquet sidecars attached to the process's DuckDB catalog; repeated queries come from its result cache
+        return FastJSONResponse(duckdb_catalog.query(sql, int(dataset_id), versions, _load_df, page_rows,
+                                                     body.get("cursor")))
+    except duckdb_catalog.QueryTimeout as e:
+        raise HTTPException(status_code=408, detail=f"Query timed out: {e}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except duckdb.Error as e:
+        raise HTTPException(status_code=400, detail=f"Query failed: {e}")
+
+
+def _adhoc_chunks(first: bytes, chunks: Iterator[bytes], fmt: str) -> Iterator[bytes]:
+    yield first
+    try:
+        yield from chunks
+    except Exception as e:
+        # the status line is already sent: NDJSON ends with an error line, Arrow is cut short
+        if fmt == "arrow":
+            raise
+        yield ndjson_line({"error": f"{e.__class__.__name__}: {e}"})
 
 
 # ---------------- Ad-hoc random + predict ----------------
@@ -314,69 +281,42 @@ class AdhocPredictRequest(BaseModel):
     strategy_id: Optional[int] = None
 
 
-@router.get("/adhoc/random")
-def adhoc_random(dataset_id: int = Query(...)) -> Dict[str, Any]:
+def _random_patient(dataset_id: int) -> pd.DataFrame:
+    """One random row: id-range seek in Postgres, full load only for file-registry datasets."""
+    try:
+        x = patient_access.random_patient(_get_engine(), dataset_id)
+    except Exception:
+        x = pd.DataFrame()
+    if not x.empty:
+        return x.drop(columns=["id"], errors="ignore")
     df = _load_df(dataset_id)
     if df.empty:
         raise HTTPException(status_code=404, detail="No records in dataset")
-    row = df.sample(1, random_state=np.random.randint(0, 1_000_000)).iloc[0].to_dict()
-    return {"patient": row}
-
-
-def _artifact_path(model_name: str) -> Optional[str]:
-    name = "".join(c if c.isalnum() or c in ("-", "_") else "_" for c in model_name)
-    candidates = [
-        ARTIFACT_DIR / "models" / f"{model_name}.joblib",
-        ARTIFACT_DIR / "models" / f"{name}.joblib",
-    ]
-    for p in candidates:
-        if Path(p).exists():
-            return str(p)
-    hits = glob.glob(str(ARTIFACT_DIR / "models" / f"*{name}*.joblib"))
-    return hits[0] if hits else None
+    return df.sample(1, random_state=np.random.randint(0, 1_000_000))
 
 
-# ---- model cache: load artifacts once per process (or per request) ----
-_MODEL_CACHE: dict[str, Any] = {}
+@router.get("/adhoc/random")
+def adhoc_random(dataset_id: int = Query(...)) -> Dict[str, Any]:
+    row = _random_patient(dataset_id).iloc[0].to_dict()
+    return {"patient": row}
 
 
+# ---- model cache: shared per process (see services/model_cache.py) ----
 def _load_model_cached(model_name: str):
-    pth = _artifact_path(model_name)
-    if not pth:
-        raise FileNotFoundError(f"Model artifact not found: {model_name}. Train it first.")
-    mdl = _MODEL_CACHE.get(pth)
-    if mdl is None:
-        mdl = joblib.load(pth)
-        _MODEL_CACHE[pth] = mdl
-    return mdl
+    return model_cache.get_model(model_name)
 
 
-def _predict_with_model(model_name: str, X: pd.DataFrame, threshold: float = 0.5) -> Dict[str, Any]:
-    """
-    Single-row convenience used by /adhoc/predict. Uses the cache.
-    """
-    model = _load_model_cached(model_name)
-
-    # Ensure columns/ordering match the training schema
-    Xin = _align_X_to_model(model, X)
-
-    # Classification
-    if hasattr(model, "predict_proba"):
-        proba = model.predict_proba(Xin)[:, 1]
-        prob = float(proba[0])
-        return {"score": prob, "pred": int(prob >= threshold), "threshold": threshold, "source": "model"}
+def _scoring_model(model_name: str, model, X: pd.DataFrame):
+    return prediction_service.scoring_model(model_name, model, X)
 
-    # Fall back to decision_function if available
-    if hasattr(model, "decision_function"):
-        score = float(np.ravel(model.decision_function(Xin))[0])
-        return {"score": score, "pred": int(score >= 0.0), "threshold": 0.0, "source": "model:decision_function"}
-
-    # Regression
-    if hasattr(model, "predict"):
-        val = float(np.ravel(model.predict(Xin))[0])
-        return {"prediction": val, "source": "model"}
 
-    raise TypeError(f"{model_name}: loaded artifact supports neither predict_proba, decision_function, nor predict.")
+def _single_result(kind: str, value: float, threshold: float = 0.5) -> Dict[str, Any]:
+    """Response entry for one patient and one model, from prediction_service.score_frame output."""
+    if kind == "classification":
+        return {"score": value, "pred": int(value >= threshold), "threshold": threshold, "source": "model"}
+    if kind == "decision":
+        return {"score": value, "pred": int(value >= 0.0), "threshold": 0.0, "source": "model:decision_function"}
+    return {"prediction": value, "source": "model"}
 
 
 def _bulk_predict_one(model_name: str, model, X_df: pd.DataFrame, threshold: float) -> Dict[str, Any]:
@@ -384,7 +324,7 @@ def _bulk_predict_one(model_name: str, model, X_df: pd.DataFrame, threshold: flo
     Vectorized scoring for one model across the full dataframe.
     Returns a dict describing classification or regression outputs.
     """
-    Xin = _align_X_to_model(model, X_df)
+    model, Xin = _scoring_model(model_name, model, X_df)
 
     # Classification path
     if hasattr(model, "predict_proba"):
@@ -392,7 +332,7 @@ def _bulk_predict_one(model_name: str, model, X_df: pd.DataFrame, threshold: flo
         preds = (proba >= float(threshold)).astype(int)
         return {
             "kind": "classification",
-            "scores": proba.astype(float),
+            "scores": np.asarray(proba, dtype=model_cache.SCORE_DTYPE),
             "preds": preds.astype(int),
             "threshold": float(threshold),
             "note": "constant_predictions" if float(np.nanstd(proba)) < 1e-12 else None,
@@ -403,7 +343,7 @@ def _bulk_predict_one(model_name: str, model, X_df: pd.DataFrame, threshold: flo
         vals = model.predict(Xin)
         return {
             "kind": "regression",
-            "values": np.asarray(vals, dtype=float),
+            "values": np.asarray(vals, dtype=model_cache.SCORE_DTYPE),
         }
 
     return {"kind": "error", "error": "unsupported model interface"}
@@ -421,34 +361,20 @@ def _load_latest_strategy(engine: Engine, dataset_id: int) -> Optional[Dict[str,
     return None
 
 
-@router.post("/adhoc/predict")
-def adhoc_predict(req: AdhocPredictRequest) -> Dict[str, Any]:
-    df = _load_df(req.dataset_id)
-    if req.patient is not None:
-        x = pd.DataFrame([req.patient])
-    elif req.patient_id is not None and "patient_id" in df.columns:
-        sub = df[df["patient_id"].astype(str) == str(req.patient_id)]
-        if sub.empty:
-            raise HTTPException(status_code=404, detail="patient_id not found in dataset")
-        x = sub.iloc[[0]]
-    else:
-        x = df.sample(1, random_state=np.random.randint(0, 1_000_000))
-
-    eng = _get_engine()
-    _ensure_analysis_tables(eng)
-
+def _resolve_strategy(eng: Engine, dataset_id: int, strategy_id: Optional[int]):
+    """(strategy row or None, selected models, thresholds), with the default model trio as fallback."""
     strategy = None
-    if req.strategy_id:
+    if strategy_id:
         with eng.begin() as con:
             row = con.execute(
                 text("SELECT id, parsed FROM strategies WHERE id=:s AND dataset_id=:d"),
-                {"s": int(req.strategy_id), "d": int(req.dataset_id)}
+                {"s": int(strategy_id), "d": int(dataset_id)}
             ).mappings().first()
             if row:
                 parsed = row["parsed"] if isinstance(row["parsed"], dict) else json.loads(row["parsed"])
                 strategy = {"id": int(row["id"]), "parsed": parsed}
     if strategy is None:
-        strategy = _load_latest_strategy(eng, req.dataset_id)
+        strategy = _load_latest_strategy(eng, dataset_id)
 
     selected = []
     thresholds = {}
@@ -458,11 +384,37 @@ def adhoc_predict(req: AdhocPredictRequest) -> Dict[str, Any]:
         thresholds = dict(parsed.get("thresholds", {}))
     if not selected:
         selected = ["MortalityRiskModel", "SepsisEarlyWarning", "LengthOfStayRegressor"]
+    return strategy, selected, thresholds
 
-    preds: Dict[str, Any] = {}
-    for m in selected:
-        th = float(thresholds.get(m, 0.5))
-        preds[m] = _predict_with_model(m, x, threshold=th)
+
+def _adhoc_inputs(req: AdhocPredictRequest):
+    """Blocking part of /adhoc/predict: pick the patient row and the strategy's models."""
+    eng = _get_engine()
+    if req.patient is not None:
+        x = pd.DataFrame([req.patient])
+    elif req.patient_id is not None:
+        x = patient_access.find_patient(eng, req.dataset_id, req.patient_id, _load_df)
+        if x is None:
+            raise HTTPException(status_code=404, detail="patient_id not found in dataset")
+    else:
+        x = _random_patient(req.dataset_id)
+
+    _ensure_analysis_tables(eng)
+    strategy, selected, thresholds = _resolve_strategy(eng, req.dataset_id, req.strategy_id)
+    return x, strategy, selected, thresholds
+
+
+@router.post("/adhoc/predict")
+async def adhoc_predict(req: AdhocPredictRequest) -> Dict[str, Any]:
+    x, strategy, selected, thresholds = await run_in_threadpool(_adhoc_inputs, req)
+    record = req.patient if req.patient is not None else x.iloc[0].to_dict()
+
+    # concurrent requests for the same model are scored together (services/micro_batcher.py)
+    outs = await asyncio.gather(*(batcher.submit(m, record) for m in selected))
+    preds: Dict[str, Any] = {
+        m: _single_result(kind, value, float(thresholds.get(m, 0.5)))
+        for m, (kind, value) in zip(selected, outs)
+    }
 
     pid = str(x.iloc[0].get("patient_id", "adhoc"))
     return {"patient_id": pid, "predictions": preds, "strategy_id": (strategy or {}).get("id")}
@@ -473,140 +425,676 @@ def adhoc_predict(req: AdhocPredictRequest) -> Dict[str, Any]:
 class AnalysisRunRequest(BaseModel):
     dataset_id: int
     strategy_id: Optional[int] = None
+    priority: int = 0       # higher runs first when jobs are queued
+    sharded: Optional[bool] = None  # None: shard above ANALYSIS_SHARD_MIN_ROWS when that is set
 
 
-@router.post("/run")
-def run_analysis(req: AnalysisRunRequest) -> Dict[str, Any]:
-    print(f"Running analysis for dataset {req.dataset_id} with strategy {req.strategy_id}")
-    df = _load_df(req.dataset_id)
-    if df.empty:
-        raise HTTPException(status_code=400, detail="Dataset has no rows")
+def _patient_ids(df: pd.DataFrame) -> List[str]:
+    if "patient_id" in df.columns:
+        return df["patient_id"].astype(str).tolist()
+    return [str(i) for i in range(len(df))]
 
-    eng = _get_engine()
-    _ensure_analysis_tables(eng)
 
-    strategy = None
-    if req.strategy_id:
-        with eng.begin() as con:
-            row = con.execute(
-                text("SELECT id, parsed FROM strategies WHERE id=:s AND dataset_id=:d"),
-                {"s": int(req.strategy_id), "d": int(req.dataset_id)}
-            ).mappings().first()
-            if row:
-                parsed = row["parsed"] if isinstance(row["parsed"], dict) else json.loads(row["parsed"])
-                strategy = {"id": int(row["id"]), "parsed": parsed}
-    if strategy is None:
-        strategy = _load_latest_strategy(eng, req.dataset_id)
+def _risk_rows(pids: List[str], selected: List[str], thresholds: Dict[str, float],
+               outputs: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Per-patient risk entries from per-model arrays covering pids."""
+    cols: Dict[str, Any] = {}
+    for m in selected:
+        out = outputs.get(m, {"kind": "error", "error": "missing"})
+        if out.get("kind") == "classification":
+            cols[m] = ("classification", out["scores"].tolist(), out["preds"].tolist(), float(thresholds.get(m, 0.5)))
+        elif out.get("kind") == "regression":
+            cols[m] = ("regression", out["values"].tolist())
+        else:
+            cols[m] = ("error", {"error": out.get("error", "prediction failure")})
+
+    rows: List[Dict[str, Any]] = []
+    for i, pid in enumerate(pids):
+        entry: Dict[str, Any] = {"patient_id": pid}
+        for m, col in cols.items():
+            if col[0] == "classification":
+                entry[m] = {"score": float(col[1][i]), "pred": int(col[2][i]), "threshold": col[3], "source": "model"}
+            elif col[0] == "regression":
+                entry[m] = {"prediction": float(col[1][i]), "source": "model"}
+            else:
+                entry[m] = dict(col[1])
+        rows.append(entry)
+    return rows
+
+
+class _RiskTally:
+    """Per-model counts for the risk summary, accumulated over one or many scoring chunks."""
+
+    def __init__(self, selected: List[str]):
+        self.selected = selected
+        self.positives = {m: 0 for m in selected}
+        self.sums = {m: 0.0 for m in selected}
+        self.kinds: Dict[str, str] = {}
+        self.errors: Dict[str, str] = {}
+        self.n = 0
+
+    def add(self, outputs: Dict[str, Dict[str, Any]], n: int) -> None:
+        self.n += n
+        for m in self.selected:
+            out = outputs.get(m, {})
+            kind = out.get("kind")
+            if kind == "classification":
+                self.positives[m] += int(np.sum(out["preds"]))
+            elif kind == "regression":
+                self.sums[m] += float(np.sum(out["values"]))
+            else:
+                self.errors.setdefault(m, out.get("error", "prediction failure"))
+            self.kinds.setdefault(m, kind)
+
+    def summary(self, dataset_id: int, strategy_id: Optional[int]) -> Dict[str, Any]:
+        counts: Dict[str, Any] = {}
+        for m in self.selected:
+            if m in self.errors:
+                counts[m] = {"error": self.errors[m]}
+            elif self.kinds.get(m) == "classification":
+                counts[m] = {"positives": self.positives[m], "total": int(self.n)}
+            else:
+                counts[m] = {"n": int(self.n), "mean_prediction": self.sums[m] / self.n if self.n else None}
+        return {"dataset_id": dataset_id, "strategy_id": strategy_id, "selected_models": self.selected, "counts": counts}
 
-    selected = []
-    thresholds = {}
-    if strategy and isinstance(strategy.get("parsed"), dict):
-        parsed = strategy["parsed"]
-        selected = list(parsed.get("selected_models", []))
-        thresholds = dict(parsed.get("thresholds", {}))
-    if not selected:
-        selected = ["MortalityRiskModel", "SepsisEarlyWarning", "LengthOfStayRegressor"]
 
-    ts = time.strftime("%Y%m%d_%H%M%S")
-    base_dir = f"artifacts/analysis/{req.dataset_id}/{ts}"
-    Path(base_dir).mkdir(parents=True, exist_ok=True)
+def _load_models(selected: List[str]) -> Dict[str, Any]:
+    """Each model once; a missing or broken artifact becomes that model's error, not the run's."""
+    models: Dict[str, Any] = {}
+    for m in selected:
+        try:
+            models[m] = _load_model_cached(m)
+        except Exception as e:
+            models[m] = e
+    return models
 
-    # -------- Vectorized scoring per model (FAST) --------
-    # Load each model once
-    models = {m: _load_model_cached(m) for m in selected}
 
-    # Score per model across the full dataframe
-    per_model_outputs: Dict[str, Dict[str, Any]] = {}
+def _score_chunk(selected: List[str], models: Dict[str, Any], X: pd.DataFrame,
+                 thresholds: Dict[str, float]) -> Dict[str, Dict[str, Any]]:
+    outputs: Dict[str, Dict[str, Any]] = {}
     for m in selected:
         th = float(thresholds.get(m, 0.5))
+        if isinstance(models[m], Exception):
+            outputs[m] = {"kind": "error", "error": str(models[m])}
+            continue
         try:
-            per_model_outputs[m] = _bulk_predict_one(m, models[m], df, th)
+            outputs[m] = _bulk_predict_one(m, models[m], X, th)
         except Exception as e:
-            per_model_outputs[m] = {"kind": "error", "error": str(e)}
+            outputs[m] = {"kind": "error", "error": str(e)}
+    return outputs
 
-    # Build per-patient rows from bulk arrays
-    risk_rows: List[Dict[str, Any]] = []
-    n = len(df)
-    for i in range(n):
-        entry = {"patient_id": str(df.iloc[i].get("patient_id", i))}
-        for m in selected:
-            out = per_model_outputs.get(m, {"kind": "error", "error": "missing"})
-            if out.get("kind") == "classification":
-                score = float(out["scores"][i])
-                pred = int(out["preds"][i])
-                entry[m] = {
-                    "score": score,
-                    "pred": pred,
-                    "threshold": float(thresholds.get(m, 0.5)),
-                    "source": "model",
-                }
-            elif out.get("kind") == "regression":
-                entry[m] = {"prediction": float(out["values"][i]), "source": "model"}
-            else:
-                entry[m] = {"error": out.get("error", "prediction failure")}
-        risk_rows.append(entry)
 
-    # Summary (handle classifiers & regressors)
-    risk_summary: Dict[str, Any] = {
-        "dataset_id": req.dataset_id,
-        "strategy_id": (strategy or {}).get("id"),
-        "selected_models": selected,
-        "counts": {},
-    }
-    for m in selected:
-        out = per_model_outputs.get(m, {})
-        if out.get("kind") == "classification":
-            positives = int(np.sum(out["preds"])) if "preds" in out else 0
-            risk_summary["counts"][m] = {"positives": positives, "total": int(n)}
-        elif out.get("kind") == "regression":
-            mean_pred = float(np.mean(out["values"])) if "values" in out else None
-            risk_summary["counts"][m] = {"n": int(n), "mean_prediction": mean_pred}
-        else:
-            risk_summary["counts"][m] = {"error": out.get("error", "prediction failure")}
+def _anomaly_detectors(strategy: Optional[Dict[str, Any]]):
+    """The strategy's `anomaly_detectors` (names, or name -> parameters), else the isolation forest alone."""
+    parsed = (strategy or {}).get("parsed")
+    requested = parsed.get("anomaly_detectors") if isinstance(parsed, dict) else None
+    return requested or anomaly_engine.DEFAULT_DETECTORS
 
-    risk_payload = {"summary": risk_summary, "patients": risk_rows}
-    risk_path = f"{base_dir}/risk_prediction.json"
-    _write_json(risk_path, risk_payload)
 
-    # -------- Anomaly JSON --------
-    num_cols = df.select_dtypes(include=[np.number]).columns.tolist()
+def _anomaly_results(df: pd.DataFrame, dataset_id: int, detectors=anomaly_engine.DEFAULT_DETECTORS):
+    # one imputed matrix for every detector; the isolation forest is persisted per dataset
+    res = anomaly_engine.run(df, detectors, dataset_id=dataset_id, explain_top=anomaly_engine.EXPLAIN_TOP,
+                             path_contributions=anomaly_engine.EXPLAIN_PATHS)
     ana_rows: List[Dict[str, Any]] = []
-    if num_cols:
-        X = df[num_cols].fillna(df[num_cols].median())
-        iso = IsolationForest(n_estimators=200, random_state=42, contamination="auto")
-        scores = iso.fit_predict(X)          # -1 anomaly, 1 normal
-        decision = iso.decision_function(X)  # higher = more normal
-        for i, (s, d) in enumerate(zip(scores, decision)):
-            ana_rows.append({
-                "patient_id": str(df.iloc[i].get("patient_id", i)),
-                "anomaly_flag": int(s == -1),
-                "anomaly_score": float(-d)
-            })
+    if res.detectors:
+        cols: Dict[str, List[Any]] = {
+            "patient_id": _patient_ids(df),
+            "anomaly_flag": res.any_flag().astype(int).tolist(),
+            "anomaly_score": res.scores[res.detectors[0]].tolist(),
+        }
+        if len(res.detectors) > 1:
+            for d in res.detectors:
+                cols[f"{d}_score"] = res.scores[d].tolist()
+        names = list(cols)
+        ana_rows = [dict(zip(names, vals)) for vals in zip(*cols.values())]
+        if res.explanations is not None:
+            for r, feats in zip(res.explanations.rows.tolist(), res.explanations.records(res.columns)):
+                ana_rows[r]["explanation"] = feats
     anomaly_summary = {
-        "dataset_id": req.dataset_id,
+        "dataset_id": dataset_id,
         "n_anomalies": int(sum(r["anomaly_flag"] for r in ana_rows)),
-        "total": int(len(ana_rows))
+        "total": int(len(ana_rows)),
+        "detector": res.info.get("isolation_forest"),
+        "detectors": res.summary(),
+        "explain_seconds": round(res.seconds.get("explain", 0.0), 4),
     }
-    anomaly_payload = {"summary": anomaly_summary, "patients": ana_rows}
-    anomaly_path = f"{base_dir}/anomaly_detection.json"
-    _write_json(anomaly_path, anomaly_payload)
+    return anomaly_summary, ana_rows
+
 
+def _record_analyses(dataset_id: int, strategy_id: Optional[int], risk_path: str, risk_summary: Dict[str, Any],
+                     anomaly_path: str, anomaly_summary: Dict[str, Any]) -> None:
     with _get_engine().begin() as con:
         con.execute(
             text("INSERT INTO analyses (dataset_id, strategy_id, kind, artifact_path, summary) "
                  "VALUES (:d,:s,'risk',:p,:sum)"),
-            {"d": int(req.dataset_id), "s": (strategy or {}).get("id"), "p": risk_path,
-             "sum": json.dumps(risk_summary)}
+            {"d": int(dataset_id), "s": strategy_id, "p": risk_path, "sum": json.dumps(risk_summary)}
         )
         con.execute(
             text("INSERT INTO analyses (dataset_id, strategy_id, kind, artifact_path, summary) "
                  "VALUES (:d,:s,'anomaly',:p,:sum)"),
-            {"d": int(req.dataset_id), "s": (strategy or {}).get("id"), "p": anomaly_path,
-             "sum": json.dumps(anomaly_summary)}
+            {"d": int(dataset_id), "s": strategy_id, "p": anomaly_path, "sum": json.dumps(anomaly_summary)}
         )
 
+
+def _prepare_run(req: AnalysisRunRequest):
+    print(f"Running analysis for dataset {req.dataset_id} with strategy {req.strategy_id}")
+    df = _load_df(req.dataset_id)
+    if df.empty:
+        raise HTTPException(status_code=400, detail="Dataset has no rows")
+
+    eng = _get_engine()
+    _ensure_analysis_tables(eng)
+    strategy, selected, thresholds = _resolve_strategy(eng, req.dataset_id, req.strategy_id)
+
+    ts = time.strftime("%Y%m%d_%H%M%S")
+    base_dir = f"artifacts/analysis/{req.dataset_id}/{ts}"
+    Path(base_dir).mkdir(parents=True, exist_ok=True)
+    return df, strategy, selected, thresholds, base_dir
+
+
+# Rows scored per step inside a job: large enough to stay vectorized, small enough
+# that progress moves and cancellation is noticed promptly.
+RUN_CHUNK_ROWS = int(os.environ.get("ANALYSIS_RUN_CHUNK_ROWS", "50000"))
+
+
+def _execute_run(req: AnalysisRunRequest, job: Optional[Job] = None) -> Dict[str, Any]:
+    """The full analysis: load, score, anomaly, write. Reports stage/progress to `job` when given."""
+    stage = job.set_stage if job is not None else (lambda *a, **k: None)
+    stage("load")
+    df, strategy, selected, thresholds, base_dir = _prepare_run(req)
+    strategy_id = (strategy or {}).get("id")
+    try:
+        # -------- Vectorized scoring per model, in large chunks --------
+        stage("score", 0.0)
+        models = _load_models(selected)
+        pids = _patient_ids(df)
+        tally = _RiskTally(selected)
+        scores = threshold_curve.ScoreCollector()
+        risk_rows: List[Dict[str, Any]] = []
+        n = len(df)
+        for start in range(0, n, RUN_CHUNK_ROWS):
+            stop = min(n, start + RUN_CHUNK_ROWS)
+            outputs = _score_chunk(selected, models, df.iloc[start:stop], thresholds)
+            tally.add(outputs, stop - start)
+            scores.add(outputs)
+            risk_rows.extend(_risk_rows(pids[start:stop], selected, thresholds, outputs))
+            stage("score", stop / n)
+        risk_summary = tally.summary(req.dataset_id, strategy_id)
+
+        # -------- Anomaly --------
+        stage("anomaly")
+        anomaly_summary, ana_rows = _anomaly_results(df, req.dataset_id, _anomaly_detectors(strategy))
+
+        # -------- Persist; past this point the run is no longer cancellable --------
+        stage("write")
+    except JobCancelled:
+        shutil.rmtree(base_dir, ignore_errors=True)
+        raise
+    risk_path = f"{base_dir}/risk_prediction.json"
+    _write_json(risk_path, {"summary": risk_summary, "patients": risk_rows})
+    anomaly_path = f"{base_dir}/anomaly_detection.json"
+    _write_json(anomaly_path, {"summary": anomaly_summary, "patients": ana_rows})
+    scores.save(base_dir, df)
+    risk_index.save(base_dir, risk_index.build(pids, scores.outputs(), thresholds, risk_summary))
+    _record_analyses(req.dataset_id, strategy_id, risk_path, risk_summary, anomaly_path, anomaly_summary)
+
     return {
         "risk_json": risk_path,
         "anomaly_json": anomaly_path,
         "summary": {"risk": risk_summary, "anomaly": anomaly_summary},
     }
+
+
+# Datasets at least this large are scored shard by shard in worker processes instead of
+# being loaded into one DataFrame. 0 (the default) leaves sharding to sharded=true: a
+# sharded run writes only scores.parquet, without the anomaly report, the risk JSON or
+# the top-K index.
+SHARD_MIN_ROWS = int(os.environ.get("ANALYSIS_SHARD_MIN_ROWS", "0"))
+
+
+def _use_sharding(req: AnalysisRunRequest) -> bool:
+    if req.sharded is not None:
+        return req.sharded
+    if SHARD_MIN_ROWS <= 0:
+        return False
+    try:
+        n = patient_access.row_count(_get_engine(), req.dataset_id)
+    except Exception as e:
+        # not in the database (file registry) or unreachable: the in-memory path loads it
+        print(f"Row count for dataset {req.dataset_id} unavailable, running unsharded: {e}")
+        return False
+    return n >= SHARD_MIN_ROWS
+
+
+def _execute_sharded_run(req: AnalysisRunRequest, job: Optional[Job] = None) -> Dict[str, Any]:
+    """
+    Risk scoring for very large datasets: id-range shards scored in a process pool and
+    merged into one Parquet file ordered by record id. Anomaly detection needs the whole
+    frame and is not part of this path.
+    """
+    stage = job.set_stage if job is not None else (lambda *a, **k: None)
+    stage("plan")
+    eng = _get_engine()
+    _ensure_analysis_tables(eng)
+    strategy, selected, thresholds = _resolve_strategy(eng, req.dataset_id, req.strategy_id)
+    strategy_id = (strategy or {}).get("id")
+    shards = sharded_scoring.plan_postgres(eng, req.dataset_id)
+    if not shards:
+        raise HTTPException(status_code=400, detail="Dataset has no rows")
+
+    base_dir = f"artifacts/analysis/{req.dataset_id}/{time.strftime('%Y%m%d_%H%M%S')}"
+    Path(base_dir).mkdir(parents=True, exist_ok=True)
+    try:
+        stage("score", 0.0)
+        result = sharded_scoring.run_sharded(shards, selected, thresholds, base_dir,
+                                             progress=lambda f: stage("score", f))
+        stage("write")
+    except JobCancelled:
+        shutil.rmtree(base_dir, ignore_errors=True)
+        raise
+    risk_summary = {
+        "dataset_id": req.dataset_id,
+        "strategy_id": strategy_id,
+        "models": selected,
+        "counts": result["counts"],
+        "total": result["rows"],
+        "shards": result["shards"],
+        "workers": result["workers"],
+        "seconds": result["seconds"],
+    }
+    with eng.begin() as con:
+        con.execute(
+            text("INSERT INTO analyses (dataset_id, strategy_id, kind, artifact_path, summary) "
+                 "VALUES (:d,:s,'risk_sharded',:p,:sum)"),
+            {"d": int(req.dataset_id), "s": strategy_id, "p": result["scores_parquet"], "sum": json.dumps(risk_summary)}
+        )
+    return {"risk_parquet": result["scores_parquet"], "summary": {"risk": risk_summary}}
+
+
+def _execute_any(req: AnalysisRunRequest, job: Job) -> Dict[str, Any]:
+    job.set_stage("plan")
+    if _use_sharding(req):
+        return _execute_sharded_run(req, job)
+    return _execute_run(req, job)
+
+
+@router.post("/run")
+async def run_analysis(req: AnalysisRunRequest, wait: bool = Query(False, description="Block until the job finishes and return its result")) -> Dict[str, Any]:
+    """
+    Queue an analysis run and return its job id (poll GET /analytics/jobs/{job_id}).
+    An identical run (same dataset and strategy) that is still queued or running is
+    reused instead of starting another one. A run with sharded=true (or, when it is set,
+    on a dataset of ANALYSIS_SHARD_MIN_ROWS rows or more) is scored in shards and produces
+    a Parquet file of scores only.
+    """
+    job, coalesced = analysis_jobs.submit(
+        lambda j: _execute_any(req, j),
+        key=("run", req.dataset_id, req.strategy_id, req.sharded),
+        priority=req.priority,
+        params={"dataset_id": req.dataset_id, "strategy_id": req.strategy_id},
+    )
+    if wait:
+        await run_in_threadpool(job.wait)
+        if job.status == SUCCEEDED:
+            return job.result
+        if isinstance(job.exception, HTTPException):
+            raise job.exception
+        raise HTTPException(status_code=409 if job.status == CANCELLED else 500,
+                            detail=job.error or f"analysis job {job.status}")
+    return {"job_id": job.id, "status": job.status, "coalesced": coalesced}
+
+
+@router.get("/jobs")
+def list_jobs() -> Dict[str, Any]:
+    return {"jobs": analysis_jobs.list(), **analysis_jobs.stats()}
+
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str) -> Dict[str, Any]:
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job.as_dict()
+
+
+@router.delete("/jobs/{job_id}")
+def cancel_job(job_id: str) -> Dict[str, Any]:
+    job = analysis_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    out = job.as_dict()
+    out["cancel_requested"] = job.cancel_requested
+    return out
+
+
+# ---------------- Threshold tuning ----------------
+
+def _latest_run_file(dataset_id: int, strategy_id: Optional[int], name: str) -> Optional[str]:
+    """
+    `name` (a file written next to the risk JSON) from the newest risk analysis that has
+    it, optionally for one strategy. Sharded runs count as having scores.npz: their
+    merged scores.parquet holds the same scores.
+    """
+    q = ("SELECT kind, artifact_path FROM analyses WHERE dataset_id=:d AND kind IN ('risk','risk_sharded')"
+         + (" AND strategy_id=:s" if strategy_id is not None else "") + " ORDER BY id DESC LIMIT 20")
+    eng = _get_engine()
+    _ensure_analysis_tables(eng)
+    with eng.begin() as con:
+        rows = con.execute(text(q), {"d": int(dataset_id), "s": strategy_id}).mappings().all()
+    for r in rows:
+        path = str(r["artifact_path"] or "")
+        if r["kind"] == "risk":
+            path = os.path.join(os.path.dirname(path), name)
+        elif name != threshold_curve.SCORES_FILE:
+            continue
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+@router.get("/{dataset_id}/threshold-curve")
+def get_threshold_curve(
+    dataset_id: int,
+    model: str = Query(..., description="Classifier name, e.g. MortalityRiskModel"),
+    strategy_id: Optional[int] = Query(None, description="Use the latest run of this strategy"),
+    at: Optional[List[float]] = Query(None, description="Evaluate only these thresholds (repeatable)"),
+    max_points: int = Query(1000, ge=2, le=100_000),
+) -> Dict[str, Any]:
+    """
+    Alerts, alert rate and, when the dataset holds the model's outcome column,
+    precision / recall / F1 per threshold, from the scores of the latest analysis run.
+    Nothing is re-scored: the scores are sorted once and cached.
+    """
+    path = _latest_run_file(dataset_id, strategy_id, threshold_curve.SCORES_FILE)
+    if path is None:
+        raise HTTPException(status_code=404, detail="No stored scores for this dataset; run /analytics/run first")
+    try:
+        curve = threshold_curve.threshold_curve(path, model, at=at, max_points=max_points)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No classification scores for {model} in the latest run")
+    return {"dataset_id": dataset_id, "scores_path": path, **curve}
+
+
+@router.get("/{dataset_id}/high-risk")
+def get_high_risk(
+    dataset_id: int,
+    score_cutoff: float = Query(0.8, ge=0.0, le=1.0),
+    min_positive_models: int = Query(2, ge=1),
+    top_n: int = Query(20, ge=1),
+    model: Optional[str] = Query(None, description="Rank by this classifier's score only"),
+    strategy_id: Optional[int] = Query(None),
+) -> Dict[str, Any]:
+    """
+    Highest-risk patients of the latest run from its top-K index: by positive-model count
+    and mean score (patients meeting min_positive_models or score_cutoff), or by one model.
+    """
+    path = _latest_run_file(dataset_id, strategy_id, risk_index.INDEX_FILE)
+    if path is None:
+        raise HTTPException(status_code=404, detail="No top-K index for this dataset; run /analytics/run first")
+    with open(path, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    try:
+        if model:
+            patients = risk_index.top_for_model(index, model, score_cutoff, top_n)
+        else:
+            patients = risk_index.high_risk(index, score_cutoff, min_positive_models, top_n)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No classification scores for {model} in the latest run")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"dataset_id": dataset_id, "index_path": path, "k": index["k"], "n": index["n"], "patients": patients}
+
+
+# ---------------- Streaming analysis run ----------------
+
+# First chunk is small so the first patients arrive quickly; later chunks grow for throughput.
+STREAM_FIRST_CHUNK = int(os.environ.get("ANALYSIS_STREAM_FIRST_CHUNK", "256"))
+STREAM_MAX_CHUNK = int(os.environ.get("ANALYSIS_STREAM_MAX_CHUNK", "8192"))
+
+
+class _JsonArtifactWriter:
+    """
+    Writes {"patients": [...], "summary": {...}} incrementally to a temp file and renames
+    it into place on close, so readers never see a partial artifact.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp = f"{path}.part"
+        self.f = open(self.tmp, "wb")
+        self.f.write(b'{"patients": [')
+        self.first = True
+
+    def rows(self, rows: List[Dict[str, Any]]) -> None:
+        for r in rows:
+            self.f.write((b"\n" if self.first else b",\n") + dumps(r))
+            self.first = False
+
+    def close(self, summary: Dict[str, Any]) -> None:
+        self.f.write(b'\n], "summary": ' + dumps(summary) + b"}\n")
+        self.f.close()
+        os.replace(self.tmp, self.path)
+
+    def abort(self) -> None:
+        self.f.close()
+        try:
+            os.remove(self.tmp)
+        except OSError:
+            pass
+
+
+def _ndjson(event: Dict[str, Any]) -> bytes:
+    return ndjson_line(event)
+
+
+def _stream_run(req: AnalysisRunRequest, df: pd.DataFrame, strategy, selected: List[str],
+                thresholds: Dict[str, float], base_dir: str, job: Optional[Job] = None) -> Iterator[bytes]:
+    stage = job.set_stage if job is not None else (lambda *a, **k: None)
+    strategy_id = (strategy or {}).get("id")
+    risk_path = f"{base_dir}/risk_prediction.json"
+    anomaly_path = f"{base_dir}/anomaly_detection.json"
+    n = len(df)
+    yield _ndjson({"event": "start", "dataset_id": req.dataset_id, "strategy_id": strategy_id,
+                   "selected_models": selected, "total": n, "risk_json": risk_path, "anomaly_json": anomaly_path})
+
+    writer = _JsonArtifactWriter(risk_path)
+    try:
+        models = _load_models(selected)
+        pids = _patient_ids(df)
+        tally = _RiskTally(selected)
+        scores = threshold_curve.ScoreCollector()
+        start, size = 0, max(1, STREAM_FIRST_CHUNK)
+        while start < n:
+            stage("score", start / n)
+            stop = min(n, start + size)
+            outputs = _score_chunk(selected, models, df.iloc[start:stop], thresholds)
+            tally.add(outputs, stop - start)
+            scores.add(outputs)
+            rows = _risk_rows(pids[start:stop], selected, thresholds, outputs)
+            writer.rows(rows)
+            yield _ndjson({"event": "risk", "offset": start, "patients": rows})
+            start, size = stop, min(STREAM_MAX_CHUNK, size * 4)
+        risk_summary = tally.summary(req.dataset_id, strategy_id)
+        writer.close(risk_summary)
+        scores.save(base_dir, df)
+        risk_index.save(base_dir, risk_index.build(pids, scores.outputs(), thresholds, risk_summary))
+    except JobCancelled:
+        writer.abort()
+        raise
+    except Exception as e:
+        writer.abort()
+        yield _ndjson({"event": "error", "stage": "risk", "detail": f"{e.__class__.__name__}: {e}"})
+        raise
+    yield _ndjson({"event": "risk_summary", "summary": risk_summary})
+
+    try:
+        stage("anomaly")
+        anomaly_summary, ana_rows = _anomaly_results(df, req.dataset_id, _anomaly_detectors(strategy))
+        _write_json(anomaly_path, {"summary": anomaly_summary, "patients": ana_rows})
+        for k in range(0, len(ana_rows), STREAM_MAX_CHUNK):
+            yield _ndjson({"event": "anomaly", "offset": k, "patients": ana_rows[k:k + STREAM_MAX_CHUNK]})
+        _record_analyses(req.dataset_id, strategy_id, risk_path, risk_summary, anomaly_path, anomaly_summary)
+    except JobCancelled:
+        raise
+    except Exception as e:
+        yield _ndjson({"event": "error", "stage": "anomaly", "detail": f"{e.__class__.__name__}: {e}"})
+        raise
+    yield _ndjson({"event": "done", "risk_json": risk_path, "anomaly_json": anomaly_path,
+                   "summary": {"risk": risk_summary, "anomaly": anomaly_summary}})
+
+
+# Event logs of live streaming jobs by job id, so an identical request can join a live stream.
+# A log is dropped when its job stops producing, or when its last follower leaves a job that never ran.
+STREAM_SPOOL_DIR = os.environ.get("ANALYSIS_STREAM_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "analysis_streams"))
+_STREAM_LOCK = threading.Lock()
+_STREAM_LOGS: Dict[str, "_EventLog"] = {}
+
+
+class _EventLog:
+    """
+    NDJSON lines of one streaming job, spooled to a file rather than kept in memory.
+    Every follower tails the file with its own handle from the first line, so a follower
+    still reading keeps its copy after the log is dropped and the file unlinked.
+    """
+
+    def __init__(self, job_id: str):
+        Path(STREAM_SPOOL_DIR).mkdir(parents=True, exist_ok=True)
+        self.path = os.path.join(STREAM_SPOOL_DIR, f"{job_id}.ndjson")
+        self._f = open(self.path, "wb")
+        self._size = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self.followers = 0      # guarded by _STREAM_LOCK
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def append(self, line: bytes) -> None:
+        with self._cond:
+            self._f.write(line)
+            self._f.flush()
+            self._size += len(line)
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        with self._cond:
+            if not self._closed:
+                self._closed = True
+                self._f.close()
+            self._cond.notify_all()
+
+    def discard(self) -> None:
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def follow(self, job: Job, reader, first: bytes) -> Iterator[bytes]:
+        """first, every line so far, then new ones as they arrive, until the log closes."""
+        pos = 0
+        try:
+            yield first
+            while True:
+                with self._cond:
+                    if pos == self._size and not self._closed:
+                        self._cond.wait(1.0)
+                    final = job.status in FINAL          # read first: a job that ran is closed before it is final
+                    size, closed = self._size, self._closed
+                while pos < size:
+                    line = reader.readline()
+                    pos += len(line)
+                    yield line
+                if closed:
+                    return
+                if final:
+                    # cancelled while still queued: the job never ran
+                    yield _ndjson({"event": "error", "stage": job.status, "detail": job.error or f"analysis job {job.status}"})
+                    return
+        finally:
+            reader.close()
+            _leave_stream(job, self)
+
+
+def _drop_stream(job_id: str, log: _EventLog) -> None:
+    """Caller holds _STREAM_LOCK."""
+    if _STREAM_LOGS.get(job_id) is log:
+        del _STREAM_LOGS[job_id]
+    log.discard()
+
+
+def _leave_stream(job: Job, log: _EventLog) -> None:
+    with _STREAM_LOCK:
+        log.followers -= 1
+        if log.followers > 0:
+            return
+        if not log.closed and job.status not in FINAL:
+            # nobody is reading any more
+            analysis_jobs.cancel(job.id)
+        if job.status in FINAL:
+            _drop_stream(job.id, log)
+
+
+def _execute_stream(req: AnalysisRunRequest, job: Job) -> Dict[str, Any]:
+    with _STREAM_LOCK:
+        log = _STREAM_LOGS[job.id]
+    base_dir = None
+    streaming = False
+    try:
+        job.set_stage("load")
+        df, strategy, selected, thresholds, base_dir = _prepare_run(req)
+        streaming = True
+        for line in _stream_run(req, df, strategy, selected, thresholds, base_dir, job):
+            log.append(line)
+        return {"base_dir": base_dir}
+    except JobCancelled:
+        if base_dir is not None:
+            shutil.rmtree(base_dir, ignore_errors=True)
+        log.append(_ndjson({"event": "error", "stage": "cancelled", "detail": "analysis job cancelled"}))
+        raise
+    except Exception as e:
+        if base_dir is not None:
+            shutil.rmtree(base_dir, ignore_errors=True)
+        if not streaming:
+            # a stage that fails while streaming has already logged its own error line
+            detail = getattr(e, "detail", None) or f"{e.__class__.__name__}: {e}"
+            log.append(_ndjson({"event": "error", "stage": "load", "detail": detail}))
+        raise
+    finally:
+        with _STREAM_LOCK:
+            _drop_stream(job.id, log)
+
+
+@router.post("/run/stream")
+def run_analysis_stream(req: AnalysisRunRequest) -> StreamingResponse:
+    """
+    Same analysis as /run, streamed as NDJSON events while it is computed and persisted:
+    queued (job id), start, risk (one per scoring chunk), risk_summary, anomaly, done (the
+    /run response). The run is an analysis job, so it waits for a worker, honours priority
+    and can be cancelled with DELETE /analytics/jobs/{job_id}; it is also cancelled when
+    every client reading it has disconnected. An identical stream that is still live is
+    joined and replayed from its first event. A failure arrives as an {"event": "error"} line.
+    Sharded runs are not streamed: a run /run would shard is rejected with 400.
+    """
+    if _use_sharding(req):
+        raise HTTPException(status_code=400, detail="Sharded runs are not streamed; use POST /analytics/run")
+    while True:
+        with _STREAM_LOCK:
+            job, coalesced = analysis_jobs.submit(
+                lambda j: _execute_stream(req, j),
+                key=("stream", req.dataset_id, req.strategy_id),
+                priority=req.priority,
+                params={"dataset_id": req.dataset_id, "strategy_id": req.strategy_id, "stream": True},
+            )
+            log = _STREAM_LOGS.get(job.id)
+            if log is None and not coalesced:
+                log = _STREAM_LOGS[job.id] = _EventLog(job.id)
+            if log is not None:
+                log.followers += 1
+                reader = open(log.path, "rb")
+                break
+        # joined a job whose stream has just ended: it is final in a moment
+        job.wait(1.0)
+    queued = _ndjson({"event": "queued", "job_id": job.id, "coalesced": coalesced})
+    return StreamingResponse(log.follow(job, reader, queued), media_type="application/x-ndjson")
@@ -1,7 +1,7 @@
 # backend/api/routes/artifacts.py
 from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import JSONResponse
-import json, os
+from fastapi.responses import FileResponse
+import os
 
 router = APIRouter(prefix="/artifacts", tags=["artifacts"])
 
@@ -10,6 +10,5 @@ def get_artifact(path: str = Query(..., description="Path returned by /analytics
     path = path.lstrip("/\\")
     if not os.path.exists(path):
         raise HTTPException(404, f"file not found: {path}")
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    return JSONResponse(data)
+    # sent as-is in chunks; parsing and re-serializing large risk files held them in memory twice
+    return FileResponse(path, media_type="application/json")
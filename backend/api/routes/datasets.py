@@ -9,7 +9,9 @@ import pandas as pd
 
 # file registry compatibility
 from ..services.datasets_service import registry, load_dataframe, ensure_data_dir
-from ..services.analysis_service import dataframe_overview, head_sample
+from ..services.analysis_service import dataframe_overview, head_sample, cached_overview, put_overview
+from ..services import anomaly_engine, column_catalog, model_cache, patient_access, pushdown_summary
+from ...utils.fast_json import FastJSONResponse
 
 # DB plumbing
 import os as _os
@@ -124,6 +126,8 @@ CREATE TABLE IF NOT EXISTS patient_records (
 
 CREATE INDEX IF NOT EXISTS idx_pr_dataset ON patient_records(dataset_id);
 CREATE INDEX IF NOT EXISTS idx_pr_patient ON patient_records(patient_id);
+CREATE INDEX IF NOT EXISTS idx_pr_dataset_id ON patient_records(dataset_id, id);
+CREATE INDEX IF NOT EXISTS idx_pr_dataset_patient ON patient_records(dataset_id, patient_id);
 """
 
 def _ensure_tables(engine: Engine) -> None:
@@ -139,23 +143,23 @@ def _register_dataset(engine: Engine, name: str, n_rows: int, n_cols: int) -> in
         dsid = con.execute(q, {"name": name, "r": int(n_rows), "c": int(n_cols)}).scalar_one()
     return int(dsid)
 
-def _insert_records(engine: Engine, dataset_id: int, df: pd.DataFrame) -> int:
-    """
-    Robust bulk insert using psycopg2.extras.execute_values (handles JSONB cleanly).
-    Falls back to pandas.to_sql if psycopg2 is not available.
-    """
-    modeled_cols = {
-        "patient_id","age","sex","bmi","systolic_bp","diastolic_bp","heart_rate",
-        "respiratory_rate","temperature","spo2","glucose","hba1c","creatinine","egfr",
-        "sodium","potassium","wbc","hemoglobin","platelet","smoking_status",
-        "diabetes_history","hypertension_history","heart_failure_history",
-        "copd_history","stroke_history","medications","encounter_date"
-    }
-
+MODELED_COLS = [
+    "patient_id","age","sex","bmi","systolic_bp","diastolic_bp","heart_rate",
+    "respiratory_rate","temperature","spo2","glucose","hba1c","creatinine","egfr",
+    "sodium","potassium","wbc","hemoglobin","platelet","smoking_status",
+    "diabetes_history","hypertension_history","heart_failure_history",
+    "copd_history","stroke_history","medications","encounter_date"
+]
+BOOL_COLS = ["diabetes_history","hypertension_history","heart_failure_history","copd_history","stroke_history"]
+TEXT_COLS = ["patient_id","sex","smoking_status","medications"]
+STORED_COLS = ["dataset_id"] + MODELED_COLS      # patient_records columns the upload sets, payload aside
+
+def _record_frame(dataset_id: int, df: pd.DataFrame) -> pd.DataFrame:
+    """The upload normalized for patient_records: modeled columns added, booleans and dates coerced."""
     df = df.copy()
 
     # normalize booleans
-    for bcol in ["diabetes_history","hypertension_history","heart_failure_history","copd_history","stroke_history"]:
+    for bcol in BOOL_COLS:
         if bcol in df.columns:
             df[bcol] = df[bcol].map(lambda v: bool(v) if pd.notna(v) else None)
 
@@ -164,19 +168,42 @@ def _insert_records(engine: Engine, dataset_id: int, df: pd.DataFrame) -> int:
         df["encounter_date"] = pd.to_datetime(df["encounter_date"], errors="coerce").dt.date
 
     # add missing modeled cols
-    for c in modeled_cols:
+    for c in MODELED_COLS:
         if c not in df.columns:
             df[c] = None
 
     df["dataset_id"] = dataset_id
+    return df
+
+def _stored_rows(rec: pd.DataFrame) -> pd.DataFrame:
+    """
+    The rows of _record_frame() as SELECT * (minus id and payload) reads them back: the
+    table's columns, with the dtypes pandas gives each column type.
+    """
+    out = rec[STORED_COLS].copy()
+    for c in MODELED_COLS:
+        s = out[c]
+        if s.isna().all():
+            out[c] = pd.Series([None] * len(s), index=s.index, dtype=object)
+        elif c in TEXT_COLS:
+            out[c] = s.map(lambda v: None if pd.isna(v) else str(v)).astype(object)
+        elif c in BOOL_COLS:
+            out[c] = s.astype(bool) if s.notna().all() else s.astype(object)
+        elif c == "age":
+            v = pd.to_numeric(s, errors="coerce").round()
+            out[c] = v.astype("int64") if v.notna().all() else v.astype("float64")
+        elif c != "encounter_date":
+            out[c] = pd.to_numeric(s, errors="coerce").astype("float64")
+    return out
 
-    ordered = [
-        "dataset_id","patient_id","age","sex","bmi","systolic_bp","diastolic_bp",
-        "heart_rate","respiratory_rate","temperature","spo2","glucose","hba1c",
-        "creatinine","egfr","sodium","potassium","wbc","hemoglobin","platelet",
-        "smoking_status","diabetes_history","hypertension_history","heart_failure_history",
-        "copd_history","stroke_history","medications","encounter_date","payload"
-    ]
+def _insert_records(engine: Engine, dataset_id: int, df: pd.DataFrame) -> int:
+    """
+    Robust bulk insert using psycopg2.extras.execute_values (handles JSONB cleanly).
+    Falls back to pandas.to_sql if psycopg2 is not available. `df` comes from _record_frame().
+    """
+    modeled_cols = set(MODELED_COLS)
+    df = df.copy()
+    ordered = STORED_COLS + ["payload"]
 
     # build payload = extra columns (drop NaN)
     payloads = []
@@ -278,17 +305,15 @@ def _run_predictions_for_strategy(engine: Engine, dataset_id: int, parsed: Dict[
     X = _features_from_records(df_all)
 
     risk_results: Dict[str, Any] = {"models": {}, "patients": []}
-    anomaly_results: Dict[str, Any] = {"method": "zscore+iqr", "patients": []}
-
-    from joblib import load as _load
+    models: Dict[str, Any] = {}
     for m in selected:
-        model_path = os.path.join("artifacts", "models", f"{m}.joblib")
-        if not os.path.exists(model_path):
+        try:
+            model = models[m] = model_cache.get_model(m)
+        except FileNotFoundError:
             risk_results["models"][m] = {"error": "model artifact not found"}
             continue
 
         try:
-            model = _load(model_path)
             if m in CLASSIFICATION_MODELS and hasattr(model, "predict_proba"):
                 prob = model.predict_proba(X)[:, 1]
                 thr = float(thresholds.get(m, 0.5))
@@ -311,11 +336,10 @@ def _run_predictions_for_strategy(engine: Engine, dataset_id: int, parsed: Dict[
     for i in range(len(X)):
         entry = {"patient_id": None if pd.isna(patient_ids.iloc[i]) else str(patient_ids.iloc[i]), "predictions": {}}
         for m in selected:
-            model_path = os.path.join("artifacts", "models", f"{m}.joblib")
-            if not os.path.exists(model_path):
+            model = models.get(m)
+            if model is None:
                 continue
             try:
-                model = _load(model_path)
                 if m in CLASSIFICATION_MODELS and hasattr(model, "predict_proba"):
                     score = float(model.predict_proba(X.iloc[[i]])[:, 1][0])
                     thr = float(thresholds.get(m, 0.5))
@@ -329,40 +353,7 @@ def _run_predictions_for_strategy(engine: Engine, dataset_id: int, parsed: Dict[
     risk_results["patients"] = per_patient
 
     # anomaly detector
-    num_cols = X.select_dtypes(include=["number"]).columns.tolist()
-    if num_cols:
-        z = (X[num_cols] - X[num_cols].mean()) / (X[num_cols].std(ddof=0) + 1e-9)
-        z_abs = z.abs()
-        z_flag = (z_abs > 3).any(axis=1)
-
-        try:
-            q1 = X[num_cols].quantile(0.25)
-            q3 = X[num_cols].quantile(0.75)
-            iqr = (q3 - q1)
-            low = q1 - 1.5 * iqr
-            high = q3 + 1.5 * iqr
-            iqr_flag = ((X[num_cols] < low) | (X[num_cols] > high)).any(axis=1)
-            flagged = (z_flag | iqr_flag)
-            method_components = ["zscore>3", "iqr_1.5"]
-        except Exception:
-            flagged = z_flag
-            method_components = ["zscore>3"]
-
-        anomaly_results["summary"] = {
-            "n_flagged": int(flagged.sum()),
-            "n_total": int(len(flagged)),
-            "method_components": method_components
-        }
-        anomaly_patients: List[Dict[str, Any]] = []
-        for i, is_anom in enumerate(flagged.tolist()):
-            if is_anom:
-                anomaly_patients.append({
-                    "patient_id": None if pd.isna(patient_ids.iloc[i]) else str(patient_ids.iloc[i]),
-                    "zscore_any_gt3": bool(z_flag.iloc[i]),
-                })
-        anomaly_results["patients"] = anomaly_patients
-    else:
-        anomaly_results["summary"] = {"n_flagged": 0, "n_total": int(len(X)), "note": "no numeric columns"}
+    anomaly_results = anomaly_engine.zscore_iqr_report(X, patient_ids)
 
     # exports
     exports_dir = os.path.join("artifacts", "exports", f"dataset_{dataset_id}")
@@ -462,9 +453,16 @@ async def upload_dataset(
         eng = _get_engine()
         _ensure_tables(eng)
         dataset_id = _register_dataset(eng, safe_name, n_rows, n_cols)
-        inserted = _insert_records(eng, dataset_id, df)
+        rec = _record_frame(dataset_id, df)
+        inserted = _insert_records(eng, dataset_id, rec)
         if inserted == 0:
             raise HTTPException(status_code=500, detail="No rows were inserted into patient_records")
+        try:
+            # the catalog describes the stored rows, as the summary queries read them
+            column_catalog.record(eng, dataset_id, _stored_rows(rec))
+            _warm_summary(eng, dataset_id)
+        except Exception as e:
+            print(f"Column catalog for dataset {dataset_id} not recorded: {e}")
 
     except Exception as e:
         # If DB fails, tell the UI clearly and stop (to avoid phantom IDs)
@@ -572,34 +570,62 @@ def _count_rows(engine: Engine, dataset_id: int) -> int:
         n = con.execute(text("SELECT COUNT(*) FROM patient_records WHERE dataset_id=:d"), {"d": int(dataset_id)}).scalar_one()
     return int(n)
 
+def _summary_payload(df: pd.DataFrame) -> Dict[str, Any]:
+    meta, numeric, categorical = dataframe_overview(df)
+    sample = head_sample(df, limit=10)
+    return {"meta": meta, "numeric": numeric, "categorical": categorical, "sample": sample}
+
+def _db_summary_frame(eng: Engine, dataset_id: int) -> pd.DataFrame:
+    with eng.begin() as con:
+        df = pd.read_sql(
+            text("SELECT * FROM patient_records WHERE dataset_id=:d"),
+            con, params={"d": int(dataset_id)}
+        )
+    # drop internal / non-scalar columns for overview
+    if "id" in df.columns:
+        df = df.drop(columns=["id"])
+    return _only_scalar_columns(df)
+
+def _db_summary(eng: Engine, dataset_id: int) -> Dict[str, Any]:
+    # the column catalog written at ingest; otherwise one aggregate query in Postgres,
+    # and the pandas overview only for other databases
+    cat = column_catalog.load(eng, dataset_id)
+    if cat is not None:
+        return cat.summary()
+    if pushdown_summary.supported(eng):
+        out = pushdown_summary.summary(eng, dataset_id)
+        if out is not None:
+            return out
+    return _summary_payload(_db_summary_frame(eng, dataset_id))
+
+def _warm_summary(eng: Engine, dataset_id: int) -> None:
+    """Build the summary right after ingest so the first page load is served from memory."""
+    version = patient_access.id_range(eng, dataset_id)
+    if version is not None:
+        put_overview(("db", int(dataset_id)), version, _db_summary(eng, dataset_id))
+
 @router.get("/{dataset_id}/summary")
 def dataset_summary(dataset_id: str) -> Dict[str, Any]:
-    df: Optional[pd.DataFrame] = None
+    # DB datasets are versioned by their id range, file datasets by size + mtime
     try:
         eng = _get_engine()
         _ensure_tables(eng)
-        with eng.begin() as con:
-            df = pd.read_sql(
-                text("SELECT * FROM patient_records WHERE dataset_id=:d"),
-                con, params={"d": int(dataset_id)}
-            )
-        # drop internal / non-scalar columns for overview
-        if "id" in df.columns:
-            df = df.drop(columns=["id"])
-        df = _only_scalar_columns(df)
+        version = patient_access.id_range(eng, int(dataset_id))
+        if version is not None:
+            return FastJSONResponse(cached_overview(("db", int(dataset_id)), version,
+                                                    lambda: _db_summary(eng, int(dataset_id))))
     except Exception:
         pass
 
-    if df is None or df.empty:
-        ds = registry.get(dataset_id)
-        if not ds:
-            raise HTTPException(status_code=404, detail="Dataset not found")
-        df = load_dataframe(registry.path_for(dataset_id))
-        df = _only_scalar_columns(df)
-
-    meta, numeric, categorical = dataframe_overview(df)
-    sample = head_sample(df, limit=10)
-    return {"meta": meta, "numeric": numeric, "categorical": categorical, "sample": sample}
+    ds = registry.get(dataset_id)
+    if not ds:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    path = registry.path_for(dataset_id)
+    st = os.stat(path)
+    return FastJSONResponse(cached_overview(
+        ("file", str(dataset_id)), (st.st_size, st.st_mtime_ns),
+        lambda: column_catalog.for_file(str(dataset_id), path,
+                                        lambda p: _only_scalar_columns(load_dataframe(p))).summary()))
 
 @router.get("/{dataset_id}/sample")
 def dataset_sample(dataset_id: str, limit: int = 50) -> Dict[str, Any]:
@@ -620,7 +646,7 @@ def dataset_sample(dataset_id: str, limit: int = 50) -> Dict[str, Any]:
                 continue
             if df[c].map(lambda v: isinstance(v, (dict, list, set))).any():
                 df[c] = df[c].map(lambda v: json.dumps(v, default=str))
-        return {"rows": df.to_dict(orient="records")}
+        return FastJSONResponse({"rows": df.to_dict(orient="records")})
     except Exception:
         pass
 
@@ -629,7 +655,7 @@ def dataset_sample(dataset_id: str, limit: int = 50) -> Dict[str, Any]:
         raise HTTPException(status_code=404, detail="Dataset not found")
     df = load_dataframe(registry.path_for(dataset_id))
     df = _only_scalar_columns(df)
-    return {"rows": head_sample(df, limit=limit)}
+    return FastJSONResponse({"rows": head_sample(df, limit=limit)})
 @router.post("/{dataset_id}/backfill")
 def backfill_patient_records(dataset_id: str) -> Dict[str, Any]:
     df = _load_registry_df(dataset_id)
@@ -638,7 +664,14 @@ def backfill_patient_records(dataset_id: str) -> Dict[str, Any]:
     try:
         eng = _get_engine()
         _ensure_tables(eng)
-        inserted = _insert_records(eng, int(dataset_id), df)
+        previous = patient_access.id_range(eng, int(dataset_id))
+        rec = _record_frame(int(dataset_id), df)
+        inserted = _insert_records(eng, int(dataset_id), rec)
+        try:
+            # fold the appended rows into the column catalog
+            column_catalog.record(eng, int(dataset_id), _stored_rows(rec), previous)
+        except Exception as e:
+            print(f"Column catalog for dataset {dataset_id} not updated: {e}")
         return {"dataset_id": int(dataset_id), "inserted": int(inserted)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Backfill failed: {e}")
@@ -1,9 +1,9 @@
 from __future__ import annotations
 from typing import Dict, Any, List
 from fastapi import APIRouter, HTTPException, Query
-import pandas as pd
 import numpy as np
 from ..services.datasets_service import registry, load_dataframe
+from ...utils.fast_json import FastJSONResponse
 
 router = APIRouter(prefix="/patients", tags=["patients"])
 
@@ -39,4 +39,4 @@ def search_patients(
         ser = df[c].astype(str).str.lower()
         mask = (mask | ser.str.contains(q_lower, na=False))
     sub = df.loc[mask].head(limit)
-    return {"columns": list(sub.columns), "rows": sub.astype(object).where(pd.notna(sub), None).values.tolist()}
\ No newline at end of file
+    return FastJSONResponse({"columns": list(sub.columns), "rows": sub.to_numpy(dtype=object).tolist()})
\ No newline at end of file
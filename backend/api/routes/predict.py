@@ -0,0 +1,224 @@
+# backend/api/routes/predict.py
+from __future__ import annotations
+
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+import io
+import json
+
+import anyio
+import numpy as np
+import pandas as pd
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from ..services import model_cache, prediction_service
+from ...utils.fast_json import ndjson_line
+
+router = APIRouter(prefix="/predict", tags=["predict"])
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+NDJSON = "application/x-ndjson"
+
+
+# ---------------- request body -> DataFrame chunks ----------------
+class _BodyFile(io.RawIOBase):
+    """
+    Blocking file object over the ASGI body stream, for parsers that want a file.
+    Only usable from a threadpool worker (it hops back to the event loop per chunk).
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._next = chunks.__anext__
+        self._buf = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buf:
+            try:
+                self._buf = anyio.from_thread.run(self._next)
+            except StopAsyncIteration:
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+
+def _input_format(content_type: str) -> str:
+    ct = (content_type or "").split(";")[0].strip().lower()
+    if ct in ("text/csv", "application/csv"):
+        return "csv"
+    if ct in (ARROW_STREAM, "application/vnd.apache.arrow.file", "application/x-arrow"):
+        return "arrow"
+    if ct in (NDJSON, "application/jsonl", "application/x-jsonlines", "application/json", ""):
+        return "ndjson"
+    raise HTTPException(status_code=415, detail=f"Unsupported content type: {content_type}")
+
+
+def _arrow_chunks(f, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    import pyarrow as pa
+    batches, n = [], 0
+    for batch in pa.ipc.open_stream(f):
+        batches.append(batch)
+        n += batch.num_rows
+        if n >= chunk_rows:
+            yield pa.Table.from_batches(batches).to_pandas()
+            batches, n = [], 0
+    if batches:
+        yield pa.Table.from_batches(batches).to_pandas()
+
+
+def _frames(fmt: str, body: _BodyFile, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    f = io.BufferedReader(body, buffer_size=1 << 16)
+    if fmt == "csv":
+        yield from pd.read_csv(f, chunksize=chunk_rows)
+    elif fmt == "arrow":
+        yield from _arrow_chunks(f, chunk_rows)
+    else:
+        # dtype=False: keep ids like "000123" as written
+        yield from pd.read_json(f, lines=True, chunksize=chunk_rows, dtype=False, convert_dates=False)
+
+
+# ---------------- scoring ----------------
+def _score_chunk(X: pd.DataFrame, models: List[str], thresholds: Dict[str, float], offset: int) -> pd.DataFrame:
+    """
+    One vectorized call per model; returns a flat result frame (row, patient_id, <model>_*).
+    Classifiers get <model>_threshold, the cutoff <model>_pred was taken at (0 for
+    decision-function scores).
+    """
+    X = X.reset_index(drop=True)
+    out = pd.DataFrame({"row": np.arange(offset, offset + len(X), dtype=np.int64)})
+    pid = X["patient_id"] if "patient_id" in X.columns else pd.Series([None] * len(X))
+    out["patient_id"] = pid.astype(object).where(pd.notna(pid), None).map(lambda v: None if v is None else str(v))
+    for m in models:
+        kind, values = prediction_service.score_frame(m, X)
+        if kind == "regression":
+            out[f"{m}_prediction"] = values
+        else:
+            thr = 0.0 if kind == "decision" else float(thresholds.get(m, 0.5))
+            out[f"{m}_score"] = values
+            out[f"{m}_pred"] = (values >= thr).astype(np.int8)
+            out[f"{m}_threshold"] = thr
+    return out
+
+
+def _ndjson_lines(res: pd.DataFrame, models: List[str]) -> bytes:
+    cols = {c: res[c].tolist() for c in res.columns}
+    lines = []
+    for i in range(len(res)):
+        rec: Dict[str, Any] = {"row": cols["row"][i], "patient_id": cols["patient_id"][i]}
+        for m in models:
+            if f"{m}_prediction" in cols:
+                rec[m] = {"prediction": cols[f"{m}_prediction"][i]}
+            else:
+                rec[m] = {"score": cols[f"{m}_score"][i], "pred": cols[f"{m}_pred"][i],
+                          "threshold": cols[f"{m}_threshold"][i]}
+        lines.append(ndjson_line(rec))
+    return b"".join(lines)
+
+
+class _ArrowStreamEncoder:
+    """Arrow IPC stream written incrementally: schema once, then one record batch per chunk."""
+
+    def __init__(self) -> None:
+        import pyarrow as pa
+        self._pa = pa
+        self._sink = io.BytesIO()
+        self._writer = None
+        self._schema = None
+
+    def _drain(self) -> bytes:
+        data = self._sink.getvalue()
+        self._sink.seek(0)
+        self._sink.truncate()
+        return data
+
+    def write(self, res: pd.DataFrame) -> bytes:
+        pa = self._pa
+        table = pa.Table.from_pandas(res, preserve_index=False)
+        if self._schema is None:
+            # patient_id is all-null in some chunks; pin it so every batch shares one schema
+            i = table.schema.get_field_index("patient_id")
+            self._schema = table.schema.set(i, pa.field("patient_id", pa.string()))
+            self._writer = pa.ipc.new_stream(self._sink, self._schema)
+        self._writer.write_table(table.cast(self._schema))
+        return self._drain()
+
+    def close(self) -> bytes:
+        if self._writer is not None:
+            self._writer.close()
+        return self._drain()
+
+
+class _DuplexStreamingResponse(StreamingResponse):
+    """
+    The response body pulls the request body as it goes. StreamingResponse on ASGI < 2.4
+    servers runs a disconnect listener that would swallow those http.request messages,
+    so it is skipped; a client that goes away surfaces as a failed send instead.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+@router.post("/batch")
+async def predict_batch(
+    request: Request,
+    models: List[str] = Query(..., description="Model names; repeat the parameter for several models"),
+    thresholds: Optional[str] = Query(None, description='JSON object of per-model thresholds, e.g. {"MortalityRiskModel": 0.4}'),
+    chunk_rows: int = Query(5000, ge=1, le=200_000),
+):
+    """
+    Score many patients in one call. Body: NDJSON (default), CSV (text/csv) or Arrow IPC
+    stream (application/vnd.apache.arrow.stream). The body is parsed and scored chunk by
+    chunk and results are streamed back as NDJSON, or as an Arrow stream when the Accept
+    header asks for it. Nothing is written to the database.
+    """
+    fmt = _input_format(request.headers.get("content-type", ""))
+    want_arrow = ARROW_STREAM in request.headers.get("accept", "")
+    if fmt == "arrow" or want_arrow:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=415, detail="Arrow support requires pyarrow on the server")
+    try:
+        thr: Dict[str, float] = {str(k): float(v) for k, v in json.loads(thresholds or "{}").items()}
+    except (ValueError, AttributeError, TypeError):
+        raise HTTPException(status_code=400, detail="thresholds must be a JSON object of numbers")
+
+    # fail before streaming starts: afterwards the status code is already sent
+    models = list(dict.fromkeys(models))
+    for m in models:
+        try:
+            await run_in_threadpool(model_cache.get_model, m)
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    frames = _frames(fmt, _BodyFile(request.stream()), chunk_rows)
+    sentinel = object()
+
+    async def body() -> AsyncIterator[bytes]:
+        encoder = _ArrowStreamEncoder() if want_arrow else None
+        offset = 0
+        while True:
+            try:
+                X = await run_in_threadpool(next, frames, sentinel)
+                if X is sentinel:
+                    break
+                res = await run_in_threadpool(_score_chunk, X, models, thr, offset)
+            except Exception as e:
+                if encoder is not None:
+                    raise
+                yield ndjson_line({"error": f"{e.__class__.__name__}: {e}", "row": offset})
+                return
+            offset += len(res)
+            yield encoder.write(res) if encoder is not None else _ndjson_lines(res, models)
+        if encoder is not None:
+            yield encoder.close()
+
+    return _DuplexStreamingResponse(body(), media_type=ARROW_STREAM if want_arrow else NDJSON)
@@ -28,6 +28,8 @@ except Exception as e:
     _AI_AVAILABLE = False
     print(f"✗ AI service import failed (Other): {type(e).__name__}: {e}")
 
+from ..services import column_catalog, risk_index
+
 router = APIRouter(prefix="/reports", tags=["reports"])
 
 # ---------- infra helpers ----------
@@ -113,6 +115,15 @@ def _load_strategy(engine: Engine, dataset_id: int, strategy_id: Optional[int])
 def _schema_profile(engine: Engine, dataset_id: int) -> Dict[str, Any]:
     """Lightweight schema profile for the LLM."""
     try:
+        cat = column_catalog.load(engine, dataset_id)
+        if cat is not None:
+            entries = list(cat.columns.values())
+            return {
+                "rows": cat.rows,
+                "columns": [{"name": e.name, "dtype": e.dtype} for e in entries],
+                "numerical": [{"name": e.name} for e in entries if e.kind == "numeric"],
+                "categorical": [{"name": e.name} for e in entries if e.kind != "numeric"]
+            }
         with engine.begin() as con:
             df = pd.read_sql(
                 text("SELECT * FROM patient_records WHERE dataset_id=:d LIMIT 500"),
@@ -215,7 +226,10 @@ def _extract_top_anomalies(anomaly: Dict[str, Any], top_n: int):
         pid = str(r.get("patient_id", "unknown"))
         flagged = int(r.get("anomaly_flag", r.get("anomaly", r.get("flag", 0))))
         score = float(r.get("anomaly_score", r.get("score", 0.0)) or 0.0)
-        safe_rows.append({"patient_id": pid, "anomaly_flag": flagged, "anomaly_score": score})
+        row = {"patient_id": pid, "anomaly_flag": flagged, "anomaly_score": score}
+        if r.get("explanation"):
+            row["top_features"] = r["explanation"]
+        safe_rows.append(row)
     safe_rows.sort(key=lambda x: x["anomaly_score"], reverse=True)
     return safe_rows[:top_n]
 
@@ -275,7 +289,14 @@ def generate_report(req: ReportGenerateRequest) -> Dict[str, Any]:
     if not os.path.exists(risk_path) or not os.path.exists(anom_path):
         raise HTTPException(status_code=400, detail="Provided analysis artifact path(s) do not exist on disk.")
 
-    risk = _read_json(risk_path)
+    # the run's top-K index carries the summary and the high-risk candidates: no need to
+    # parse every patient of the risk JSON
+    index = risk_index.load_for(risk_path)
+    if index is not None and req.top_n_patients <= index["k"]:
+        risk = {"summary": index["summary"]}
+    else:
+        index = None
+        risk = _read_json(risk_path)
     anomaly = _read_json(anom_path)
 
     # Strategy + schema for LLM context
@@ -293,7 +314,10 @@ def generate_report(req: ReportGenerateRequest) -> Dict[str, Any]:
 
     # Heuristic appendix (lists/tables) still useful for devs
     model_rows = _model_counts_summary(risk)
-    high_risk = _extract_high_risk_patients(risk, req.score_cutoff, req.min_positive_models, req.top_n_patients)
+    if index is not None:
+        high_risk = risk_index.high_risk(index, req.score_cutoff, req.min_positive_models, req.top_n_patients)
+    else:
+        high_risk = _extract_high_risk_patients(risk, req.score_cutoff, req.min_positive_models, req.top_n_patients)
     anomalies = _extract_top_anomalies(anomaly, req.top_n_anomalies)
 
     # Summary header
@@ -1,29 +1,21 @@
 from __future__ import annotations
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, Callable, Hashable, List, Optional, Tuple
+from collections import OrderedDict
 import json
+import os
+import threading
 
 import numpy as np
 import pandas as pd
 
 
-def _stringify_datetime_cols(df: pd.DataFrame) -> pd.DataFrame:
-    """Return a copy with datetime-like columns converted to ISO strings."""
-    if df.empty:
-        return df
-    out = df.copy()
-    dt_cols = out.select_dtypes(include=["datetime64[ns]", "datetimetz"]).columns.tolist()
-    for c in dt_cols:
-        # Keep None for missing values
-        out[c] = out[c].apply(lambda v: None if pd.isna(v) else str(v))
-    return out
-
-
 def head_sample(df: pd.DataFrame, limit: int = 50) -> Dict[str, Any]:
-    """JSON-friendly head() preview with datetimes stringified and NaNs -> None."""
+    """
+    head() preview as plain rows. Cells are left as they are (NaN, NaT, Timestamps);
+    utils.fast_json writes them as null and "2024-01-01 00:00:00" strings.
+    """
     sub = df.head(limit)
-    sub = _stringify_datetime_cols(sub)
-    sub = sub.astype(object).where(pd.notna(sub), None)
-    return {"columns": list(sub.columns), "rows": sub.values.tolist()}
+    return {"columns": list(sub.columns), "rows": sub.to_numpy(dtype=object).tolist()}
 
 
 def _coerce_hashable(s: pd.Series) -> pd.Series:
@@ -35,6 +27,77 @@ def _coerce_hashable(s: pd.Series) -> pd.Series:
     return s
 
 
+def _py(v):
+    return v.item() if isinstance(v, np.generic) else v
+
+
+def _numeric_summaries(df: pd.DataFrame, cols: List[str]) -> List[Dict[str, Any]]:
+    """
+    describe() + nunique() for all numeric columns from one column-wise sort of a 2-D
+    array: NaNs sort last, so count, min/max, the linear-interpolated quartiles (as
+    pandas) and the distinct count all come from the sorted columns. ±inf is kept
+    where describe() keeps it.
+    """
+    if not cols:
+        return []
+    if len(df) == 0:
+        return [{"column": c, "count": 0, "mean": None, "std": None, "min": None, "q25": None, "median": None,
+                 "q75": None, "max": None, "unique": 0} for c in cols]
+    M = df[cols].to_numpy(dtype=np.float64, na_value=np.nan)
+    S = np.sort(M, axis=0)
+    missing = np.isnan(M)
+    n = (~missing).sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(n > 0, np.nansum(M, axis=0) / np.maximum(n, 1), np.nan)
+        sq = (M - mean) ** 2
+        sq[missing] = 0.0
+        var = sq.sum(axis=0) / (n - 1)
+    std = np.where(n > 1, np.sqrt(var), np.nan)
+    col = np.arange(len(cols))
+    last = np.maximum(n - 1, 0)
+
+    def at(q: float) -> np.ndarray:
+        pos = q * last
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, last)
+        with np.errstate(invalid="ignore"):
+            v = S[lo, col] + (S[hi, col] - S[lo, col]) * (pos - lo)
+        return np.where(n > 0, v, np.nan)
+
+    stats = {"mean": mean, "std": std, "min": np.where(n > 0, S[0, col], np.nan), "q25": at(0.25),
+             "median": at(0.5), "q75": at(0.75), "max": np.where(n > 0, S[last, col], np.nan)}
+    with np.errstate(invalid="ignore"):
+        steps = (np.diff(S, axis=0) != 0) & (np.arange(1, len(S))[:, None] < n)
+    unique = np.where(n > 0, steps.sum(axis=0) + 1, 0)
+    out = []
+    for j, c in enumerate(cols):
+        row: Dict[str, Any] = {"column": c, "count": int(n[j])}
+        for k, v in stats.items():
+            row[k] = None if np.isnan(v[j]) else float(v[j])
+        row["unique"] = int(unique[j])
+        out.append(row)
+    return out
+
+
+def _categorical_summary(c: Any, s: pd.Series) -> Dict[str, Any]:
+    """unique / mode / missing from one factorize (categorical codes + bincount)."""
+    try:
+        codes, uniques = pd.factorize(s)
+    except TypeError:                       # dict / list cells
+        codes, uniques = pd.factorize(_coerce_hashable(s))
+    present = codes[codes >= 0]
+    top = None
+    if present.size:
+        counts = np.bincount(present, minlength=len(uniques))
+        tied = np.flatnonzero(counts == counts.max())
+        try:
+            # Series.mode returns the tied values sorted
+            top = _py(min(uniques[tied])) if len(tied) > 1 else _py(uniques[tied[0]])
+        except TypeError:
+            top = _py(_coerce_hashable(s).mode(dropna=True).iloc[0])
+    return {"column": c, "unique": int(len(uniques)), "top": top, "missing": int(len(codes) - present.size)}
+
+
 def dataframe_overview(df: pd.DataFrame) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]]]:
     """Return (meta, numeric_summaries, categorical_summaries) without changing schema."""
     meta = {
@@ -43,41 +106,53 @@ def dataframe_overview(df: pd.DataFrame) -> Tuple[Dict[str, Any], List[Dict[str,
         "missing_pct": float(df.isna().mean().mean()) if len(df) else 0.0,
     }
 
-    numeric, categorical = [], []
-    for c in df.columns:
-        s = _coerce_hashable(df[c])
-
-        try:
-            nunique = int(s.nunique(dropna=True))
-        except TypeError:
-            nunique = int(s.astype(str).nunique(dropna=True))
-
-        if pd.api.types.is_numeric_dtype(s):
-            d = s.describe(percentiles=[0.25, 0.5, 0.75])
-            numeric.append({
-                "column": c,
-                "count": int(d.get("count", 0)),
-                "mean": float(d.get("mean", np.nan)) if pd.notna(d.get("mean", np.nan)) else None,
-                "std": float(d.get("std", np.nan)) if pd.notna(d.get("std", np.nan)) else None,
-                "min": float(d.get("min", np.nan)) if pd.notna(d.get("min", np.nan)) else None,
-                "q25": float(d.get("25%", np.nan)) if pd.notna(d.get("25%", np.nan)) else None,
-                "median": float(d.get("50%", np.nan)) if pd.notna(d.get("50%", np.nan)) else None,
-                "q75": float(d.get("75%", np.nan)) if pd.notna(d.get("75%", np.nan)) else None,
-                "max": float(d.get("max", np.nan)) if pd.notna(d.get("max", np.nan)) else None,
-                "unique": nunique,
-            })
+    numeric_cols, bool_cols, other_cols = [], [], []
+    for c, t in df.dtypes.items():
+        if pd.api.types.is_bool_dtype(t):
+            bool_cols.append(c)
+        elif pd.api.types.is_numeric_dtype(t):
+            numeric_cols.append(c)
         else:
-            mode_vals = s.mode(dropna=True)
-            categorical.append({
-                "column": c,
-                "unique": nunique,
-                "top": mode_vals.iloc[0] if nunique and not mode_vals.empty else None,
-                "missing": int(s.isna().sum()),
-            })
-
+            other_cols.append(c)
+
+    by_col = {r["column"]: r for r in _numeric_summaries(df, numeric_cols)}
+    for c in bool_cols:
+        # describe() of a bool column has no mean / quantiles
+        s = df[c]
+        by_col[c] = {"column": c, "count": int(s.notna().sum()), "mean": None, "std": None, "min": None,
+                     "q25": None, "median": None, "q75": None, "max": None, "unique": int(s.nunique(dropna=True))}
+    numeric = [by_col[c] for c in df.columns if c in by_col]
+    categorical = [_categorical_summary(c, df[c]) for c in other_cols]
     return meta, numeric, categorical
 
 
+# ---------------- overview cache ----------------
+# Dataset summaries kept in memory, keyed by dataset and valid for one dataset version.
+OVERVIEW_CACHE_SIZE = int(os.environ.get("OVERVIEW_CACHE_SIZE", "32"))
+_OVERVIEW_LOCK = threading.Lock()
+_OVERVIEWS: "OrderedDict[Hashable, Tuple[Hashable, Dict[str, Any]]]" = OrderedDict()
+
+
+def put_overview(key: Hashable, version: Hashable, value: Dict[str, Any]) -> None:
+    with _OVERVIEW_LOCK:
+        _OVERVIEWS[key] = (version, value)
+        _OVERVIEWS.move_to_end(key)
+        while len(_OVERVIEWS) > OVERVIEW_CACHE_SIZE:
+            _OVERVIEWS.popitem(last=False)
+
+
+def cached_overview(key: Hashable, version: Hashable, build: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    """build() once per (key, version); a new version (re-ingest, appended rows) replaces the entry."""
+    with _OVERVIEW_LOCK:
+        hit = _OVERVIEWS.get(key)
+        if hit is not None and hit[0] == version:
+            _OVERVIEWS.move_to_end(key)
+            return hit[1]
+    value = build()
+    put_overview(key, version, value)
+    return value
+
+
 def _safe_float(x) -> Optional[float]:
     try:
         if x is None:
@@ -113,7 +188,6 @@ def histograms_for_columns(df: pd.DataFrame, columns: Optional[List[str]] = None
 def duckdb_query(df: pd.DataFrame, sql: str) -> Tuple[List[str], List[List[Any]]]:
     """
     Run an in-memory DuckDB query against DataFrame `df`.
-    Datetime columns are stringified in the output; NaNs -> None.
     """
     import duckdb
     con = duckdb.connect()
@@ -122,11 +196,9 @@ def duckdb_query(df: pd.DataFrame, sql: str) -> Tuple[List[str], List[List[Any]]
         res = con.execute(sql).fetchdf()
     finally:
         con.close()
+    return result_rows(res)
 
-    # Ensure JSON-serializable rows (datetime->str, NaN->None)
-    res2 = _stringify_datetime_cols(res)
-    res2 = res2.astype(object).where(pd.notna(res2), None)
 
-    cols = list(res2.columns)
-    rows = res2.values.tolist()
-    return cols, rows
+def result_rows(res: pd.DataFrame) -> Tuple[List[str], List[List[Any]]]:
+    """(columns, rows) of a query result, for a utils.fast_json response (see head_sample)."""
+    return list(res.columns), res.to_numpy(dtype=object).tolist()
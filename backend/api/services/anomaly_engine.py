@@ -0,0 +1,446 @@
+# backend/api/services/anomaly_engine.py
+"""
+One anomaly pass over a dataset. The numeric columns are selected, converted to one
+float64 matrix and median-imputed once; every requested detector then reads that same
+buffer and contributes a score column (higher = more unusual) and a flag column.
+
+Detectors: isolation_forest (the persisted per-dataset forest when a dataset id is
+given), zscore, iqr, robust_z (median / MAD), lof and mahalanobis. zscore and iqr share
+one pass of streaming column statistics. New detectors register with @detector("name").
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
+from dataclasses import dataclass, field, replace
+import os
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from . import anomaly_service, streaming_stats
+from .anomaly_service import ENGINE_CONFIG, AnomalyEngineConfig
+
+DEFAULT_DETECTORS = ("isolation_forest",)
+# LOF is quadratic in the rows it is fitted on; larger datasets fit on a sample and score the rest.
+LOF_FIT_ROWS = int(os.environ.get("ANOMALY_LOF_FIT_ROWS", "20000"))
+# Grouped isolation forests: groups below GROUP_MIN_ROWS share one pooled forest.
+GROUP_MIN_ROWS = int(os.environ.get("ANOMALY_GROUP_MIN_ROWS", "1000"))
+GROUP_WORKERS = int(os.environ.get("ANOMALY_GROUP_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+# Below this many rows the groups run in-process: starting spawn workers costs seconds.
+GROUP_POOL_MIN_ROWS = int(os.environ.get("ANOMALY_GROUP_POOL_MIN_ROWS", "200000"))
+BLOCK_ROWS = streaming_stats.CHUNK_ROWS
+# Contributing features listed per flagged patient in analysis runs (0 = none), and whether
+# to add the isolation forest's path-length shares (one decision_path per tree over flagged rows).
+EXPLAIN_TOP = int(os.environ.get("ANOMALY_EXPLAIN_TOP", "3"))
+EXPLAIN_PATHS = os.environ.get("ANOMALY_EXPLAIN_PATHS", "0") == "1"
+
+
+@dataclass
+class NumericMatrix:
+    """The imputed numeric buffer every detector reads, plus the column statistics of the raw values."""
+    columns: List[str]
+    X: np.ndarray           # rows x columns, float64, missing values replaced by the column median
+    fill: np.ndarray        # column medians over present values
+    mean: np.ndarray        # column means / population std over present values
+    std: np.ndarray
+    n_missing: int
+    missing: Optional[np.ndarray] = None    # where X was imputed (None: nothing was missing)
+
+    @property
+    def n_rows(self) -> int:
+        return int(self.X.shape[0])
+
+    def refilled(self, fill: np.ndarray) -> np.ndarray:
+        """X with the missing values imputed by `fill` (e.g. a persisted detector's medians)."""
+        if self.missing is None or np.array_equal(fill, self.fill):
+            return self.X
+        X = self.X.copy()
+        X[self.missing] = np.take(fill, np.nonzero(self.missing)[1])
+        return X
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, columns: Optional[Sequence[str]] = None) -> "NumericMatrix":
+        if columns is None:
+            columns = df.select_dtypes(include=[np.number]).columns.tolist()
+        else:
+            columns = [c for c in columns if c in df.columns]
+        sub = df[columns]
+        if any(not pd.api.types.is_numeric_dtype(t) for t in sub.dtypes):
+            sub = sub.apply(pd.to_numeric, errors="coerce")
+        X = sub.to_numpy(dtype=np.float64, na_value=np.nan)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)     # all-NaN columns
+            fill = np.nan_to_num(np.nanmedian(X, axis=0), nan=0.0) if X.size else np.zeros(len(columns))
+            mean = np.nanmean(X, axis=0) if X.size else np.zeros(len(columns))
+            std = np.nanstd(X, axis=0) if X.size else np.zeros(len(columns))
+        miss = np.isnan(X)
+        n_missing = int(miss.sum())
+        if n_missing:
+            X[miss] = np.take(fill, np.nonzero(miss)[1])
+        return cls(columns=list(columns), X=X, fill=fill, mean=mean, std=std, n_missing=n_missing,
+                   missing=miss if n_missing else None)
+
+
+@dataclass
+class DetectorOutput:
+    score: np.ndarray
+    flag: np.ndarray
+    info: Dict[str, Any] = field(default_factory=dict)
+
+
+class _Context:
+    def __init__(self, data: NumericMatrix, dataset_id: Optional[int], config: AnomalyEngineConfig,
+                 frame: Optional[pd.DataFrame] = None):
+        self.data, self.dataset_id, self.config = data, dataset_id, config
+        self.frame = frame          # the source rows, for detectors that need non-numeric keys
+        self._stats: Optional[streaming_stats.ColumnStats] = None
+        self._median_mad: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self.forest = None          # the isolation forest, once that detector ran
+
+    def column_stats(self) -> streaming_stats.ColumnStats:
+        """Moments and quartile sketches of the imputed matrix, built once for zscore and iqr."""
+        if self._stats is None:
+            stats = streaming_stats.ColumnStats(self.data.columns)
+            for i in range(0, self.data.n_rows, BLOCK_ROWS):
+                stats.update_array(self.data.X[i:i + BLOCK_ROWS])
+            self._stats = stats
+        return self._stats
+
+    def median_mad(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Column medians and median absolute deviations of the imputed matrix."""
+        if self._median_mad is None:
+            med = np.median(self.data.X, axis=0)
+            self._median_mad = med, np.median(np.abs(self.data.X - med), axis=0)
+        return self._median_mad
+
+    def blocks(self):
+        X = self.data.X
+        for i in range(0, X.shape[0], BLOCK_ROWS):
+            yield i, X[i:i + BLOCK_ROWS]
+
+
+DETECTORS: Dict[str, Callable[..., DetectorOutput]] = {}
+
+
+def detector(name: str):
+    def register(fn: Callable[..., DetectorOutput]) -> Callable[..., DetectorOutput]:
+        DETECTORS[name] = fn
+        return fn
+    return register
+
+
+@detector("isolation_forest")
+def _isolation_forest(ctx: _Context, contamination: Union[str, float] = "auto") -> DetectorOutput:
+    if ctx.dataset_id is not None and contamination == "auto":
+        flags, scores, info, ctx.forest = anomaly_service.score_matrix(ctx.data, ctx.dataset_id, ctx.config)
+        return DetectorOutput(scores, flags.astype(bool), info)
+    iso = ctx.config.estimator().set_params(contamination=contamination)
+    rows = ctx.config.fit_rows(ctx.data.n_rows)
+    iso.fit(ctx.data.X if rows is None else ctx.data.X[rows])
+    ctx.forest = iso
+    decision = anomaly_service.decision_function(iso, ctx.data.X, ctx.config)
+    return DetectorOutput(-decision, decision < 0, {"refit": True, "contamination": contamination})
+
+
+@detector("zscore")
+def _zscore(ctx: _Context, limit: float = streaming_stats.Z_LIMIT) -> DetectorOutput:
+    det = streaming_stats.OutlierDetector(ctx.column_stats(), z_limit=limit)
+    score = np.empty(ctx.data.n_rows)
+    for i, B in ctx.blocks():
+        score[i:i + len(B)] = (np.abs(B - det.mean) / det.scale).max(axis=1, initial=0.0)
+    return DetectorOutput(score, score > limit, {"limit": limit})
+
+
+@detector("iqr")
+def _iqr(ctx: _Context, k: float = streaming_stats.IQR_K) -> DetectorOutput:
+    """Score: how far the furthest value lies outside its fence, in IQRs."""
+    det = streaming_stats.OutlierDetector(ctx.column_stats(), iqr_k=k)
+    width = np.maximum(det.high - det.low, 1e-9)
+    score = np.empty(ctx.data.n_rows)
+    flag = np.empty(ctx.data.n_rows, dtype=bool)
+    for i, B in ctx.blocks():
+        outside = np.maximum(det.low - B, B - det.high)
+        score[i:i + len(B)] = np.maximum(outside / width, 0.0).max(axis=1, initial=0.0)
+        flag[i:i + len(B)] = det.flag_array(B)[1]
+    return DetectorOutput(score, flag, {"k": k, "sketch_exact": all(s.exact for s in ctx.column_stats().sketches)})
+
+
+@detector("robust_z")
+def _robust_z(ctx: _Context, limit: float = 3.5) -> DetectorOutput:
+    """Iglewicz-Hoaglin modified z-score, 0.6745 * |x - median| / MAD; columns with MAD 0 are ignored."""
+    med, mad = ctx.median_mad()
+    inv = np.where(mad > 0, 0.6745 / np.where(mad > 0, mad, 1.0), 0.0)
+    score = np.empty(ctx.data.n_rows)
+    for i, B in ctx.blocks():
+        score[i:i + len(B)] = (np.abs(B - med) * inv).max(axis=1, initial=0.0)
+    return DetectorOutput(score, score > limit, {"limit": limit, "ignored_columns": int((mad == 0).sum())})
+
+
+def _standardizer(ctx: _Context):
+    mu = ctx.data.X.mean(axis=0)
+    sd = ctx.data.X.std(axis=0)
+    sd = np.where(sd > 0, sd, 1.0)
+    return lambda B: (B - mu) / sd
+
+
+@detector("lof")
+def _lof(ctx: _Context, n_neighbors: int = 20, fit_rows: int = LOF_FIT_ROWS) -> DetectorOutput:
+    from sklearn.neighbors import LocalOutlierFactor
+    n = ctx.data.n_rows
+    if n < 3:
+        # too few rows to have neighbours to compare against
+        return DetectorOutput(np.zeros(n), np.zeros(n, dtype=bool), {"fitted_rows": 0, "skipped": "fewer than 3 rows"})
+    std = _standardizer(ctx)
+    n_neighbors = max(1, min(n_neighbors, n - 1))
+    if n <= fit_rows:
+        lof = LocalOutlierFactor(n_neighbors=n_neighbors, n_jobs=ctx.config.n_jobs)
+        pred = lof.fit_predict(std(ctx.data.X))
+        return DetectorOutput(-lof.negative_outlier_factor_, pred == -1, {"fitted_rows": n})
+    rng = np.random.default_rng(ctx.config.random_state)
+    rows = np.sort(rng.choice(n, size=fit_rows, replace=False))
+    lof = LocalOutlierFactor(n_neighbors=n_neighbors, novelty=True, n_jobs=ctx.config.n_jobs)
+    lof.fit(std(ctx.data.X[rows]))
+    score = np.empty(n)
+    for i, B in ctx.blocks():
+        score[i:i + len(B)] = -lof.score_samples(std(B))
+    return DetectorOutput(score, -score - lof.offset_ < 0, {"fitted_rows": fit_rows})
+
+
+def _fit_score_group(X: np.ndarray, config: AnomalyEngineConfig) -> np.ndarray:
+    """Isolation-forest decision values of X from a forest fitted on X (runs in a worker process)."""
+    iso = config.estimator()
+    rows = config.fit_rows(len(X))
+    iso.fit(X if rows is None else X[rows])
+    return anomaly_service.decision_function(iso, X, config)
+
+
+def _group_rows(keys: pd.DataFrame, min_rows: int) -> Tuple[List[Tuple[str, np.ndarray]], int]:
+    """(label, row positions) per group, largest first; groups under min_rows (and missing keys) pooled."""
+    grouped = keys.groupby(list(keys.columns), sort=True)
+    codes = grouped.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    sizes = grouped.size()
+    labels = ["/".join(map(str, k)) if isinstance(k, tuple) else str(k) for k in sizes.index]
+    counts = sizes.to_numpy()
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(counts) + 1))
+    groups = [(labels[g], order[bounds[g]:bounds[g + 1]]) for g in np.flatnonzero(counts >= min_rows)]
+    pooled = np.isin(codes, np.flatnonzero(counts < min_rows)) | (codes < 0)
+    if pooled.any():
+        groups.append(("(pooled)", np.flatnonzero(pooled)))
+    groups.sort(key=lambda g: -len(g[1]))
+    return groups, int((counts < min_rows).sum())
+
+
+@detector("grouped_isolation_forest")
+def _grouped_isolation_forest(ctx: _Context, by: Union[str, Sequence[str]] = "facility_id",
+                              min_rows: int = GROUP_MIN_ROWS, workers: int = GROUP_WORKERS) -> DetectorOutput:
+    """
+    One isolation forest per value of `by` (e.g. facility_id or region), so each row is
+    compared with its own facility's case mix rather than the whole dataset's. Groups are
+    fitted and scored in a process pool, largest first; each forest trains on at most
+    fit_sample_rows rows of 256-row trees, so total work stays near one global fit.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    missing = [c for c in by if ctx.frame is None or c not in ctx.frame.columns]
+    if missing:
+        raise ValueError(f"grouped_isolation_forest: no column(s) {', '.join(missing)}")
+    groups, n_small = _group_rows(ctx.frame[by].reset_index(drop=True), max(1, min_rows))
+    X = ctx.data.X
+    decision = np.empty(len(X))
+    workers = max(1, min(workers, len(groups))) if len(X) >= GROUP_POOL_MIN_ROWS else 1
+    if workers == 1:
+        for _, rows in groups:
+            decision[rows] = _fit_score_group(X[rows], ctx.config)
+    else:
+        import multiprocessing as mp
+        from concurrent.futures import ProcessPoolExecutor
+        from .sharded_scoring import _worker_init
+        worker_cfg = replace(ctx.config, n_jobs=1)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                                 initializer=_worker_init) as pool:
+            futures = [pool.submit(_fit_score_group, X[rows], worker_cfg) for _, rows in groups]
+            for (_, rows), fut in zip(groups, futures):
+                decision[rows] = fut.result()
+    flag = decision < 0
+    info = {"by": by, "workers": workers, "pooled_groups": n_small,
+            "groups": [{"group": g, "rows": int(len(r)), "n_flagged": int(flag[r].sum())} for g, r in groups]}
+    return DetectorOutput(-decision, flag, info)
+
+
+@detector("mahalanobis")
+def _mahalanobis(ctx: _Context, alpha: float = 0.001) -> DetectorOutput:
+    """Squared Mahalanobis distance; flags beyond the chi-square (1 - alpha) quantile."""
+    from scipy.stats import chi2
+    X = ctx.data.X
+    mu = X.mean(axis=0)
+    cov = np.atleast_2d(np.cov(X, rowvar=False)) if len(X) > 1 else np.zeros((X.shape[1], X.shape[1]))
+    prec = np.linalg.pinv(cov)
+    score = np.empty(len(X))
+    for i, B in ctx.blocks():
+        D = B - mu
+        score[i:i + len(B)] = np.einsum("ij,ij->i", D @ prec, D)
+    cutoff = float(chi2.ppf(1 - alpha, df=X.shape[1]))
+    return DetectorOutput(score, score > cutoff, {"alpha": alpha, "cutoff": cutoff})
+
+
+# ---------------- explanations ----------------
+@dataclass
+class Explanations:
+    """Top contributing features of each flagged row (strongest first)."""
+    rows: np.ndarray                        # positions of the explained rows
+    features: np.ndarray                    # rows x top, column indices
+    values: np.ndarray                      # rows x top, the imputed values
+    robust_z: np.ndarray                    # rows x top, signed 0.6745 * (x - median) / MAD
+    path_share: Optional[np.ndarray] = None # rows x top, share of the forest's isolating splits
+
+    def records(self, columns: Sequence[str]) -> List[List[Dict[str, Any]]]:
+        out = []
+        for r in range(len(self.rows)):
+            feats = []
+            for j in range(self.features.shape[1]):
+                f = {"feature": columns[self.features[r, j]], "value": float(self.values[r, j]),
+                     "robust_z": round(float(self.robust_z[r, j]), 3)}
+                if self.path_share is not None:
+                    f["path_share"] = round(float(self.path_share[r, j]), 3)
+                feats.append(f)
+            out.append(feats)
+        return out
+
+
+def _robust_scale(ctx: _Context) -> Tuple[np.ndarray, np.ndarray]:
+    """(median, 0.6745 / MAD) per column; the mean absolute deviation stands in where the MAD is 0."""
+    med, mad = ctx.median_mad()
+    scale = np.where(mad > 0, mad, 1.253314 * np.abs(ctx.data.X - med).mean(axis=0) / 0.6745)
+    return med, np.where(scale > 0, 0.6745 / np.where(scale > 0, scale, 1.0), 0.0)
+
+
+def _path_shares(forest, X: np.ndarray) -> np.ndarray:
+    """
+    Per row and feature: the splits on that feature along the row's path in each tree,
+    weighted by 1 / path length (short paths isolate), summed over trees, rows summing to 1.
+    """
+    from scipy import sparse
+    n, d = X.shape
+    out = np.zeros((n, d))
+    for tree, feats in zip(forest.estimators_, forest.estimators_features_):
+        t = tree.tree_
+        internal = np.flatnonzero(t.feature >= 0)
+        node_feature = sparse.csr_matrix(
+            (np.ones(len(internal)), (internal, np.asarray(feats)[t.feature[internal]])), shape=(t.node_count, d))
+        paths = tree.decision_path(X)          # rows x nodes indicator
+        depth = np.asarray(paths.sum(axis=1)).ravel() - 1
+        out += (paths @ node_feature).toarray() / np.maximum(depth, 1)[:, None]
+    total = out.sum(axis=1, keepdims=True)
+    return out / np.where(total > 0, total, 1.0)
+
+
+def explain(ctx: _Context, rows: np.ndarray, top: int = 3, path_contributions: bool = False) -> Explanations:
+    """
+    Attributions for `rows` only, as matrix operations: robust z of every feature, then the
+    top features by |robust z| (or by path share when path contributions are requested)
+    via argpartition, so the cost grows with the flagged rows rather than the dataset.
+    """
+    X = ctx.data.X[rows]
+    d = X.shape[1]
+    top = max(1, min(top, d))
+    med, inv = _robust_scale(ctx)
+    Z = (X - med) * inv
+    shares = _path_shares(ctx.forest, X) if path_contributions and ctx.forest is not None else None
+    key = shares if shares is not None else np.abs(Z)
+    part = np.argpartition(-key, top - 1, axis=1)[:, :top] if top < d else np.tile(np.arange(d), (len(rows), 1))
+    order = np.argsort(-np.take_along_axis(key, part, axis=1), axis=1, kind="stable")
+    idx = np.take_along_axis(part, order, axis=1)
+    pick = lambda M: np.take_along_axis(M, idx, axis=1)
+    return Explanations(rows=rows, features=idx, values=pick(X), robust_z=pick(Z),
+                        path_share=pick(shares) if shares is not None else None)
+
+
+@dataclass
+class AnomalyResult:
+    """Columnar engine output: one score and one flag array per detector, all of length n_rows."""
+    n_rows: int
+    columns: List[str]
+    scores: Dict[str, np.ndarray] = field(default_factory=dict)
+    flags: Dict[str, np.ndarray] = field(default_factory=dict)
+    info: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    seconds: Dict[str, float] = field(default_factory=dict)
+    explanations: Optional[Explanations] = None
+
+    @property
+    def detectors(self) -> List[str]:
+        return list(self.scores)
+
+    def any_flag(self) -> np.ndarray:
+        out = np.zeros(self.n_rows, dtype=bool)
+        for f in self.flags.values():
+            out |= f
+        return out
+
+    def to_frame(self, index=None) -> pd.DataFrame:
+        cols: Dict[str, np.ndarray] = {}
+        for d in self.scores:
+            cols[f"{d}_score"] = self.scores[d]
+            cols[f"{d}_flag"] = self.flags[d]
+        return pd.DataFrame(cols, index=index)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return {d: {"n_flagged": int(self.flags[d].sum()), "seconds": round(self.seconds[d], 4), **self.info[d]}
+                for d in self.scores}
+
+
+def _specs(detectors: Union[Sequence[str], Mapping[str, Mapping[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    specs = ({d: dict(p or {}) for d, p in detectors.items()} if isinstance(detectors, Mapping)
+             else {d: {} for d in detectors})
+    unknown = [d for d in specs if d not in DETECTORS]
+    if unknown:
+        raise ValueError(f"Unknown anomaly detector(s): {', '.join(unknown)}; available: {', '.join(DETECTORS)}")
+    return specs
+
+
+def run(df: pd.DataFrame, detectors: Union[Sequence[str], Mapping[str, Mapping[str, Any]]] = DEFAULT_DETECTORS,
+        columns: Optional[Sequence[str]] = None, dataset_id: Optional[int] = None,
+        config: AnomalyEngineConfig = ENGINE_CONFIG, explain_top: int = 0,
+        path_contributions: bool = False) -> AnomalyResult:
+    """
+    Run the requested detectors (names, or name -> keyword parameters) over one imputed
+    matrix of df's numeric columns (or of `columns`). No numeric columns: empty result.
+    explain_top > 0 adds that many contributing features for every flagged row.
+    """
+    specs = _specs(detectors)
+    data = NumericMatrix.from_frame(df, columns)
+    res = AnomalyResult(n_rows=data.n_rows, columns=data.columns)
+    if not data.columns or not data.n_rows:
+        return res
+    ctx = _Context(data, dataset_id, config, frame=df)
+    for name, params in specs.items():
+        t0 = time.perf_counter()
+        out = DETECTORS[name](ctx, **params)
+        res.seconds[name] = time.perf_counter() - t0
+        res.scores[name] = np.asarray(out.score, dtype=np.float64)
+        res.flags[name] = np.asarray(out.flag, dtype=bool)
+        res.info[name] = out.info
+    if explain_top > 0:
+        t0 = time.perf_counter()
+        res.explanations = explain(ctx, np.flatnonzero(res.any_flag()), explain_top, path_contributions)
+        res.seconds["explain"] = time.perf_counter() - t0
+    return res
+
+
+def zscore_iqr_report(X: pd.DataFrame, patient_ids: pd.Series) -> Dict[str, Any]:
+    """The "zscore+iqr" report of the strategy runs, from one engine pass."""
+    out: Dict[str, Any] = {"method": "zscore+iqr", "patients": []}
+    res = run(X, ("zscore", "iqr"))
+    if not res.detectors:
+        out["summary"] = {"n_flagged": 0, "n_total": int(len(X)), "note": "no numeric columns"}
+        return out
+    ids = patient_ids.reset_index(drop=True).reindex(range(res.n_rows))
+    out["patients"] = streaming_stats.flagged_entries(ids, res.flags["zscore"], res.flags["iqr"])
+    out["summary"] = {
+        "n_flagged": len(out["patients"]),
+        "n_total": res.n_rows,
+        "method_components": ["zscore>3", "iqr_1.5"],
+        "sketch_exact": res.info["iqr"]["sketch_exact"],
+    }
+    return out
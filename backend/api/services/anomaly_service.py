@@ -1,26 +1,36 @@
 
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+from dataclasses import dataclass, field, asdict
+import os
+import threading
+import time
+
+import joblib
 import numpy as np
 import pandas as pd
 from sklearn.ensemble import IsolationForest
 
+from ...paths import ARTIFACT_DIR
+from ...ml_library.common.compiled_forest import artifact_signature
+
+if TYPE_CHECKING:
+    from .anomaly_engine import NumericMatrix
+
 NUMERIC_COLS = [
     "bmi","systolic_bp","diastolic_bp","heart_rate","resp_rate","temperature_c","spo2",
     "glucose","hba1c","creatinine","egfr","hemoglobin","wbc","platelets","cholesterol_total","ldl","hdl","triglycerides"
 ]
 
 def run_anomaly_detection(df: pd.DataFrame, contamination: float = 0.02):
-    sel = [c for c in NUMERIC_COLS if c in df.columns]
-    X = df[sel].fillna(df[sel].median())
-    if X.empty:
+    from .anomaly_engine import run
+    res = run(df, {"isolation_forest": {"contamination": contamination}}, columns=NUMERIC_COLS)
+    if not res.columns:
         return {"summary":{"message":"No numeric columns for anomaly detection"}, "per_patient":[]}
-    iso = IsolationForest(random_state=42, contamination=contamination)
-    scores = iso.fit_predict(X)  # -1 outlier, 1 normal
-    decision = iso.decision_function(X)  # the lower, the more abnormal
-    outliers = (scores == -1).astype(int)
+    outliers = res.flags["isolation_forest"].astype(int)
     payload = pd.DataFrame({
             "patient_id": df.get("patient_id", pd.Series(range(len(df)))),
             "anomaly": outliers,
-            "anomaly_score": -decision
+            "anomaly_score": res.scores["isolation_forest"]
     })
     summary = {
         "contamination": contamination,
@@ -28,3 +38,178 @@ def run_anomaly_detection(df: pd.DataFrame, contamination: float = 0.02):
         "rate": float(outliers.mean())
     }
     return {"summary": summary, "per_patient": payload.to_dict(orient="records")}
+
+
+# ---------------- persisted per-dataset detector ----------------
+ANOMALY_DIR = ARTIFACT_DIR / "anomaly"
+# Refit when the row count moved by more than this fraction since the fit...
+REFIT_GROWTH = float(os.environ.get("ANOMALY_REFIT_GROWTH", "0.25"))
+# ...or any column mean moved by more than this many fit-time standard deviations.
+REFIT_DRIFT_Z = float(os.environ.get("ANOMALY_REFIT_DRIFT_Z", "0.25"))
+
+
+def _max_samples(v: str) -> Union[int, float, str]:
+    if v == "auto":
+        return v
+    return float(v) if "." in v else int(v)
+
+
+@dataclass(frozen=True)
+class AnomalyEngineConfig:
+    """
+    IsolationForest settings. Trees only ever see max_samples rows (256 under "auto"),
+    so fitting on a random fit_sample_rows subset of a large dataset gives the same kind
+    of forest at a fraction of the cost; scoring covers every row in parallel blocks.
+    """
+    n_estimators: int = 200
+    max_samples: Union[int, float, str] = "auto"
+    fit_sample_rows: Optional[int] = 100_000        # None: fit on every row
+    n_jobs: int = -1                                # fit and scoring workers; -1 = all cores
+    score_block_rows: int = 65_536
+    random_state: int = 42
+
+    @classmethod
+    def from_env(cls) -> "AnomalyEngineConfig":
+        env = os.environ.get
+        fit_rows = int(env("ANOMALY_FIT_ROWS", "100000"))
+        return cls(
+            n_estimators=int(env("ANOMALY_N_ESTIMATORS", "200")),
+            max_samples=_max_samples(env("ANOMALY_MAX_SAMPLES", "auto")),
+            fit_sample_rows=fit_rows if fit_rows > 0 else None,
+            n_jobs=int(env("ANOMALY_N_JOBS", "-1")),
+            score_block_rows=int(env("ANOMALY_BLOCK_ROWS", "65536")),
+        )
+
+    def estimator(self) -> IsolationForest:
+        return IsolationForest(n_estimators=self.n_estimators, max_samples=self.max_samples,
+                               contamination="auto", n_jobs=self.n_jobs, random_state=self.random_state)
+
+    def fit_rows(self, n: int) -> Optional[np.ndarray]:
+        """Sorted row positions to fit on, or None for all rows."""
+        if self.fit_sample_rows is None or n <= self.fit_sample_rows:
+            return None
+        rng = np.random.default_rng(self.random_state)
+        return np.sort(rng.choice(n, size=self.fit_sample_rows, replace=False))
+
+    def model_params(self) -> Dict[str, Any]:
+        """The settings that shape the fitted forest (a change means refit)."""
+        d = asdict(self)
+        d.pop("n_jobs")
+        d.pop("score_block_rows")
+        return d
+
+
+ENGINE_CONFIG = AnomalyEngineConfig.from_env()
+
+
+def decision_function(model: IsolationForest, X: np.ndarray, config: AnomalyEngineConfig = ENGINE_CONFIG) -> np.ndarray:
+    """
+    model.decision_function over row blocks scored on a thread pool. IsolationForest
+    scores sequentially whatever its n_jobs; the per-tree apply/decision_path work
+    releases the GIL, so threads scale without copying the forest into processes.
+    """
+    from joblib import Parallel, delayed, effective_n_jobs
+    n = X.shape[0]
+    block = max(1, config.score_block_rows)
+    jobs = min(effective_n_jobs(config.n_jobs), -(-n // block))
+    if jobs <= 1:
+        return model.decision_function(X)
+    parts = Parallel(n_jobs=jobs, prefer="threads")(
+        delayed(model.score_samples)(X[i:i + block]) for i in range(0, n, block)
+    )
+    return np.concatenate(parts) - model.offset_
+
+
+@dataclass
+class DatasetDetector:
+    """IsolationForest fitted on one dataset, with the statistics needed to reuse it."""
+    model: IsolationForest
+    columns: List[str]
+    fill: np.ndarray                 # per-column medians used for missing values
+    ref_mean: np.ndarray
+    ref_std: np.ndarray
+    n_rows: int
+    fitted_at: float = field(default_factory=time.time)
+    params: Dict[str, Any] = field(default_factory=dict)    # AnomalyEngineConfig.model_params() at fit time
+
+    def refit_reason(self, columns: List[str], n_rows: int, mean: np.ndarray,
+                     config: AnomalyEngineConfig) -> Optional[str]:
+        if columns != self.columns:
+            return "columns changed"
+        if getattr(self, "params", None) != config.model_params():
+            return "engine config changed"
+        if abs(n_rows - self.n_rows) > REFIT_GROWTH * max(self.n_rows, 1):
+            return f"row count {self.n_rows} -> {n_rows}"
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z = np.abs(mean - self.ref_mean) / np.where(self.ref_std > 0, self.ref_std, 1.0)
+        z = np.nan_to_num(z, nan=0.0)
+        if z.size and z.max() > REFIT_DRIFT_Z:
+            return f"drift in {columns[int(z.argmax())]} ({z.max():.2f} sd)"
+        return None
+
+
+def _fit(data: "NumericMatrix", config: AnomalyEngineConfig) -> DatasetDetector:
+    det = DatasetDetector(model=config.estimator(), columns=list(data.columns), fill=data.fill,
+                          ref_mean=data.mean, ref_std=data.std, n_rows=data.n_rows,
+                          params=config.model_params())
+    rows = config.fit_rows(data.n_rows)
+    det.model.fit(data.X if rows is None else data.X[rows])
+    return det
+
+
+def detector_path(dataset_id: int) -> str:
+    return str(ANOMALY_DIR / f"dataset_{int(dataset_id)}.joblib")
+
+
+_LOCK = threading.Lock()
+_LOADED: Dict[int, Tuple[Tuple[int, int], DatasetDetector]] = {}
+
+
+def _load(dataset_id: int) -> Optional[DatasetDetector]:
+    path = detector_path(dataset_id)
+    try:
+        sig = artifact_signature(path)
+    except OSError:
+        return None
+    with _LOCK:
+        hit = _LOADED.get(dataset_id)
+    if hit is not None and hit[0] == sig:
+        return hit[1]
+    try:
+        det = joblib.load(path)
+    except Exception:
+        return None
+    with _LOCK:
+        _LOADED[dataset_id] = (sig, det)
+    return det
+
+
+def _save(dataset_id: int, det: DatasetDetector) -> None:
+    path = detector_path(dataset_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    joblib.dump(det, tmp)
+    os.replace(tmp, path)
+    with _LOCK:
+        _LOADED[dataset_id] = (artifact_signature(path), det)
+
+
+def score_matrix(data: "NumericMatrix", dataset_id: int, config: AnomalyEngineConfig = ENGINE_CONFIG
+                 ) -> Tuple[np.ndarray, np.ndarray, Dict[str, Any], IsolationForest]:
+    """
+    (flags, anomaly scores, info, forest) for every row of an imputed numeric matrix.
+    Reuses the dataset's persisted detector and only refits (and re-persists) when the
+    columns or engine config changed or the data grew or drifted past the thresholds; a
+    reused forest sees missing values imputed with its fit-time medians. One
+    decision_function pass gives both outputs: IsolationForest.predict flags exactly the
+    rows whose decision is below 0.
+    """
+    det = _load(dataset_id)
+    reason = ("no persisted detector" if det is None
+              else det.refit_reason(list(data.columns), data.n_rows, data.mean, config))
+    if reason is not None:
+        det = _fit(data, config)
+        _save(dataset_id, det)
+    decision = decision_function(det.model, data.refilled(det.fill), config)
+    info = {"refit": reason is not None, "reason": reason, "fitted_rows": det.n_rows, "fitted_at": det.fitted_at}
+    return (decision < 0).astype(np.int8), -decision, info, det.model
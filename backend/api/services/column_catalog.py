@@ -0,0 +1,373 @@
+# backend/api/services/column_catalog.py
+"""
+Column statistics catalog, built once at ingest and folded forward on every append.
+
+Per column: count, nulls, min / max, mean / variance (Welford, streaming_stats.ColumnStats),
+quantiles (KLL sketch), an approximate distinct count (KMV sketch) and the most frequent
+values of non-numeric columns. Histograms for any bin count come from the quantile sketch,
+which keeps a column's values verbatim up to EXACT_ROWS, so small and medium datasets get
+the same bins and counts as np.histogram.
+
+A catalog is a joblib sidecar in artifacts/column_stats, stamped with the dataset version it
+describes (id range for database datasets, size + mtime for files). Readers check the stamp
+and fall back to scanning the data when it does not match.
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+import os
+import threading
+
+import joblib
+import numpy as np
+import pandas as pd
+from sqlalchemy.engine import Engine
+
+from ...paths import ARTIFACT_DIR
+from ...ml_library.common.compiled_forest import artifact_signature
+from . import patient_access
+from .analysis_service import head_sample
+from .streaming_stats import ColumnStats
+
+CATALOG_DIR = ARTIFACT_DIR / "column_stats"
+# Values per numeric column kept verbatim before the quantile sketch compacts.
+EXACT_ROWS = int(os.environ.get("COLUMN_STATS_EXACT_ROWS", "20000"))
+# KLL accuracy past EXACT_ROWS: rank error about 1.7 / SKETCH_K, i.e. ~0.1% of rows per histogram bin.
+SKETCH_K = int(os.environ.get("COLUMN_STATS_SKETCH_K", "2048"))
+# KMV sketch size: distinct counts are exact up to this many values, ~1/sqrt(k) error beyond.
+DISTINCT_K = int(os.environ.get("COLUMN_STATS_DISTINCT_K", "4096"))
+# Values counted per non-numeric column; counts are exact while a column has fewer.
+TOPK_CAPACITY = int(os.environ.get("COLUMN_STATS_TOPK", "1024"))
+DEFAULT_BINS = int(os.environ.get("COLUMN_STATS_BINS", "20"))
+PREVIEW_ROWS = 50
+
+_MAX_HASH = float(2 ** 64)
+
+
+class DistinctSketch:
+    """K-minimum-values distinct count over 64-bit hashes; merges by union."""
+
+    def __init__(self, k: int = DISTINCT_K):
+        self.k = k
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def update(self, hashes: np.ndarray) -> None:
+        if hashes.size:
+            self.hashes = np.unique(np.concatenate([self.hashes, np.unique(hashes)]))[:self.k]
+
+    def merge(self, other: "DistinctSketch") -> "DistinctSketch":
+        self.update(other.hashes)
+        return self
+
+    def estimate(self) -> int:
+        if len(self.hashes) < self.k:
+            return int(len(self.hashes))
+        return int(round((self.k - 1) * _MAX_HASH / float(self.hashes[self.k - 1])))
+
+
+def _order(items: Sequence[Tuple[Any, int]]) -> List[Tuple[Any, int]]:
+    """Most frequent first; ties in value order (as Series.mode), by str() for mixed types."""
+    try:
+        return sorted(items, key=lambda kv: (-kv[1], kv[0]))
+    except TypeError:
+        return sorted(items, key=lambda kv: (-kv[1], str(kv[0])))
+
+
+class TopValues:
+    """Value counts bounded to `capacity` entries, keeping the most frequent on overflow."""
+
+    def __init__(self, capacity: int = TOPK_CAPACITY):
+        self.capacity = capacity
+        self.counts: Dict[Any, int] = {}
+
+    def update(self, values: pd.Series) -> None:
+        for v, n in values.value_counts(dropna=True, sort=False).items():
+            v = v.item() if isinstance(v, np.generic) else v
+            self.counts[v] = self.counts.get(v, 0) + int(n)
+        if len(self.counts) > self.capacity:
+            self.counts = dict(_order(list(self.counts.items()))[:self.capacity])
+
+    def top(self, k: Optional[int] = None) -> List[Tuple[Any, int]]:
+        ordered = _order(list(self.counts.items()))
+        return ordered if k is None else ordered[:k]
+
+
+def _kind(dtype) -> str:
+    if pd.api.types.is_bool_dtype(dtype):
+        return "bool"
+    if pd.api.types.is_numeric_dtype(dtype):
+        return "numeric"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "datetime"
+    return "categorical"
+
+
+def _hashes(s: pd.Series, numeric: bool) -> np.ndarray:
+    # numeric values hash as float64 and everything else as text, so int / float or
+    # str / Timestamp chunks of the same column land on the same hashes
+    if numeric:
+        return pd.util.hash_array(s.to_numpy(dtype=np.float64))
+    return pd.util.hash_array(s.astype(str).to_numpy(dtype=object))
+
+
+class ColumnEntry:
+    """Running statistics of one column."""
+
+    def __init__(self, name: str, kind: str, dtype: str):
+        self.name, self.kind, self.dtype = name, kind, dtype
+        self.count = 0
+        self.nulls = 0
+        self.min: Any = None
+        self.max: Any = None
+        self.distinct_sketch = DistinctSketch()
+        self.stats = ColumnStats([name], k=SKETCH_K, exact_rows=EXACT_ROWS) if kind == "numeric" else None
+        self.values = TopValues() if kind != "numeric" else None
+
+    def update(self, s: pd.Series) -> None:
+        if self.kind == "numeric":
+            s = pd.to_numeric(s, errors="coerce")
+        present = s.dropna()
+        self.nulls += int(len(s) - len(present))
+        self.count += int(len(present))
+        if not len(present):
+            return
+        self.distinct_sketch.update(_hashes(present, self.kind == "numeric"))
+        if self.kind == "numeric":
+            x = present.to_numpy(dtype=np.float64)
+            self.stats.update_array(x[:, None])
+            lo, hi = float(x.min()), float(x.max())
+        else:
+            self.values.update(present)
+            if self.kind != "datetime":
+                return
+            lo, hi = present.min(), present.max()
+        self.min = lo if self.min is None else min(self.min, lo)
+        self.max = hi if self.max is None else max(self.max, hi)
+
+    # ---- read side ----
+    @property
+    def rows(self) -> int:
+        return self.count + self.nulls
+
+    def missing_pct(self) -> float:
+        return self.nulls / self.rows if self.rows else 0.0
+
+    def distinct(self) -> int:
+        # the KMV estimate can overshoot; a column never has more distinct values than values
+        return min(self.distinct_sketch.estimate(), self.count)
+
+    def mean(self) -> Optional[float]:
+        return float(self.stats.mean[0]) if self.stats is not None and self.count else None
+
+    def std(self) -> Optional[float]:
+        """Sample standard deviation (ddof=1), as pandas."""
+        if self.stats is None or self.count < 2:
+            return None
+        return float(np.sqrt(self.stats.m2[0] / (self.count - 1)))
+
+    def quantile(self, q: float) -> Optional[float]:
+        return float(self.stats.sketches[0].quantile(q)) if self.stats is not None and self.count else None
+
+    def top(self, k: Optional[int] = None) -> List[Tuple[Any, int]]:
+        return self.values.top(k) if self.values is not None else []
+
+    def mode(self) -> Any:
+        top = self.top(1)
+        return top[0][0] if top else None
+
+    def _weighted(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self.kind == "numeric":
+            return self.stats.sketches[0].weighted()
+        if self.kind == "bool":
+            counts = dict(self.values.counts)
+            return np.array([0.0, 1.0]), np.array([counts.get(False, 0), counts.get(True, 0)], dtype=np.int64)
+        raise TypeError(f"column {self.name!r} is not numeric")
+
+    def fraction_outside(self, low: float, high: float) -> float:
+        """Share of values below `low` or above `high`."""
+        items, weights = self._weighted()
+        total = weights.sum()
+        return float(weights[(items < low) | (items > high)].sum() / total) if total else 0.0
+
+    def histogram(self, bins: int = DEFAULT_BINS) -> Optional[Dict[str, Any]]:
+        """np.histogram-compatible {column, bins, counts}; exact while the sketch is."""
+        if not self.count:
+            return None
+        items, weights = self._weighted()
+        if self.kind == "numeric":
+            rng = (self.min, self.max)
+        else:
+            present = items[weights > 0]
+            rng = (float(present.min()), float(present.max()))
+        counts, edges = np.histogram(items, bins=bins, range=rng, weights=weights)
+        counts = counts * (self.count / max(weights.sum(), 1))
+        return {"column": self.name, "bins": edges.tolist(), "counts": np.rint(counts).astype(np.int64).tolist()}
+
+
+class ColumnCatalog:
+    """Column entries of one dataset in column order, plus a preview of its first rows."""
+
+    def __init__(self):
+        self.rows = 0
+        self.columns: Dict[str, ColumnEntry] = {}
+        self.preview = pd.DataFrame()
+        self.version: Optional[Hashable] = None
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame) -> "ColumnCatalog":
+        return cls().update(frame)
+
+    def update(self, frame: pd.DataFrame) -> "ColumnCatalog":
+        """Fold appended rows in; columns the catalog has not seen start counting here."""
+        for c in frame.columns:
+            name = str(c)
+            entry = self.columns.get(name)
+            if entry is None:
+                entry = self.columns[name] = ColumnEntry(name, _kind(frame[c].dtype), str(frame[c].dtype))
+                entry.nulls = self.rows               # absent from the earlier rows
+            entry.update(frame[c])
+        for name, entry in self.columns.items():
+            if name not in frame.columns:
+                entry.nulls += len(frame)
+        self.rows += int(len(frame))
+        if len(self.preview) < PREVIEW_ROWS:
+            self.preview = pd.concat([self.preview, frame.head(PREVIEW_ROWS - len(self.preview))], ignore_index=True)
+        return self
+
+    def numeric(self) -> List[str]:
+        return [c for c, e in self.columns.items() if e.kind == "numeric"]
+
+    def overview(self) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """analysis_service.dataframe_overview() of the whole dataset, from the catalog alone."""
+        entries = list(self.columns.values())
+        meta = {
+            "rows": self.rows,
+            "columns": len(entries),
+            "missing_pct": float(np.mean([e.missing_pct() for e in entries])) if entries and self.rows else 0.0,
+        }
+        numeric, categorical = [], []
+        for e in entries:
+            if e.kind == "numeric":
+                numeric.append({"column": e.name, "count": e.count, "mean": e.mean(), "std": e.std(),
+                                "min": e.min, "q25": e.quantile(0.25), "median": e.quantile(0.5),
+                                "q75": e.quantile(0.75), "max": e.max, "unique": e.distinct()})
+            elif e.kind == "bool":
+                numeric.append({"column": e.name, "count": e.count, "mean": None, "std": None, "min": None,
+                                "q25": None, "median": None, "q75": None, "max": None, "unique": e.distinct()})
+            else:
+                categorical.append({"column": e.name, "unique": e.distinct(), "top": e.mode(), "missing": e.nulls})
+        return meta, numeric, categorical
+
+    def summary(self) -> Dict[str, Any]:
+        """The /datasets/{id}/summary payload."""
+        meta, numeric, categorical = self.overview()
+        return {"meta": meta, "numeric": numeric, "categorical": categorical,
+                "sample": head_sample(self.preview, limit=10)}
+
+    def histograms(self, columns: Optional[Sequence[str]] = None, bins: int = DEFAULT_BINS,
+                   limit: int = 10) -> List[Dict[str, Any]]:
+        """analysis_service.histograms_for_columns() from the catalog (unknown columns are skipped)."""
+        if columns is None:
+            columns = [c for c in self.numeric() if self.columns[c].count][:limit]
+        out = []
+        for c in columns:
+            e = self.columns.get(c)
+            if e is None or e.kind not in ("numeric", "bool"):
+                continue
+            h = e.histogram(bins)
+            if h is not None:
+                out.append(h)
+        return out
+
+
+# ---------------- sidecar ----------------
+_LOCK = threading.Lock()
+_LOADED: Dict[str, Tuple[Tuple[int, int], ColumnCatalog]] = {}
+
+
+def catalog_path(key: str) -> str:
+    return str(CATALOG_DIR / f"{key}.joblib")
+
+
+def _read(key: str) -> Optional[ColumnCatalog]:
+    path = catalog_path(key)
+    try:
+        sig = artifact_signature(path)
+    except OSError:
+        return None
+    with _LOCK:
+        hit = _LOADED.get(key)
+    if hit is not None and hit[0] == sig:
+        return hit[1]
+    try:
+        cat = joblib.load(path)
+    except Exception:
+        return None
+    with _LOCK:
+        _LOADED[key] = (sig, cat)
+    return cat
+
+
+def _write(key: str, cat: ColumnCatalog) -> None:
+    path = catalog_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    joblib.dump(cat, tmp)
+    os.replace(tmp, path)
+    with _LOCK:
+        _LOADED[key] = (artifact_signature(path), cat)
+
+
+def _discard(key: str) -> None:
+    try:
+        os.remove(catalog_path(key))
+    except OSError:
+        pass
+    with _LOCK:
+        _LOADED.pop(key, None)
+
+
+def _db_key(dataset_id: int) -> str:
+    return f"dataset_{int(dataset_id)}"
+
+
+def load(engine: Engine, dataset_id: int) -> Optional[ColumnCatalog]:
+    """The dataset's catalog, or None when there is none or rows changed without it."""
+    cat = _read(_db_key(dataset_id))
+    if cat is None or cat.version != patient_access.id_range(engine, int(dataset_id)):
+        return None
+    return cat
+
+
+def record(engine: Engine, dataset_id: int, frame: pd.DataFrame,
+           previous: Optional[Tuple[int, int]] = None) -> Optional[ColumnCatalog]:
+    """
+    Fold `frame`, the rows just inserted, into the dataset's catalog. `previous` is the id
+    range before the insert (None for a new dataset). When the stored catalog does not
+    describe `previous` it cannot be extended, and it is dropped.
+    """
+    key = _db_key(dataset_id)
+    if previous is None:
+        cat = ColumnCatalog()
+    else:
+        cat = _read(key)
+        if cat is None or cat.version != previous:
+            _discard(key)
+            return None
+    cat.update(frame)
+    cat.version = patient_access.id_range(engine, int(dataset_id))
+    _write(key, cat)
+    return cat
+
+
+def for_file(dataset_id: str, path: str, loader: Callable[[str], pd.DataFrame]) -> ColumnCatalog:
+    """Catalog of a file dataset; built with one load when the file is new or has changed."""
+    key = f"file_{dataset_id}"
+    st = os.stat(path)
+    version = (st.st_size, st.st_mtime_ns)
+    cat = _read(key)
+    if cat is None or cat.version != version:
+        cat = ColumnCatalog.from_frame(loader(path))
+        cat.version = version
+        _write(key, cat)
+    return cat
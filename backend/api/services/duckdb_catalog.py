@@ -0,0 +1,383 @@
+# backend/api/services/duckdb_catalog.py
+"""
+One long-lived DuckDB database for ad-hoc SQL over datasets.
+
+Each dataset is written once per version to a Parquet sidecar
+(artifacts/parquet/dataset_<id>.parquet, version stamped in the file's metadata) and
+bound as the temp view data_<id> on each query's own cursor, so a query can join
+datasets across hospitals. Every query also sees its own dataset as `data`. Later queries read the sidecar instead of
+pulling the rows out of Postgres again.
+
+Results are kept in a bounded LRU keyed by the normalized SQL and the versions of the
+datasets it reads, so a repeated dashboard query is answered from memory until one of
+those datasets changes.
+
+Every query runs under the database's memory_limit / threads settings and a timeout
+(the cursor is interrupted). The SQL must parse as exactly one SELECT, and the
+configuration is locked with file access limited to the sidecar directory, so a query
+cannot change the limits or touch other files. JSON responses are paged with LIMIT / OFFSET behind opaque page tokens; large
+results stream as Arrow or NDJSON record batch by record batch.
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+from collections import OrderedDict
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+
+import pandas as pd
+
+from ...paths import ARTIFACT_DIR
+from ...ml_library.common.compiled_forest import artifact_signature
+from ...utils.fast_json import ndjson_line
+from ...utils.process_stats import memory_usage
+from .analysis_service import result_rows
+
+SIDECAR_DIR = ARTIFACT_DIR / "parquet"
+# ":memory:" keeps the database per process; a file path lets DuckDB spill to disk
+# (DuckDB allows one writing process per file).
+DATABASE = os.environ.get("DUCKDB_DATABASE", ":memory:")
+RESULT_CACHE_SIZE = int(os.environ.get("DUCKDB_RESULT_CACHE", "128"))
+# Larger results are returned but not cached.
+RESULT_CACHE_MAX_ROWS = int(os.environ.get("DUCKDB_RESULT_CACHE_MAX_ROWS", "100000"))
+
+# Resource limits for every ad-hoc query.
+TIMEOUT_S = float(os.environ.get("ADHOC_TIMEOUT_S", "30"))
+MEMORY_LIMIT = os.environ.get("ADHOC_MEMORY_LIMIT", "1GB")
+THREADS = int(os.environ.get("ADHOC_THREADS", "2"))
+# Rows per page of a JSON response, and the most a client may ask for.
+PAGE_ROWS = int(os.environ.get("ADHOC_PAGE_ROWS", "1000"))
+MAX_PAGE_ROWS = int(os.environ.get("ADHOC_MAX_PAGE_ROWS", "10000"))
+STREAM_BATCH_ROWS = int(os.environ.get("ADHOC_STREAM_BATCH_ROWS", "10000"))
+
+VERSION_KEY = b"healytics.version"
+_DATASET_REF = re.compile(r"\bdata_(\d+)\b", re.IGNORECASE)
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+
+_LOCK = threading.Lock()
+_CON = None
+_SIDECARS: Dict[int, Tuple[Tuple[int, int], Tuple[Optional[str], int]]] = {}
+_RESULTS: "OrderedDict[Hashable, Tuple[List[str], List[List[Any]], bool]]" = OrderedDict()
+_STATS = {"hits": 0, "misses": 0, "sidecars_written": 0}
+
+
+def _connection():
+    global _CON
+    with _LOCK:
+        if _CON is None:
+            import duckdb
+            con = duckdb.connect(DATABASE)
+            # database-wide, so every cursor runs under them
+            con.execute(f"SET memory_limit = '{MEMORY_LIMIT}'")
+            con.execute(f"SET threads = {int(THREADS)}")
+            # files only under the sidecar directory, no Python variables as tables, and no
+            # further SET from any cursor
+            os.makedirs(SIDECAR_DIR, exist_ok=True)
+            sidecars = (os.path.abspath(SIDECAR_DIR) + os.sep).replace("'", "''")
+            con.execute(f"SET allowed_directories = ['{sidecars}']")
+            con.execute("SET python_enable_replacements = false")
+            con.execute("SET enable_external_access = false")
+            con.execute("SET lock_configuration = true")
+            _CON = con
+        return _CON
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+def sidecar_path(dataset_id: int) -> str:
+    return str(SIDECAR_DIR / f"dataset_{int(dataset_id)}.parquet")
+
+
+def _sidecar_info(dataset_id: int) -> Tuple[Optional[str], int]:
+    """(version stamp, row count) of the sidecar, read from its footer once per file signature."""
+    path = sidecar_path(dataset_id)
+    try:
+        sig = artifact_signature(path)
+    except OSError:
+        return None, 0
+    with _LOCK:
+        hit = _SIDECARS.get(dataset_id)
+    if hit is not None and hit[0] == sig:
+        return hit[1]
+    import pyarrow.parquet as pq
+    md = pq.ParquetFile(path).metadata
+    meta = md.metadata or {}
+    info = (meta[VERSION_KEY].decode() if VERSION_KEY in meta else None, int(md.num_rows))
+    with _LOCK:
+        _SIDECARS[dataset_id] = (sig, info)
+    return info
+
+
+def _stamp(version: Hashable) -> str:
+    """A dataset version as text: (12, 40) and [12, 40] are the same version."""
+    return json.dumps(list(version) if isinstance(version, tuple) else version, default=str)
+
+
+def write_sidecar(dataset_id: int, frame: pd.DataFrame, version: Hashable) -> str:
+    """Write `frame` as the dataset's sidecar; dict / list cells (payload) become JSON text."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    frame = frame.copy()
+    for c in frame.columns:
+        if frame[c].dtype == object and frame[c].map(lambda v: isinstance(v, (dict, list))).any():
+            frame[c] = frame[c].map(lambda v: json.dumps(v, default=str) if isinstance(v, (dict, list)) else v)
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    meta = dict(table.schema.metadata or {})
+    meta[VERSION_KEY] = _stamp(version).encode()
+    table = table.replace_schema_metadata(meta)
+    path = sidecar_path(dataset_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    pq.write_table(table, tmp)
+    os.replace(tmp, path)
+    with _LOCK:
+        _STATS["sidecars_written"] += 1
+    return path
+
+
+def attach(cur, dataset_id: int, version: Hashable, loader: Callable[[int], pd.DataFrame]) -> int:
+    """
+    Bind data_<id> on cursor `cur` to the sidecar for `version`, writing the sidecar from
+    loader(id) when needed. Returns the dataset's row count.
+    """
+    if _sidecar_info(dataset_id)[0] != _stamp(version):
+        write_sidecar(dataset_id, loader(dataset_id), version)
+    # a temp view lives and dies with the cursor: nothing a query does outlasts its request
+    path = os.path.abspath(sidecar_path(dataset_id)).replace("'", "''")
+    cur.execute(f"CREATE OR REPLACE TEMP VIEW data_{int(dataset_id)} AS SELECT * FROM read_parquet('{path}')")
+    return _sidecar_info(dataset_id)[1]
+
+
+def referenced(sql: str, dataset_id: int) -> List[int]:
+    """The query's own dataset plus every data_<id> it names."""
+    ids = {int(dataset_id)}
+    for part in _QUOTED.split(sql)[::2]:             # outside string literals
+        ids.update(int(m) for m in _DATASET_REF.findall(part))
+    return sorted(ids)
+
+
+def normalize_sql(sql: str) -> str:
+    """Whitespace collapsed outside quotes and trailing semicolons dropped."""
+    parts = _QUOTED.split(sql.strip().rstrip(";").strip())
+    return "".join(p if i % 2 else " ".join(p.split()) for i, p in enumerate(parts)).strip()
+
+
+class _Deadline:
+    """Interrupts the cursor's running query once `seconds` have passed."""
+
+    def __init__(self, cur, seconds: float):
+        self.fired = threading.Event()
+
+        def _interrupt():
+            self.fired.set()
+            cur.interrupt()
+
+        self._timer = threading.Timer(seconds, _interrupt)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def check(self, exc: Exception) -> None:
+        """Re-raise an interrupted query as QueryTimeout."""
+        if self.fired.is_set():
+            raise QueryTimeout(f"query exceeded {TIMEOUT_S:g}s") from exc
+
+    def cancel(self) -> None:
+        self._timer.cancel()
+
+
+def _single_select(sql: str) -> str:
+    """The text of sql's only statement; ValueError unless it is exactly one SELECT."""
+    import duckdb
+    try:
+        statements = duckdb.extract_statements(sql)
+    except duckdb.ParserException as e:
+        raise ValueError(f"SQL does not parse: {e}")
+    if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+        raise ValueError("only a single SELECT statement is allowed")
+    return statements[0].query
+
+
+def _wrap(sql: str) -> str:
+    """sql as a subquery, for paging; the wrapped text is checked again as a whole."""
+    wrapped = f"SELECT * FROM ({_single_select(sql).strip().rstrip(';')}\n) AS adhoc"
+    _single_select(wrapped)
+    return wrapped
+
+
+def _digest(sql: str, dataset_id: int) -> str:
+    return hashlib.sha1(f"{dataset_id}\0{normalize_sql(sql)}".encode()).hexdigest()[:16]
+
+
+def page_token(sql: str, dataset_id: int, offset: int) -> str:
+    raw = json.dumps({"q": _digest(sql, dataset_id), "o": int(offset)}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def token_offset(token: Optional[str], sql: str, dataset_id: int) -> int:
+    """Row offset a page token points at; ValueError when it belongs to another query."""
+    if not token:
+        return 0
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        q, offset = str(raw["q"]), int(raw["o"])
+    except Exception:
+        raise ValueError("malformed cursor")
+    if q != _digest(sql, dataset_id) or offset < 0:
+        raise ValueError("cursor belongs to a different query")
+    return offset
+
+
+def _page(cur, sql: str, offset: int, page_rows: int) -> Tuple[List[str], List[List[Any]], bool]:
+    """One page of the wrapped query; one extra row tells whether another page follows."""
+    deadline = _Deadline(cur, TIMEOUT_S)
+    try:
+        res = cur.execute(f"{_wrap(sql)} LIMIT {int(page_rows) + 1} OFFSET {int(offset)}").fetchdf()
+    except Exception as e:
+        deadline.check(e)
+        raise
+    finally:
+        deadline.cancel()
+    more = len(res) > page_rows
+    cols, rows = result_rows(res.iloc[:page_rows])
+    return cols, rows, more
+
+
+def _stats(t0: float, rows: int, scanned: int, cached: bool) -> Dict[str, Any]:
+    return {"elapsed_ms": round((time.perf_counter() - t0) * 1000, 3), "rows_returned": rows,
+            "rows_scanned": scanned, "cached": cached, "peak_rss_mb": memory_usage()["peak_rss_mb"],
+            "memory_limit": MEMORY_LIMIT, "timeout_s": TIMEOUT_S}
+
+
+def _cache_get(key: Hashable) -> Optional[Tuple[List[str], List[List[Any]], bool]]:
+    with _LOCK:
+        hit = _RESULTS.get(key)
+        if hit is not None:
+            _RESULTS.move_to_end(key)
+            _STATS["hits"] += 1
+        else:
+            _STATS["misses"] += 1
+        return hit
+
+
+def _cache_put(key: Hashable, value: Tuple[List[str], List[List[Any]], bool]) -> None:
+    if RESULT_CACHE_SIZE <= 0 or len(value[1]) > RESULT_CACHE_MAX_ROWS:
+        return
+    with _LOCK:
+        _RESULTS[key] = value
+        _RESULTS.move_to_end(key)
+        while len(_RESULTS) > RESULT_CACHE_SIZE:
+            _RESULTS.popitem(last=False)
+
+
+def _bind(cur, dataset_id: int, versions: Dict[int, Hashable], loader: Callable[[int], pd.DataFrame]) -> int:
+    """Attach every dataset the query reads and bind `data`; returns their total rows."""
+    scanned = sum(attach(cur, i, v, loader) for i, v in versions.items())
+    cur.execute(f"CREATE OR REPLACE TEMP VIEW data AS SELECT * FROM data_{int(dataset_id)}")
+    return scanned
+
+
+def query(sql: str, dataset_id: int, versions: Dict[int, Hashable], loader: Callable[[int], pd.DataFrame],
+          page_rows: int = PAGE_ROWS, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    One page of `sql` with `data` bound to dataset_id. `versions` holds the current version
+    of every dataset in referenced(sql, dataset_id); loader(id) returns a dataset's rows
+    when its sidecar has to be (re)written. `cursor` is the previous page's next_cursor.
+    """
+    t0 = time.perf_counter()
+    page_rows = max(1, min(int(page_rows), MAX_PAGE_ROWS))
+    offset = token_offset(cursor, sql, dataset_id)
+    key = (normalize_sql(sql), int(dataset_id), tuple(sorted((int(i), _stamp(v)) for i, v in versions.items())),
+           offset, page_rows)
+    hit = _cache_get(key)
+    cached, scanned = hit is not None, 0
+    if not cached:
+        cur = _connection().cursor()
+        try:
+            scanned = _bind(cur, dataset_id, versions, loader)
+            hit = _page(cur, sql, offset, page_rows)
+        finally:
+            cur.close()
+        _cache_put(key, hit)
+    cols, rows, more = hit
+    return {"columns": cols, "rows": rows,
+            "next_cursor": page_token(sql, dataset_id, offset + len(rows)) if more else None,
+            "stats": _stats(t0, len(rows), scanned, cached)}
+
+
+def query_frame(df: pd.DataFrame, sql: str, dataset_id: int, page_rows: int = PAGE_ROWS,
+                cursor: Optional[str] = None) -> Dict[str, Any]:
+    """query() over an in-memory frame (a dataset that is not in the database); never cached."""
+    t0 = time.perf_counter()
+    page_rows = max(1, min(int(page_rows), MAX_PAGE_ROWS))
+    offset = token_offset(cursor, sql, dataset_id)
+    cur = _connection().cursor()
+    try:
+        cur.register("data", df)
+        cols, rows, more = _page(cur, sql, offset, page_rows)
+    finally:
+        cur.close()
+    return {"columns": cols, "rows": rows,
+            "next_cursor": page_token(sql, dataset_id, offset + len(rows)) if more else None,
+            "stats": _stats(t0, len(rows), len(df), False)}
+
+
+def stream(sql: str, dataset_id: int, versions: Dict[int, Hashable], loader: Callable[[int], pd.DataFrame],
+           fmt: str = "ndjson", frame: Optional[pd.DataFrame] = None) -> Iterator[bytes]:
+    """
+    The whole result as an Arrow IPC stream (fmt="arrow") or NDJSON rows followed by a
+    {"stats": ...} line, one record batch at a time. `frame` replaces the catalog for a
+    dataset that is not in the database. The timeout covers the whole stream.
+    """
+    import pyarrow as pa
+    t0 = time.perf_counter()
+    cur = _connection().cursor()
+    deadline = None
+    rows = 0
+    try:
+        if frame is not None:
+            cur.register("data", frame)
+            scanned = len(frame)
+        else:
+            scanned = _bind(cur, dataset_id, versions, loader)
+        deadline = _Deadline(cur, TIMEOUT_S)
+        try:
+            res = cur.execute(_wrap(sql))
+            reader = (res.to_arrow_reader(STREAM_BATCH_ROWS) if hasattr(res, "to_arrow_reader")
+                      else res.fetch_record_batch(STREAM_BATCH_ROWS))
+            sink = io.BytesIO()
+            writer = pa.ipc.new_stream(sink, reader.schema) if fmt == "arrow" else None
+            for batch in reader:
+                rows += batch.num_rows
+                if writer is not None:
+                    writer.write_batch(batch)
+                    data = sink.getvalue()
+                    sink.seek(0)
+                    sink.truncate()
+                    yield data
+                else:
+                    yield b"".join(ndjson_line(r) for r in batch.to_pylist())
+        except Exception as e:
+            deadline.check(e)
+            raise
+        if writer is not None:
+            writer.close()
+            yield sink.getvalue()
+        else:
+            yield ndjson_line({"stats": _stats(t0, rows, scanned, False)})
+    finally:
+        if deadline is not None:
+            deadline.cancel()
+        cur.close()
+
+
+def stats() -> Dict[str, Any]:
+    with _LOCK:
+        return {**_STATS, "cached_results": len(_RESULTS), "sidecars": sorted(_SIDECARS)}
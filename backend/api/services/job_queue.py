@@ -0,0 +1,194 @@
+# backend/api/services/job_queue.py
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Hashable, List, Optional
+import heapq
+import itertools
+import os
+import threading
+import time
+import traceback
+import uuid
+
+# Analysis jobs are CPU-bound (model scoring, IsolationForest); one worker by default
+# so two runs do not fight over the same cores.
+MAX_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", "1"))
+# Finished jobs kept for status queries.
+KEEP_FINISHED = int(os.environ.get("ANALYSIS_JOBS_KEEP", "200"))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINAL = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job at its next checkpoint after cancel() was requested."""
+
+
+class Job:
+    def __init__(self, fn: Callable[["Job"], Any], key: Optional[Hashable], priority: int, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.fn = fn
+        self.key = key
+        self.priority = priority
+        self.params = params
+        self.status = QUEUED
+        self.stage: Optional[str] = None
+        self.progress = 0.0
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.exception: Optional[BaseException] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.coalesced = 0
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    # ---- called from inside the job ----
+    def set_stage(self, stage: str, progress: float = 0.0) -> None:
+        self.check_cancelled()
+        self.stage = stage
+        self.progress = max(0.0, min(1.0, float(progress)))
+
+    def check_cancelled(self) -> None:
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 4),
+            "priority": self.priority,
+            "params": self.params,
+            "coalesced_requests": self.coalesced,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "result": self.result if self.status == SUCCEEDED else None,
+        }
+
+
+class JobQueue:
+    """
+    Priority queue drained by a fixed pool of worker threads.
+
+    Higher priority runs first, FIFO within a priority. Submitting a job whose `key`
+    matches a queued or running job that is not being cancelled returns that job
+    instead of a new one. Cancelling a queued job removes it; a running job stops at
+    its next `set_stage` / `check_cancelled` checkpoint.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS, keep_finished: int = KEEP_FINISHED):
+        self.max_workers = max(1, max_workers)
+        self.keep_finished = keep_finished
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._jobs: Dict[str, Job] = {}
+        self._active: Dict[Hashable, Job] = {}
+        self._finished: List[str] = []
+        self._workers: List[threading.Thread] = []
+
+    def _ensure_workers(self) -> None:
+        # started lazily so importing the module does not spawn threads
+        while len(self._workers) < self.max_workers:
+            t = threading.Thread(target=self._worker, name=f"analysis-worker-{len(self._workers)}", daemon=True)
+            self._workers.append(t)
+            t.start()
+
+    def submit(self, fn: Callable[[Job], Any], key: Optional[Hashable] = None, priority: int = 0,
+               params: Optional[Dict[str, Any]] = None) -> tuple:
+        """Returns (job, coalesced)."""
+        with self._lock:
+            if key is not None:
+                live = self._active.get(key)
+                if live is not None and live.status not in FINAL and not live.cancel_requested:
+                    live.coalesced += 1
+                    return live, True
+            job = Job(fn, key, priority, params or {})
+            self._jobs[job.id] = job
+            if key is not None:
+                self._active[key] = job
+            heapq.heappush(self._heap, (-priority, next(self._seq), job.id))
+            self._ensure_workers()
+            self._wake.notify()
+        return job, False
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [j.as_dict() for j in sorted(jobs, key=lambda j: j.created_at, reverse=True)]
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINAL:
+                return job
+            job._cancel.set()
+            if job.status == QUEUED:
+                # stays in the heap; the worker skips it
+                self._finish(job, CANCELLED)
+        return job
+
+    def _finish(self, job: Job, status: str) -> None:
+        """Caller holds the lock."""
+        job.status = status
+        job.finished_at = time.time()
+        if job.key is not None and self._active.get(job.key) is job:
+            del self._active[job.key]
+        self._finished.append(job.id)
+        while len(self._finished) > self.keep_finished:
+            self._jobs.pop(self._finished.pop(0), None)
+        job._done.set()
+
+    def _worker(self) -> None:
+        while True:
+            with self._lock:
+                while not self._heap:
+                    self._wake.wait()
+                _, _, job_id = heapq.heappop(self._heap)
+                job = self._jobs.get(job_id)
+                if job is None or job.status != QUEUED:
+                    continue
+                job.status = RUNNING
+                job.started_at = time.time()
+            try:
+                result = job.fn(job)
+            except JobCancelled:
+                with self._lock:
+                    self._finish(job, CANCELLED)
+            except BaseException as e:
+                job.exception = e
+                job.error = getattr(e, "detail", None) or f"{e.__class__.__name__}: {e}"
+                traceback.print_exc()
+                with self._lock:
+                    self._finish(job, FAILED)
+            else:
+                job.result = result
+                job.progress = 1.0
+                with self._lock:
+                    self._finish(job, SUCCEEDED)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for j in self._jobs.values():
+                counts[j.status] = counts.get(j.status, 0) + 1
+            return {"workers": self.max_workers, "jobs": counts}
+
+
+analysis_jobs = JobQueue()
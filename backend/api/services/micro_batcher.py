@@ -0,0 +1,157 @@
+# backend/api/services/micro_batcher.py
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import Counter, deque
+import asyncio
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from starlette.concurrency import run_in_threadpool
+
+from . import prediction_service
+
+ScoreFn = Callable[[str, pd.DataFrame], Tuple[str, np.ndarray]]
+RecordFn = Callable[[str, Dict[str, Any]], Tuple[str, float]]
+
+MAX_WAIT_MS = float(os.environ.get("MICROBATCH_MAX_WAIT_MS", "3"))
+MAX_BATCH = int(os.environ.get("MICROBATCH_MAX_BATCH", "64"))
+
+
+def _bucket(n: int) -> str:
+    """Power-of-two histogram buckets: 1, 2, 3-4, 5-8, ..."""
+    if n <= 2:
+        return str(n)
+    hi = 1 << (n - 1).bit_length()
+    return f"{hi // 2 + 1}-{hi}"
+
+
+class _Pending:
+    __slots__ = ("rows", "futures", "timer")
+
+    def __init__(self) -> None:
+        self.rows: List[Dict[str, Any]] = []
+        self.futures: List[asyncio.Future] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-row scoring requests for the same model.
+
+    The first request for a model opens a batch; the batch is scored when it reaches
+    `max_batch` rows or `max_wait_ms` after it opened, whichever comes first. Scoring
+    runs in the threadpool as one vectorized call and each caller gets its own row back;
+    a batch of one goes to `record_fn` (the pandas-free single-row path) when given.
+    When a batch fails, its rows are scored one by one, so only the callers whose own
+    record fails get the error. All bookkeeping happens on the event loop, so no locks are needed.
+    """
+
+    def __init__(self, score_fn: ScoreFn, record_fn: Optional[RecordFn] = None,
+                 max_wait_ms: float = MAX_WAIT_MS, max_batch: int = MAX_BATCH):
+        self.score_fn = score_fn
+        self.record_fn = record_fn
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._pending: Dict[str, _Pending] = {}
+        self._tasks: set = set()
+        self._latency: deque = deque(maxlen=4096)
+        self._batch_sizes: Counter = Counter()
+        self._requests = 0
+        self._batches = 0
+        self._errors = 0
+
+    async def submit(self, model_name: str, record: Dict[str, Any]) -> Tuple[str, float]:
+        """Score one patient record. Returns (kind, value) as score_fn defines them."""
+        loop = asyncio.get_running_loop()
+        t0 = time.perf_counter()
+        fut = loop.create_future()
+        p = self._pending.get(model_name)
+        if p is None:
+            p = self._pending[model_name] = _Pending()
+            p.timer = loop.call_later(self.max_wait, self._flush, model_name)
+        p.rows.append(record)
+        p.futures.append(fut)
+        self._requests += 1
+        if len(p.rows) >= self.max_batch:
+            self._flush(model_name)
+        try:
+            return await fut
+        finally:
+            self._latency.append(time.perf_counter() - t0)
+
+    def _flush(self, model_name: str) -> None:
+        p = self._pending.pop(model_name, None)
+        if p is None:
+            return
+        if p.timer is not None:
+            p.timer.cancel()
+        task = asyncio.ensure_future(self._run(model_name, p))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, model_name: str, p: _Pending) -> None:
+        n = len(p.rows)
+        self._batches += 1
+        self._batch_sizes[_bucket(n)] += 1
+        try:
+            if n == 1 and self.record_fn is not None:
+                kind, value = await run_in_threadpool(self.record_fn, model_name, p.rows[0])
+                values = [value]
+            else:
+                kind, values = await run_in_threadpool(self.score_fn, model_name, pd.DataFrame(p.rows))
+        except Exception as e:
+            if n == 1:
+                self._errors += 1
+                if not p.futures[0].done():
+                    p.futures[0].set_exception(e)
+                return
+            # one malformed record must not fail the requests batched with it
+            results = await run_in_threadpool(self._score_each, model_name, p.rows)
+            for f, r in zip(p.futures, results):
+                if isinstance(r, Exception):
+                    self._errors += 1
+                    if not f.done():
+                        f.set_exception(r)
+                elif not f.done():
+                    f.set_result((r[0], float(r[1])))
+            return
+        for f, v in zip(p.futures, values):
+            if not f.done():    # caller may have been cancelled (client went away)
+                f.set_result((kind, float(v)))
+
+    def _score_each(self, model_name: str, rows: List[Dict[str, Any]]) -> List[Any]:
+        """Each row scored on its own after its batch failed: (kind, value) or the row's exception."""
+        out: List[Any] = []
+        for row in rows:
+            try:
+                if self.record_fn is not None:
+                    out.append(self.record_fn(model_name, row))
+                else:
+                    kind, values = self.score_fn(model_name, pd.DataFrame([row]))
+                    out.append((kind, values[0]))
+            except Exception as e:
+                out.append(e)
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        lat = np.fromiter(self._latency, dtype=float) * 1000.0
+        return {
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_batch": self.max_batch,
+            "requests": self._requests,
+            "batches": self._batches,
+            "errors": self._errors,
+            "mean_batch_size": round(self._requests / self._batches, 2) if self._batches else None,
+            "batch_size_histogram": dict(sorted(self._batch_sizes.items(), key=lambda kv: int(kv[0].split("-")[0]))),
+            "latency_ms": {
+                "n": int(lat.size),
+                "p50": round(float(np.percentile(lat, 50)), 3) if lat.size else None,
+                "p99": round(float(np.percentile(lat, 99)), 3) if lat.size else None,
+            },
+        }
+
+
+batcher = MicroBatcher(prediction_service.score_frame, prediction_service.score_record)
@@ -0,0 +1,238 @@
+# backend/api/services/model_cache.py
+from __future__ import annotations
+
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import os
+import glob
+import time
+import threading
+from pathlib import Path
+
+import joblib
+import numpy as np
+
+from ...paths import ARTIFACT_DIR, COMPILED_DIR
+from ...ml_library.common.compiled_forest import load_compiled, is_current, artifact_signature
+
+# Compiled twins are plain numpy arrays, so they are mapped read-only: every worker
+# process shares the same page-cache copy of the tree arrays. sklearn pipelines are
+# loaded normally (sklearn's Tree copies its node arrays on unpickle anyway).
+MMAP_MODE: Optional[str] = os.environ.get("MODEL_MMAP_MODE", "r") or None
+
+# Budget for resident pipelines, measured by artifact size on disk (a close proxy for
+# the unpickled size of tree ensembles). Memory-mapped compiled twins are not counted:
+# their pages belong to the page cache and are shared between workers.
+MAX_BYTES = int(float(os.environ.get("MODEL_CACHE_MAX_MB", "1024")) * 1e6)
+
+# INFERENCE_DTYPE=float32 scores in single precision: compiled twins are converted on
+# load and pipelines build their feature matrix in float32, so feature matrices and
+# score arrays take half the memory. Validate first with scripts/validate_float32.py.
+FLOAT32 = os.environ.get("INFERENCE_DTYPE", "float64").lower() == "float32"
+SCORE_DTYPE = np.float32 if FLOAT32 else np.float64
+
+
+@dataclass
+class _Entry:
+    obj: Any
+    signature: Tuple[int, int]        # (size, mtime_ns) of the file it was loaded from
+    nbytes: int
+    loaded_at: float
+
+
+@dataclass
+class _Counters:
+    hits: int = 0
+    loads: int = 0
+    reloads: int = 0
+    evictions: int = 0
+    errors: int = 0
+    load_seconds: List[float] = field(default_factory=list)
+
+    def as_dict(self) -> Dict[str, Any]:
+        secs = self.load_seconds
+        return {
+            "hits": self.hits,
+            "loads": self.loads,
+            "reloads": self.reloads,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "last_load_seconds": round(secs[-1], 4) if secs else None,
+            "max_load_seconds": round(max(secs), 4) if secs else None,
+            "total_load_seconds": round(sum(secs), 4),
+        }
+
+
+_LOCK = threading.Lock()
+_MODELS: "OrderedDict[str, _Entry]" = OrderedDict()     # LRU order, oldest first
+_COMPILED: Dict[str, _Entry] = {}
+_LOAD_LOCKS: Dict[str, threading.Lock] = {}
+_COUNTERS: Dict[str, _Counters] = {}
+_PRELOAD: Dict[str, Any] = {}
+
+
+def artifact_path(model_name: str) -> Optional[str]:
+    """Resolve a model artifact path robustly."""
+    safe = "".join(c if c.isalnum() or c in ("-", "_") else "_" for c in model_name)
+    candidates = [
+        ARTIFACT_DIR / "models" / f"{model_name}.joblib",
+        ARTIFACT_DIR / "models" / f"{safe}.joblib",
+    ]
+    for p in candidates:
+        if Path(p).exists():
+            return str(p)
+    hits = glob.glob(str(ARTIFACT_DIR / "models" / f"*{safe}*.joblib"))
+    return hits[0] if hits else None
+
+
+def _counters(key: str) -> _Counters:
+    c = _COUNTERS.get(key)
+    if c is None:
+        with _LOCK:
+            c = _COUNTERS.setdefault(key, _Counters())
+    return c
+
+
+def _load_lock(key: str) -> threading.Lock:
+    with _LOCK:
+        return _LOAD_LOCKS.setdefault(key, threading.Lock())
+
+
+def _evict_over_budget(keep: str) -> None:
+    """Drop least-recently-used pipelines until the budget holds. Caller holds _LOCK."""
+    total = sum(e.nbytes for e in _MODELS.values())
+    for key in list(_MODELS):
+        if total <= MAX_BYTES:
+            break
+        if key == keep:
+            continue
+        total -= _MODELS.pop(key).nbytes
+        _COUNTERS.setdefault(key, _Counters()).evictions += 1
+
+
+def _fresh(cache, key: str, sig: Tuple[int, int]) -> Optional[_Entry]:
+    entry = cache.get(key)
+    if entry is not None and entry.signature == sig:
+        return entry
+    return None
+
+
+def _get(cache, key: str, loader) -> Any:
+    """
+    Return the cached object for `key`, (re)loading it when the file on disk changed.
+    The new object replaces the old one in a single dict assignment, so requests that
+    already hold the previous version finish with it.
+    """
+    sig = artifact_signature(key)
+    cnt = _counters(key)
+    entry = _fresh(cache, key, sig)
+    if entry is None:
+        with _load_lock(key):
+            # another thread may have loaded it while we waited
+            sig = artifact_signature(key)
+            entry = _fresh(cache, key, sig)
+            if entry is None:
+                replacing = key in cache
+                t0 = time.perf_counter()
+                try:
+                    obj = loader(key)
+                except Exception:
+                    cnt.errors += 1
+                    raise
+                cnt.load_seconds.append(time.perf_counter() - t0)
+                del cnt.load_seconds[:-100]
+                cnt.loads += 1
+                cnt.reloads += int(replacing)
+                entry = _Entry(obj=obj, signature=sig, nbytes=sig[0], loaded_at=time.time())
+                with _LOCK:
+                    cache[key] = entry
+                    if cache is _MODELS:
+                        _MODELS.move_to_end(key)
+                        _evict_over_budget(keep=key)
+                return entry.obj
+    cnt.hits += 1
+    if cache is _MODELS:
+        with _LOCK:
+            if key in _MODELS:
+                _MODELS.move_to_end(key)
+    return entry.obj
+
+
+def _load_compiled(path: str):
+    compiled = load_compiled(path, mmap_mode=MMAP_MODE)
+    # the converted arrays are private copies, no longer shared through the page cache
+    return compiled.astype_float32() if FLOAT32 else compiled
+
+
+def get_model(model_name: str):
+    """Fitted pipeline for `model_name`; reloaded when the artifact is overwritten."""
+    pth = artifact_path(model_name)
+    if not pth:
+        raise FileNotFoundError(f"Model artifact not found: {model_name}. Train it first.")
+    return _get(_MODELS, pth, joblib.load)
+
+
+def get_compiled(model_name: str):
+    """
+    Flat-array twin of the artifact (scripts/compile_models.py), or None when it was
+    never exported or is older than the .joblib it was compiled from.
+    """
+    pth = artifact_path(model_name)
+    if not pth:
+        return None
+    cpath = COMPILED_DIR / Path(pth).name
+    if not cpath.exists():
+        return None
+    try:
+        compiled = _get(_COMPILED, str(cpath), _load_compiled)
+    except OSError:
+        return None
+    return compiled if is_current(compiled, pth) else None
+
+
+def preload(model_names: Iterable[str]) -> Dict[str, Any]:
+    """Load pipelines and compiled twins up front; records timings for /health."""
+    t0 = time.perf_counter()
+    loaded: List[str] = []
+    compiled: List[str] = []
+    missing: List[str] = []
+    errors: Dict[str, str] = {}
+    for m in dict.fromkeys(model_names):
+        try:
+            get_model(m)
+            loaded.append(m)
+            if get_compiled(m) is not None:
+                compiled.append(m)
+        except FileNotFoundError:
+            missing.append(m)
+        except Exception as e:
+            errors[m] = f"{e.__class__.__name__}: {e}"
+    _PRELOAD.update({
+        "loaded": loaded,
+        "compiled": compiled,
+        "missing": missing,
+        "errors": errors,
+        "seconds": round(time.perf_counter() - t0, 3),
+        "mmap_mode": MMAP_MODE,
+        "dtype": np.dtype(SCORE_DTYPE).name,
+    })
+    return dict(_PRELOAD)
+
+
+def stats() -> Dict[str, Any]:
+    with _LOCK:
+        models = {Path(k).stem: {"bytes": e.nbytes, "loaded_at": e.loaded_at} for k, e in _MODELS.items()}
+        compiled = [Path(k).stem for k in _COMPILED]
+        counters = {
+            ("compiled/" if Path(k).parent == COMPILED_DIR else "") + Path(k).stem: c.as_dict()
+            for k, c in _COUNTERS.items()
+        }
+    return {
+        "budget_bytes": MAX_BYTES,
+        "resident_bytes": sum(m["bytes"] for m in models.values()),
+        "cached_models": models,
+        "cached_compiled": compiled,
+        "counters": counters,
+        "preload": dict(_PRELOAD) or None,
+    }
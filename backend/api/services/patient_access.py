@@ -0,0 +1,162 @@
+# backend/api/services/patient_access.py
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Optional, Tuple
+from collections import OrderedDict
+import os
+import random
+import threading
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# (dataset_id, id) serves MIN/MAX(id) and id-range seeks; (dataset_id, patient_id) point lookups.
+# New tables get them from the datasets DDL; ensure_indexes() adds them to an existing table.
+INDEXES = (
+    ("idx_pr_dataset_id", "patient_records(dataset_id, id)"),
+    ("idx_pr_dataset_patient", "patient_records(dataset_id, patient_id)"),
+)
+# pg_advisory_lock key held while one process builds the indexes
+_INDEX_LOCK_KEY = 0x7061_7469_656E
+
+# Datasets whose frame + patient index stay in memory (LRU).
+MAX_DATASETS = int(os.environ.get("PATIENT_CACHE_DATASETS", "4"))
+
+_LOCK = threading.Lock()
+_FRAMES: "OrderedDict[int, _Indexed]" = OrderedDict()
+_STATS = {"hits": 0, "builds": 0}
+
+
+class _Indexed:
+    __slots__ = ("version", "frame", "positions")
+
+    def __init__(self, version: Tuple[int, int], frame: pd.DataFrame, positions: Dict[str, int]):
+        self.version = version
+        self.frame = frame
+        self.positions = positions
+
+
+def ensure_indexes(engine: Engine) -> None:
+    """
+    Create INDEXES on an existing patient_records. Called once at startup, off the
+    request path. On Postgres the build is CONCURRENTLY, so ingest keeps writing while it
+    runs; one process builds under an advisory lock (others skip), and an index left
+    invalid by an interrupted build is dropped and rebuilt.
+    """
+    if engine.dialect.name != "postgresql":
+        with engine.begin() as con:
+            for name, target in INDEXES:
+                con.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {target}"))
+        return
+    # CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as con:
+        if not con.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": _INDEX_LOCK_KEY}).scalar():
+            return
+        try:
+            for name, target in INDEXES:
+                invalid = con.execute(
+                    text("SELECT NOT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                         "WHERE c.relname = :n"),
+                    {"n": name},
+                ).scalar()
+                if invalid:
+                    con.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                con.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target}"))
+        finally:
+            con.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _INDEX_LOCK_KEY})
+
+
+def id_range(engine: Engine, dataset_id: int) -> Optional[Tuple[int, int]]:
+    """(min id, max id) of the dataset's rows: two index probes, independent of row count."""
+    with engine.begin() as con:
+        row = con.execute(
+            text("SELECT MIN(id) AS lo, MAX(id) AS hi FROM patient_records WHERE dataset_id=:d"),
+            {"d": int(dataset_id)},
+        ).mappings().first()
+    if not row or row["lo"] is None:
+        return None
+    return int(row["lo"]), int(row["hi"])
+
+
+def row_count(engine: Engine, dataset_id: int) -> int:
+    """Rows the dataset holds (an index-only count over (dataset_id, id))."""
+    with engine.begin() as con:
+        n = con.execute(text("SELECT COUNT(*) FROM patient_records WHERE dataset_id=:d"),
+                        {"d": int(dataset_id)}).scalar_one()
+    return int(n)
+
+
+def random_patient(engine: Engine, dataset_id: int) -> pd.DataFrame:
+    """
+    One random row without ORDER BY random(): draw an id in [min, max] and seek to the
+    first row at or after it. Uniform when a dataset's ids are dense, which bulk ingest
+    produces; rows right after a gap are proportionally more likely.
+    """
+    rng = id_range(engine, dataset_id)
+    if rng is None:
+        return pd.DataFrame()
+    pick = random.randint(*rng)
+    sql = text("SELECT * FROM patient_records WHERE dataset_id=:d AND id >= :r ORDER BY id LIMIT 1")
+    return pd.read_sql(sql, con=engine, params={"d": int(dataset_id), "r": pick})
+
+
+def _positions(frame: pd.DataFrame) -> Dict[str, int]:
+    if "patient_id" not in frame.columns:
+        return {}
+    ids = frame["patient_id"].astype(str).to_numpy()
+    # first occurrence wins, matching the old boolean-mask + iloc[0] lookup
+    uniq, first = np.unique(ids, return_index=True)
+    return dict(zip(uniq.tolist(), first.tolist()))
+
+
+def indexed_frame(engine: Engine, dataset_id: int, loader: Callable[[int], pd.DataFrame]) -> Optional[_Indexed]:
+    """
+    Dataset frame plus a patient_id -> row-position hash index, rebuilt only when the
+    dataset's id range changes (rows added or re-ingested). None when the dataset is
+    not in the database (file-registry datasets are not versioned).
+    """
+    try:
+        version = id_range(engine, dataset_id)
+    except Exception:
+        return None
+    if version is None:
+        return None
+    with _LOCK:
+        hit = _FRAMES.get(int(dataset_id))
+        if hit is not None and hit.version == version:
+            _FRAMES.move_to_end(int(dataset_id))
+            _STATS["hits"] += 1
+            return hit
+    frame = loader(int(dataset_id))
+    entry = _Indexed(version, frame, _positions(frame))
+    with _LOCK:
+        _FRAMES[int(dataset_id)] = entry
+        _FRAMES.move_to_end(int(dataset_id))
+        while len(_FRAMES) > MAX_DATASETS:
+            _FRAMES.popitem(last=False)
+        _STATS["builds"] += 1
+    return entry
+
+
+def find_patient(engine: Engine, dataset_id: int, patient_id: Any,
+                 loader: Callable[[int], pd.DataFrame]) -> Optional[pd.DataFrame]:
+    """Single-row frame for `patient_id`, or None. O(1) once the dataset is indexed."""
+    entry = indexed_frame(engine, dataset_id, loader)
+    if entry is None:
+        frame = loader(int(dataset_id))
+        entry = _Indexed((0, 0), frame, _positions(frame))
+    pos = entry.positions.get(str(patient_id))
+    if pos is None:
+        return None
+    return entry.frame.iloc[[pos]]
+
+
+def stats() -> Dict[str, Any]:
+    with _LOCK:
+        return {
+            **_STATS,
+            "datasets": {k: {"rows": len(v.frame), "patients": len(v.positions), "id_range": v.version}
+                         for k, v in _FRAMES.items()},
+        }
@@ -1,17 +1,16 @@
 # app/services/prediction_service.py
 from __future__ import annotations
 
-from typing import Dict, Any, List, Optional, Iterable
+from typing import Dict, Any, List, Optional, Iterable, Tuple
 import os
 import json
+import weakref
 from pathlib import Path
-import glob
 
 import numpy as np
 import pandas as pd
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
-from joblib import load as _load
 from sklearn.pipeline import Pipeline
 from sklearn.compose import ColumnTransformer
 
@@ -21,6 +20,8 @@ try:
 except Exception:
     ARTIFACT_DIR = Path("artifacts")
 
+from . import anomaly_engine, model_cache
+
 # -------------------------
 # Model groups
 # -------------------------
@@ -43,19 +44,7 @@ def _safe_make_dir(path: str | Path) -> None:
 
 
 def _artifact_path(model_name: str) -> Optional[str]:
-    """
-    Resolve a model artifact path robustly.
-    """
-    safe = "".join(c if c.isalnum() or c in ("-", "_") else "_" for c in model_name)
-    candidates = [
-        ARTIFACT_DIR / "models" / f"{model_name}.joblib",
-        ARTIFACT_DIR / "models" / f"{safe}.joblib",
-    ]
-    for p in candidates:
-        if Path(p).exists():
-            return str(p)
-    hits = glob.glob(str(ARTIFACT_DIR / "models" / f"*{safe}*.joblib"))
-    return hits[0] if hits else None
+    return model_cache.artifact_path(model_name)
 
 
 # -------------------------
@@ -120,6 +109,22 @@ def _all_column_transformers(model) -> List[ColumnTransformer]:
     return [node for node in _iter_objects(model) if isinstance(node, ColumnTransformer)]
 
 
+# fit-time schema per loaded model; walking the object graph costs more than scoring one row
+_SCHEMA_CACHE: "weakref.WeakKeyDictionary[Any, Optional[List[str]]]" = weakref.WeakKeyDictionary()
+
+
+def _cached_input_columns(model) -> Optional[List[str]]:
+    try:
+        return _SCHEMA_CACHE[model]
+    except KeyError:
+        pass
+    except TypeError:       # not weak-referenceable
+        return _expected_input_columns(model)
+    cols = _expected_input_columns(model)
+    _SCHEMA_CACHE[model] = cols
+    return cols
+
+
 def _expected_input_columns(model) -> Optional[List[str]]:
     """
     Return the union of ORIGINAL feature columns the ColumnTransformer(s) were fit on.
@@ -169,32 +174,89 @@ def _align_X_to_model(model, X: pd.DataFrame) -> pd.DataFrame:
     Ensure X contains every column the preprocessor expects; add missing as NaN
     and order columns to match fit-time schema. Extra columns are ignored.
     """
-    exp = _expected_input_columns(model)
+    exp = _cached_input_columns(model)
     if not exp:
         return X  # no CT found; use as-is
-
-    Xin = X.copy()
-    for c in exp:
-        if c not in Xin.columns:
-            Xin[c] = np.nan
-    return Xin[exp]
+    return X.reindex(columns=exp)
 
 
 # -------------------------
 # Model cache
 # -------------------------
-_MODEL_CACHE: dict[str, Any] = {}
+def _load_model_cached(model_name: str):
+    return model_cache.get_model(model_name)
 
 
-def _load_model_cached(model_name: str):
-    pth = _artifact_path(model_name)
-    if not pth:
-        raise FileNotFoundError(f"Model artifact not found: {model_name}. Train it first.")
-    mdl = _MODEL_CACHE.get(pth)
-    if mdl is None:
-        mdl = _load(pth)
-        _MODEL_CACHE[pth] = mdl
-    return mdl
+# The numpy traversal kernel beats sklearn's per-call overhead on small batches;
+# sklearn's Cython traversal wins again from roughly a thousand rows up.
+COMPILED_MAX_ROWS = int(os.environ.get("COMPILED_MAX_ROWS", "512"))
+
+
+# Rows preprocessed per step in float32 mode; bounds the float64 intermediate.
+FLOAT32_CHUNK_ROWS = int(os.environ.get("FLOAT32_CHUNK_ROWS", "8192"))
+
+
+def _float32_features(model, X: pd.DataFrame):
+    """
+    (final estimator, float32 feature matrix) for a Pipeline: preprocessing runs in
+    float64 chunk by chunk and each chunk is stored as float32, the precision the
+    forests split on anyway. None when the pipeline cannot be split or outputs sparse
+    matrices (XGBoost reads sparse zeros as missing, so densifying would change scores).
+    """
+    if not isinstance(model, Pipeline) or len(model.steps) < 2:
+        return None
+    pre, est = model[:-1], model.steps[-1][1]
+    out = None
+    for start in range(0, len(X), FLOAT32_CHUNK_ROWS):
+        Xt = pre.transform(X.iloc[start:start + FLOAT32_CHUNK_ROWS])
+        if not isinstance(Xt, np.ndarray):
+            return None
+        if out is None:
+            out = np.empty((len(X), Xt.shape[1]), dtype=np.float32)
+        out[start:start + len(Xt)] = Xt
+    return (est, out) if out is not None else None
+
+
+def scoring_model(model_name: str, model, X: pd.DataFrame):
+    """Pick the compiled model for small batches (it aligns columns itself), else the pipeline."""
+    compiled = model_cache.get_compiled(model_name) if len(X) <= COMPILED_MAX_ROWS else None
+    if compiled is not None:
+        return compiled, X
+    Xin = _align_X_to_model(model, X)
+    if model_cache.FLOAT32:
+        split = _float32_features(model, Xin)
+        if split is not None:
+            return split
+    return model, Xin
+
+
+def score_frame(model_name: str, X: pd.DataFrame) -> Tuple[str, np.ndarray]:
+    """
+    One vectorized call for every row of X. Returns (kind, values) where kind is
+    "classification" (positive-class probability), "decision" (raw margin, threshold 0)
+    or "regression".
+    """
+    scorer, Xin = scoring_model(model_name, _load_model_cached(model_name), X)
+    dtype = model_cache.SCORE_DTYPE
+    if hasattr(scorer, "predict_proba"):
+        return "classification", np.asarray(scorer.predict_proba(Xin)[:, 1], dtype=dtype)
+    if hasattr(scorer, "decision_function"):
+        return "decision", np.asarray(np.ravel(scorer.decision_function(Xin)), dtype=dtype)
+    if hasattr(scorer, "predict"):
+        return "regression", np.asarray(np.ravel(scorer.predict(Xin)), dtype=dtype)
+    raise TypeError(f"{model_name}: loaded artifact supports neither predict_proba, decision_function, nor predict.")
+
+
+def score_record(model_name: str, record: Dict[str, Any]) -> Tuple[str, float]:
+    """
+    Single-patient variant of score_frame. With a compiled twin the dict goes straight
+    into a numpy row (no DataFrame, no schema walk); otherwise falls back to score_frame.
+    """
+    compiled = model_cache.get_compiled(model_name)
+    if compiled is not None:
+        return compiled.kind, compiled.score_record(record)
+    kind, values = score_frame(model_name, pd.DataFrame([record]))
+    return kind, float(values[0])
 
 
 # -------------------------
@@ -298,36 +360,7 @@ def run_predictions_for_strategy(engine: Engine, dataset_id: int, parsed: Dict[s
         patients_detail.append(entry)
 
     # Simple anomaly flags (zscore + IQR)
-    anomaly_results: Dict[str, Any] = {"method": "zscore+iqr", "patients": []}
-    num_cols = X_base.select_dtypes(include=["number"]).columns.tolist()
-    if num_cols:
-        Xn = X_base[num_cols].copy()
-        Xn = Xn.fillna(Xn.median())
-        z = (Xn - Xn.mean()) / (Xn.std(ddof=0) + 1e-9)
-        z_flag = (z.abs() > 3).any(axis=1)
-        try:
-            q1, q3 = Xn.quantile(0.25), Xn.quantile(0.75)
-            iqr = (q3 - q1)
-            low, high = q1 - 1.5 * iqr, q3 + 1.5 * iqr
-            iqr_flag = ((Xn < low) | (Xn > high)).any(axis=1)
-        except Exception:
-            iqr_flag = pd.Series([False] * len(Xn), index=Xn.index)
-        flagged = (z_flag | iqr_flag)
-        anomaly_results["summary"] = {
-            "n_flagged": int(flagged.sum()),
-            "n_total": int(len(flagged)),
-            "method_components": ["zscore>3", "iqr_1.5"],
-        }
-        anomaly_results["patients"] = [
-            {
-                "patient_id": None if pd.isna(patient_ids.iloc[i]) else str(patient_ids.iloc[i]),
-                "zscore_any_gt3": bool(z_flag.iloc[i]),
-                "iqr_outlier": bool(iqr_flag.iloc[i]),
-            }
-            for i in range(len(Xn)) if flagged.iloc[i]
-        ]
-    else:
-        anomaly_results["summary"] = {"n_flagged": 0, "n_total": int(len(X_base)), "note": "no numeric columns"}
+    anomaly_results = anomaly_engine.zscore_iqr_report(X_base, patient_ids)
 
     # Write exports
     risk_results = {"models": model_summaries, "patients": patients_detail}
@@ -0,0 +1,173 @@
+# backend/api/services/pushdown_summary.py
+"""
+Dataset summaries and histograms computed inside PostgreSQL. Only aggregates cross the
+wire, not every patient row.
+
+summary() is one aggregate query over the dataset's rows: count, avg, stddev_samp,
+min / max, percentile_cont (linear, as pandas) and count(DISTINCT) per numeric column,
+and mode() / count(DISTINCT) / missing per other column. It returns the same shape as
+analysis_service.dataframe_overview on the SELECT * frame. histograms() is one min/max
+query plus one width_bucket pass: a LATERAL VALUES list turns each row into one
+(column, bucket) pair per column, so every histogram comes from a single scan. Payload
+keys can be histogrammed by name; JSON numbers are cast, other values are skipped.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import threading
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from .analysis_service import head_sample
+
+NUMERIC_TYPES = {"smallint", "integer", "bigint", "real", "double precision", "numeric"}
+# never summarized: the surrogate key and the JSON bag of extra columns
+EXCLUDED = {"id", "payload"}
+
+_LOCK = threading.Lock()
+_COLUMNS: Dict[int, List[Tuple[str, str]]] = {}
+
+
+def supported(engine: Engine) -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+def table_columns(engine: Engine) -> List[Tuple[str, str]]:
+    """(name, data_type) of patient_records in table order, read once per engine."""
+    key = id(engine)
+    with _LOCK:
+        if key in _COLUMNS:
+            return _COLUMNS[key]
+    with engine.begin() as con:
+        rows = con.execute(text(
+            "SELECT column_name, data_type FROM information_schema.columns "
+            "WHERE table_name = 'patient_records' AND table_schema = current_schema() ORDER BY ordinal_position"
+        )).all()
+    cols = [(str(r[0]), str(r[1])) for r in rows]
+    with _LOCK:
+        _COLUMNS[key] = cols
+    return cols
+
+
+def _q(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _float(v) -> Optional[float]:
+    return None if v is None else float(v)
+
+
+def summary(engine: Engine, dataset_id: int) -> Optional[Dict[str, Any]]:
+    """{meta, numeric, categorical, sample} for a database dataset, or None when it has no rows."""
+    cols = [(c, t) for c, t in table_columns(engine) if c not in EXCLUDED]
+    select = ["count(*) AS n"]
+    for j, (c, t) in enumerate(cols):
+        qc = _q(c)
+        select += [f"count({qc}) AS c{j}", f"count(DISTINCT {qc}) AS u{j}"]
+        if t in NUMERIC_TYPES:
+            x = f"{qc}::float8"
+            select += [f"avg({x}) AS mean{j}", f"stddev_samp({x}) AS std{j}", f"min({x}) AS min{j}",
+                       f"max({x}) AS max{j}",
+                       f"percentile_cont(ARRAY[0.25, 0.5, 0.75]) WITHIN GROUP (ORDER BY {x}) AS q{j}"]
+        else:
+            select.append(f"mode() WITHIN GROUP (ORDER BY {qc}) AS top{j}")
+    sql = f"SELECT {', '.join(select)} FROM patient_records WHERE dataset_id = :d"
+    with engine.begin() as con:
+        row = con.execute(text(sql), {"d": int(dataset_id)}).mappings().first()
+        n = int(row["n"]) if row else 0
+        if not n:
+            return None
+        sample = pd.read_sql(text("SELECT * FROM patient_records WHERE dataset_id = :d ORDER BY id LIMIT 10"),
+                             con, params={"d": int(dataset_id)})
+
+    numeric, categorical = [], []
+    missing = 0.0
+    for j, (c, t) in enumerate(cols):
+        count, unique = int(row[f"c{j}"]), int(row[f"u{j}"])
+        missing += (n - count) / n
+        # pandas reads an all-NULL column as object and a NULL-free boolean as bool;
+        # keep the summary each of those would get
+        if t in NUMERIC_TYPES and count:
+            q = row[f"q{j}"] or [None, None, None]
+            numeric.append({
+                "column": c, "count": count, "mean": _float(row[f"mean{j}"]), "std": _float(row[f"std{j}"]),
+                "min": _float(row[f"min{j}"]), "q25": _float(q[0]), "median": _float(q[1]), "q75": _float(q[2]),
+                "max": _float(row[f"max{j}"]), "unique": unique,
+            })
+        elif t == "boolean" and count == n:
+            numeric.append({"column": c, "count": count, "mean": None, "std": None, "min": None, "q25": None,
+                            "median": None, "q75": None, "max": None, "unique": unique})
+        else:
+            top = row.get(f"top{j}")
+            categorical.append({"column": c, "unique": unique, "top": top if unique else None, "missing": n - count})
+
+    meta = {"rows": n, "columns": len(cols), "missing_pct": missing / len(cols) if cols else 0.0}
+    sample = sample.drop(columns=[c for c in EXCLUDED if c in sample.columns])
+    return {"meta": meta, "numeric": numeric, "categorical": categorical, "sample": head_sample(sample, limit=10)}
+
+
+def _value_exprs(engine: Engine, columns: Optional[Sequence[str]]) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """(label, float8 SQL expression, bind params) per histogram column."""
+    table = [(c, t) for c, t in table_columns(engine) if c not in EXCLUDED]
+    kinds = dict(table)
+    if columns is None:
+        return [(c, f"{_q(c)}::float8", {}) for c, t in table if t in NUMERIC_TYPES]
+    out = []
+    for i, c in enumerate(columns):
+        if kinds.get(c) in NUMERIC_TYPES:
+            out.append((c, f"{_q(c)}::float8", {}))
+        elif kinds.get(c) == "boolean":
+            out.append((c, f"{_q(c)}::int::float8", {}))
+        elif c not in kinds:
+            p = f"k{i}"
+            out.append((c, f"CASE WHEN jsonb_typeof(payload -> :{p}) = 'number' THEN (payload ->> :{p})::float8 END",
+                        {p: c}))
+    return out
+
+
+def histograms(engine: Engine, dataset_id: int, columns: Optional[Sequence[str]] = None,
+               bins: int = 20, limit: int = 10) -> Optional[List[Dict[str, Any]]]:
+    """
+    np.histogram-compatible {column, bins, counts} per column (the first `limit` numeric
+    columns with data when `columns` is None), or None when the dataset has no rows.
+    """
+    exprs = _value_exprs(engine, columns)
+    params: Dict[str, Any] = {"d": int(dataset_id), "bins": int(bins)}
+    for _, _, p in exprs:
+        params.update(p)
+    select = ["count(*) AS n"] + [f"min({e}) AS lo{j}, max({e}) AS hi{j}" for j, (_, e, _) in enumerate(exprs)]
+    with engine.begin() as con:
+        lim = con.execute(text(f"SELECT {', '.join(select)} FROM patient_records WHERE dataset_id = :d"),
+                          params).mappings().first()
+        if not lim or not lim["n"]:
+            return None
+        chosen = [j for j in range(len(exprs)) if lim[f"lo{j}"] is not None]
+        if columns is None:
+            chosen = chosen[:limit]
+        if not chosen:
+            return []
+        ranges = {}
+        values = []
+        for j in chosen:
+            lo, hi = float(lim[f"lo{j}"]), float(lim[f"hi{j}"])
+            if lo == hi:                      # np.histogram widens a constant column by 0.5 each side
+                lo, hi = lo - 0.5, hi + 0.5
+            ranges[j] = (lo, hi)
+            params[f"lo{j}"], params[f"hi{j}"] = lo, hi
+            values.append(f"({j}, LEAST(width_bucket({exprs[j][1]}, CAST(:lo{j} AS float8), CAST(:hi{j} AS float8), "
+                          f"CAST(:bins AS int)), CAST(:bins AS int)))")
+        sql = (f"SELECT v.k, v.b, count(*) AS n FROM patient_records, LATERAL (VALUES {', '.join(values)}) AS v(k, b) "
+               f"WHERE dataset_id = :d AND v.b IS NOT NULL GROUP BY v.k, v.b")
+        rows = con.execute(text(sql), params).all()
+
+    counts = {j: [0] * bins for j in chosen}
+    for k, b, cnt in rows:
+        counts[int(k)][int(b) - 1] = int(cnt)
+    out = []
+    for j in chosen:
+        lo, hi = ranges[j]
+        out.append({"column": exprs[j][0], "bins": np.linspace(lo, hi, bins + 1).tolist(), "counts": counts[j]})
+    return out
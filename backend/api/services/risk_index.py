@@ -0,0 +1,125 @@
+# backend/api/services/risk_index.py
+"""
+Top-K high-risk patient index, built once per analysis run from the score arrays.
+
+Reports rank patients by (number of positive models, mean classifier score), both
+descending, keep those with enough positive models or a high enough mean score, and
+list the first few hundred. Within one positive-model count the qualifying patients
+are always the highest mean scores, so keeping the top K of every count level (plus
+each model's own top K) answers any cutoff / min-models / top_n <= K query exactly
+from at most (models + 1) * K rows, instead of walking all N patients.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+import json
+import os
+
+import numpy as np
+
+INDEX_FILE = "risk_topk.json"
+TOP_K = int(os.environ.get("RISK_INDEX_TOP_K", "200"))
+
+
+def _top_rows(key: np.ndarray, rows: np.ndarray, k: int) -> np.ndarray:
+    """
+    The k entries of `rows` with the largest `key`, ties broken by row order, sorted
+    that way. argpartition finds the k-th value; only candidates at or above it are sorted.
+    """
+    if len(rows) > k:
+        kth = np.partition(key, len(key) - k)[len(key) - k]
+        keep = key >= kth
+        key, rows = key[keep], rows[keep]
+    order = np.lexsort((rows, -key))
+    return rows[order[:k]]
+
+
+def build(pids: List[str], outputs: Dict[str, Dict[str, Any]], thresholds: Dict[str, float],
+          summary: Dict[str, Any], k: int = TOP_K) -> Dict[str, Any]:
+    """Index over whole-run outputs (per model: scores/preds or values, as from ScoreCollector.outputs())."""
+    n = len(pids)
+    clf = [m for m, o in outputs.items() if o.get("kind") == "classification" and len(o["scores"]) == n]
+    reg = [m for m, o in outputs.items() if o.get("kind") == "regression" and len(o["values"]) == n]
+    if clf:
+        S = np.column_stack([np.asarray(outputs[m]["scores"], dtype=np.float64) for m in clf])
+        positives = np.column_stack([np.asarray(outputs[m]["preds"]) == 1 for m in clf]).sum(axis=1)
+        # reports compare and rank the 4-decimal mean
+        avg = np.round(S.mean(axis=1), 4)
+    else:
+        S = np.zeros((n, 0))
+        positives = np.zeros(n, dtype=np.int64)
+        avg = np.zeros(n)
+    all_rows = np.arange(n, dtype=np.int64)
+
+    levels: Dict[str, List[int]] = {}
+    for p in range(len(clf), -1, -1):
+        rows = all_rows[positives == p]
+        if len(rows):
+            levels[str(p)] = _top_rows(avg[rows], rows, k).tolist()
+    per_model = {m: _top_rows(S[:, j], all_rows, k).tolist() for j, m in enumerate(clf)}
+
+    wanted = sorted({r for rs in levels.values() for r in rs} | {r for rs in per_model.values() for r in rs})
+    patients: Dict[str, Dict[str, Any]] = {}
+    for r in wanted:
+        detail: Dict[str, Any] = {}
+        for j, m in enumerate(clf):
+            detail[m] = {"score": float(S[r, j]), "pred": int(outputs[m]["preds"][r]),
+                         "threshold": float(thresholds.get(m, 0.5))}
+        for m in reg:
+            detail[m] = {"prediction": float(outputs[m]["values"][r])}
+        patients[str(r)] = {"patient_id": pids[r], "positive_models": int(positives[r]),
+                            "avg_score": float(avg[r]), "models": detail}
+    return {"k": k, "n": n, "classification_models": clf, "summary": summary,
+            "levels": levels, "per_model": per_model, "patients": patients}
+
+
+def save(base_dir: str, index: Dict[str, Any]) -> str:
+    path = os.path.join(base_dir, INDEX_FILE)
+    tmp = path + ".part"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    os.replace(tmp, path)
+    return path
+
+
+def load_for(risk_path: str) -> Optional[Dict[str, Any]]:
+    """The index written next to a risk JSON, or None (older runs, sharded runs)."""
+    path = os.path.join(os.path.dirname(risk_path), INDEX_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def high_risk(index: Dict[str, Any], score_cutoff: float, min_positive_models: int, top_n: int) -> List[Dict[str, Any]]:
+    """
+    Patients with >= min_positive_models positive models or mean score >= score_cutoff,
+    ranked by (positive models, mean score); the same list a full scan would give for top_n <= k.
+    """
+    if top_n > index["k"]:
+        raise ValueError(f"top_n {top_n} exceeds the index size {index['k']}")
+    out: List[Dict[str, Any]] = []
+    for level, rows in sorted(index["levels"].items(), key=lambda kv: int(kv[0]), reverse=True):
+        for r in rows:
+            row = index["patients"][str(r)]
+            if int(level) < min_positive_models and row["avg_score"] < score_cutoff:
+                break       # rows of a level are in descending mean score
+            out.append(row)
+            if len(out) >= top_n:
+                return out
+    return out
+
+
+def top_for_model(index: Dict[str, Any], model: str, score_cutoff: float, top_n: int) -> List[Dict[str, Any]]:
+    """Highest-scoring patients of one classifier with score >= score_cutoff."""
+    if model not in index["per_model"]:
+        raise KeyError(model)
+    if top_n > index["k"]:
+        raise ValueError(f"top_n {top_n} exceeds the index size {index['k']}")
+    out: List[Dict[str, Any]] = []
+    for r in index["per_model"][model][:top_n]:
+        row = index["patients"][str(r)]
+        if row["models"][model]["score"] < score_cutoff:
+            break
+        out.append(row)
+    return out
@@ -0,0 +1,244 @@
+# backend/api/services/sharded_scoring.py
+"""
+Sharded batch scoring for datasets too large to score as one frame.
+
+The dataset is cut into row ranges (id ranges in Postgres, row groups in a Parquet
+file). Each shard is read with only the columns the selected models use, scored by
+every model in a worker process, and written as its own Parquet part. Parts are then
+concatenated in shard order, and rows inside a part are ordered by id / row number,
+so the merged file has a deterministic patient order whatever order shards finish in.
+Peak memory per worker is one shard plus the models.
+"""
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+import multiprocessing as mp
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
+
+from . import model_cache, prediction_service
+
+SHARD_ROWS = int(os.environ.get("SHARD_ROWS", "250000"))
+SHARD_WORKERS = int(os.environ.get("SHARD_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+
+
+@dataclass
+class Shard:
+    index: int
+    source: str                 # "postgres" | "parquet"
+    location: str               # database URL or parquet path
+    dataset_id: Optional[int]
+    lo: int                     # postgres: first id; parquet: first row group
+    hi: int                     # postgres: last id (inclusive); parquet: row group stop
+    offset: int = 0             # parquet: global row number of the shard's first row
+
+
+# ---------------- planning ----------------
+def plan_postgres(engine: Engine, dataset_id: int, shard_rows: int = SHARD_ROWS) -> List[Shard]:
+    """Even id ranges over [min(id), max(id)]; with bulk-ingested (dense) ids each holds ~shard_rows rows."""
+    from .patient_access import id_range
+    rng = id_range(engine, dataset_id)
+    if rng is None:
+        return []
+    lo, hi = rng
+    url = engine.url.render_as_string(hide_password=False)
+    step = max(1, shard_rows)
+    return [
+        Shard(i, "postgres", url, int(dataset_id), start, min(hi, start + step - 1))
+        for i, start in enumerate(range(lo, hi + 1, step))
+    ]
+
+
+def plan_parquet(path: str, shard_rows: int = SHARD_ROWS) -> List[Shard]:
+    """Consecutive row groups packed into shards of at least shard_rows rows."""
+    import pyarrow.parquet as pq
+    meta = pq.ParquetFile(path).metadata
+    shards: List[Shard] = []
+    start, rows, offset = 0, 0, 0
+    for g in range(meta.num_row_groups):
+        rows += meta.row_group(g).num_rows
+        if rows >= shard_rows or g == meta.num_row_groups - 1:
+            shards.append(Shard(len(shards), "parquet", path, None, start, g + 1, offset))
+            start, offset, rows = g + 1, offset + rows, 0
+    return shards
+
+
+def projected_columns(models: Sequence[str], available: Sequence[str]) -> List[str]:
+    """Union of the models' fit-time input columns that the source actually has, plus patient_id."""
+    want: List[str] = ["patient_id"]
+    for m in models:
+        cols = prediction_service._cached_input_columns(model_cache.get_model(m))
+        if cols is None:        # model without a ColumnTransformer: cannot project
+            return list(available)
+        want.extend(cols)
+    have = set(available)
+    return [c for c in dict.fromkeys(want) if c in have]
+
+
+def source_columns(shard: Shard) -> List[str]:
+    if shard.source == "parquet":
+        import pyarrow.parquet as pq
+        return list(pq.ParquetFile(shard.location).schema_arrow.names)
+    with _engine(shard.location).begin() as con:
+        return list(con.execute(text("SELECT * FROM patient_records LIMIT 0")).keys())
+
+
+# ---------------- worker side ----------------
+_ENGINES: Dict[str, Engine] = {}
+
+
+def _engine(url: str) -> Engine:
+    eng = _ENGINES.get(url)
+    if eng is None:
+        eng = _ENGINES[url] = create_engine(url, poolclass=NullPool, future=True)
+    return eng
+
+
+def _worker_init() -> None:
+    # parallelism comes from the processes; keep every BLAS/OpenMP pool at one thread
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    except Exception:
+        pass
+
+
+def _single_threaded(model) -> None:
+    est = model.steps[-1][1] if hasattr(model, "steps") else model
+    if "n_jobs" in getattr(est, "get_params", lambda: {})():
+        est.set_params(n_jobs=1)
+
+
+def _read_shard(shard: Shard, columns: List[str]) -> pd.DataFrame:
+    if shard.source == "parquet":
+        import pyarrow.parquet as pq
+        table = pq.ParquetFile(shard.location).read_row_groups(range(shard.lo, shard.hi), columns=columns)
+        df = table.to_pandas()
+        df.insert(0, "order_key", np.arange(shard.offset, shard.offset + len(df), dtype=np.int64))
+        return df
+    cols = ", ".join(f'"{c}"' for c in ["id", *columns])
+    sql = text(f"SELECT {cols} FROM patient_records WHERE dataset_id=:d AND id BETWEEN :lo AND :hi ORDER BY id")
+    df = pd.read_sql(sql, con=_engine(shard.location), params={"d": shard.dataset_id, "lo": shard.lo, "hi": shard.hi})
+    return df.rename(columns={"id": "order_key"})
+
+
+def score_shard(shard: Shard, models: List[str], thresholds: Dict[str, float],
+                columns: List[str], out_dir: str) -> Dict[str, Any]:
+    """Read, score and write one shard. Runs in a worker process."""
+    t0 = time.perf_counter()
+    df = _read_shard(shard, columns)
+    out = pd.DataFrame({"order_key": df["order_key"].to_numpy(dtype=np.int64)})
+    pid = df["patient_id"] if "patient_id" in df.columns else pd.Series([None] * len(df))
+    out["patient_id"] = pid.astype(str).where(pd.notna(pid), None)
+    tallies: Dict[str, Dict[str, Any]] = {}
+    for m in models:
+        try:
+            _single_threaded(model_cache.get_model(m))
+            kind, values = prediction_service.score_frame(m, df)
+        except Exception as e:
+            tallies[m] = {"error": f"{e.__class__.__name__}: {e}"}
+            continue
+        if kind == "regression":
+            out[f"{m}_prediction"] = values
+            tallies[m] = {"kind": kind, "sum": float(values.sum())}
+        else:
+            thr = 0.0 if kind == "decision" else float(thresholds.get(m, 0.5))
+            preds = (values >= thr).astype(np.int8)
+            out[f"{m}_score"] = values
+            out[f"{m}_pred"] = preds
+            tallies[m] = {"kind": "classification", "positives": int(preds.sum()), "threshold": thr}
+    path = os.path.join(out_dir, f"part-{shard.index:05d}.parquet")
+    out.to_parquet(path, index=False)
+    return {"index": shard.index, "path": path, "rows": int(len(out)), "tallies": tallies,
+            "seconds": round(time.perf_counter() - t0, 3)}
+
+
+# ---------------- driver ----------------
+def _merge(parts: List[Dict[str, Any]], models: List[str], out_path: str) -> None:
+    """Concatenate parts in shard order into one file with a fixed schema."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    fields = [pa.field("order_key", pa.int64()), pa.field("patient_id", pa.string())]
+    for m in models:
+        kinds = {p["tallies"].get(m, {}).get("kind") for p in parts} - {None}
+        if kinds == {"regression"}:
+            fields.append(pa.field(f"{m}_prediction", pa.float64()))
+        elif kinds:
+            fields += [pa.field(f"{m}_score", pa.float64()), pa.field(f"{m}_pred", pa.int8())]
+    schema = pa.schema(fields)
+    with pq.ParquetWriter(out_path, schema) as writer:
+        for p in sorted(parts, key=lambda p: p["index"]):
+            table = pq.read_table(p["path"])
+            cols = [table.column(f.name).cast(f.type) if f.name in table.column_names
+                    else pa.nulls(table.num_rows, f.type) for f in schema]
+            writer.write_table(pa.Table.from_arrays(cols, schema=schema))
+
+
+def _summary(parts: List[Dict[str, Any]], models: List[str]) -> Dict[str, Any]:
+    n = sum(p["rows"] for p in parts)
+    counts: Dict[str, Any] = {}
+    for m in models:
+        ts = [p["tallies"].get(m, {}) for p in parts]
+        err = next((t["error"] for t in ts if "error" in t), None)
+        if err:
+            counts[m] = {"error": err}
+        elif any(t.get("kind") == "classification" for t in ts):
+            counts[m] = {"positives": sum(t.get("positives", 0) for t in ts), "total": n}
+        else:
+            counts[m] = {"n": n, "mean_prediction": sum(t.get("sum", 0.0) for t in ts) / n if n else None}
+    return {"rows": n, "counts": counts}
+
+
+def run_sharded(shards: List[Shard], models: List[str], thresholds: Dict[str, float], out_dir: str,
+                workers: int = SHARD_WORKERS, progress: Optional[Callable[[float], None]] = None,
+                keep_parts: bool = False) -> Dict[str, Any]:
+    """
+    Score every shard in a process pool and merge the parts into out_dir/scores.parquet.
+    `progress(fraction)` is called after each finished shard; an exception it raises
+    (e.g. job cancellation) cancels the remaining shards and propagates.
+    """
+    t0 = time.perf_counter()
+    models = list(dict.fromkeys(models))
+    parts_dir = os.path.join(out_dir, "parts")
+    os.makedirs(parts_dir, exist_ok=True)
+    if not shards:
+        return {"scores_parquet": None, "shards": 0, "workers": 0, **_summary([], models)}
+    columns = projected_columns(models, source_columns(shards[0]))
+
+    parts: List[Dict[str, Any]] = []
+    workers = max(1, min(workers, len(shards)))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"),
+                             initializer=_worker_init) as pool:
+        futures = [pool.submit(score_shard, s, models, thresholds, columns, parts_dir) for s in shards]
+        try:
+            for fut in as_completed(futures):
+                parts.append(fut.result())
+                if progress is not None:
+                    progress(len(parts) / len(shards))
+        except BaseException:
+            for f in futures:
+                f.cancel()
+            raise
+
+    out_path = os.path.join(out_dir, "scores.parquet")
+    _merge(parts, models, out_path)
+    if not keep_parts:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+    return {
+        "scores_parquet": out_path,
+        "shards": len(shards),
+        "workers": workers,
+        "columns_read": len(columns),
+        "seconds": round(time.perf_counter() - t0, 3),
+        "shard_seconds": [p["seconds"] for p in sorted(parts, key=lambda p: p["index"])],
+        **_summary(parts, models),
+    }
@@ -0,0 +1,199 @@
+# backend/api/services/streaming_stats.py
+"""
+Per-column statistics that are built chunk by chunk and merge across chunks, shards
+and later ingests: count / mean / variance with Welford's update (Chan et al. to
+merge two partial results) and quantiles from a KLL sketch.
+
+The z-score + IQR outlier rule only needs mean, std, Q1 and Q3 per column, so it runs
+over any number of blocks with memory bounded by the sketch size: one pass builds the
+statistics, a second pass flags rows block by block (anomaly_engine). Up to EXACT_ROWS values per column
+are kept as is, which gives the same quantiles as pandas on small and medium datasets.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+# KLL accuracy parameter: rank error is about 1.7 / SKETCH_K once a column is compacted.
+SKETCH_K = int(os.environ.get("STATS_SKETCH_K", "256"))
+# Values per column kept verbatim before the sketch starts compacting.
+EXACT_ROWS = int(os.environ.get("STATS_EXACT_ROWS", "100000"))
+CHUNK_ROWS = int(os.environ.get("STATS_CHUNK_ROWS", "65536"))
+
+Z_LIMIT = 3.0
+IQR_K = 1.5
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang, Liberty 2016). Level h holds items of weight 2**h;
+    a level over capacity is sorted and every other item (random offset) moves up one level.
+    """
+
+    def __init__(self, k: int = SKETCH_K, exact_rows: int = EXACT_ROWS, c: float = 2 / 3, seed: Optional[int] = None):
+        self.k, self.c, self.exact_rows = k, c, exact_rows
+        self.n = 0
+        self.exact = True
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, h: int) -> int:
+        return max(2, int(math.ceil(self.k * self.c ** (len(self.levels) - h - 1))))
+
+    def _compress(self) -> None:
+        if self.exact:
+            if self.n <= self.exact_rows:
+                return
+            self.exact = False
+        h = 0
+        while h < len(self.levels):
+            buf = self.levels[h]
+            if len(buf) > self._capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                buf = np.sort(buf)
+                odd = len(buf) % 2
+                promoted = buf[odd:][int(self._rng.integers(2))::2]
+                self.levels[h] = buf[:odd]
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            h += 1
+
+    def update(self, values: np.ndarray) -> None:
+        v = np.asarray(values, dtype=np.float64)
+        v = v[~np.isnan(v)]
+        if not v.size:
+            return
+        self.n += int(v.size)
+        self.levels[0] = np.concatenate([self.levels[0], v])
+        self._compress()
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, buf in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], buf])
+        self.n += other.n
+        self.exact = self.exact and other.exact
+        self._compress()
+        return self
+
+    def quantile(self, q: float) -> float:
+        if self.n == 0:
+            return float("nan")
+        if self.exact:
+            return float(np.quantile(self.levels[0], q))      # linear, as pandas
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(b), 2 ** h, dtype=np.int64) for h, b in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        cum = np.cumsum(weights[order])
+        i = int(np.searchsorted(cum, q * cum[-1], side="left"))
+        return float(items[order][min(i, len(items) - 1)])
+
+    def weighted(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(items, weights): every retained value and the number of inputs it stands for."""
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(b), 2 ** h, dtype=np.int64) for h, b in enumerate(self.levels)])
+        return items, weights
+
+    def size(self) -> int:
+        return int(sum(len(b) for b in self.levels))
+
+
+class ColumnStats:
+    """Moments and a quantile sketch for each of a fixed list of numeric columns."""
+
+    def __init__(self, columns: Sequence[str], k: int = SKETCH_K, exact_rows: int = EXACT_ROWS):
+        self.columns = list(columns)
+        d = len(self.columns)
+        self.count = np.zeros(d, dtype=np.int64)
+        self.mean = np.zeros(d)
+        self.m2 = np.zeros(d)
+        self.sketches = [KLLSketch(k, exact_rows, seed=i) for i in range(d)]
+
+    def _matrix(self, frame: pd.DataFrame) -> np.ndarray:
+        return frame.reindex(columns=self.columns).apply(pd.to_numeric, errors="coerce").to_numpy(
+            dtype=np.float64, na_value=np.nan)
+
+    def _combine(self, n_b: np.ndarray, mean_b: np.ndarray, m2_b: np.ndarray) -> None:
+        n_a = self.count
+        n = n_a + n_b
+        with np.errstate(divide="ignore", invalid="ignore"):
+            delta = mean_b - self.mean
+            frac = np.where(n > 0, n_b / np.maximum(n, 1), 0.0)
+            self.mean = np.where(n_b > 0, self.mean + delta * frac, self.mean)
+            self.m2 = np.where(n_b > 0, self.m2 + m2_b + delta ** 2 * n_a * frac, self.m2)
+        self.count = n
+
+    def update(self, frame: pd.DataFrame) -> "ColumnStats":
+        return self.update_array(self._matrix(frame))
+
+    def update_array(self, X: np.ndarray) -> "ColumnStats":
+        """update() for a float matrix already in column order (NaN = missing)."""
+        if not X.size:
+            return self
+        ok = ~np.isnan(X)
+        n_b = ok.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_b = np.where(n_b > 0, np.nansum(X, axis=0) / np.maximum(n_b, 1), 0.0)
+            m2_b = np.nansum((X - mean_b) ** 2, axis=0)
+        self._combine(n_b, mean_b, m2_b)
+        for j, sk in enumerate(self.sketches):
+            sk.update(X[ok[:, j], j])
+        return self
+
+    def merge(self, other: "ColumnStats") -> "ColumnStats":
+        if other.columns != self.columns:
+            raise ValueError("cannot merge statistics over different columns")
+        self._combine(other.count, other.mean, other.m2)
+        for mine, theirs in zip(self.sketches, other.sketches):
+            mine.merge(theirs)
+        return self
+
+    def std(self) -> np.ndarray:
+        """Population standard deviation (ddof=0)."""
+        return np.sqrt(np.where(self.count > 0, self.m2 / np.maximum(self.count, 1), np.nan))
+
+    def quantile(self, q: float) -> np.ndarray:
+        return np.array([sk.quantile(q) for sk in self.sketches])
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        std, q1, q2, q3 = self.std(), self.quantile(0.25), self.quantile(0.5), self.quantile(0.75)
+        return {c: {"count": int(self.count[j]), "mean": float(self.mean[j]), "std": float(std[j]),
+                    "q1": float(q1[j]), "median": float(q2[j]), "q3": float(q3[j])}
+                for j, c in enumerate(self.columns)}
+
+
+class OutlierDetector:
+    """|z| > z_limit or outside [Q1 - k*IQR, Q3 + k*IQR] in any column; missing values never flag."""
+
+    def __init__(self, stats: ColumnStats, z_limit: float = Z_LIMIT, iqr_k: float = IQR_K):
+        self.stats = stats
+        self.z_limit = z_limit
+        self.mean = stats.mean
+        self.scale = stats.std() + 1e-9
+        q1, q3 = stats.quantile(0.25), stats.quantile(0.75)
+        self.low, self.high = q1 - iqr_k * (q3 - q1), q3 + iqr_k * (q3 - q1)
+
+    def flag_array(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(z-score flag, IQR flag) per row of a float matrix in the statistics' column order."""
+        with np.errstate(invalid="ignore"):
+            z_flag = (np.abs(X - self.mean) / self.scale > self.z_limit).any(axis=1)
+            iqr_flag = ((X < self.low) | (X > self.high)).any(axis=1)
+        return z_flag, iqr_flag
+
+
+def flagged_entries(ids: pd.Series, z_flag: np.ndarray, iqr_flag: np.ndarray) -> List[Dict[str, Any]]:
+    """Report entries for the rows either rule flags."""
+    out = []
+    for i in np.flatnonzero(z_flag | iqr_flag):
+        pid = ids.iloc[i]
+        out.append({
+            "patient_id": None if pd.isna(pid) else str(pid),
+            "zscore_any_gt3": bool(z_flag[i]),
+            "iqr_outlier": bool(iqr_flag[i]),
+        })
+    return out
@@ -0,0 +1,213 @@
+# backend/api/services/threshold_curve.py
+"""
+Alert counts and precision / recall / F1 at every decision threshold, from the score
+arrays an analysis run already produced (no re-scoring).
+
+A run stores each classifier's scores, plus the outcome column when the dataset has
+it, in `scores.npz` next to its risk JSON. The first curve request for a (file, model)
+sorts the scores once (O(n log n)) and keeps cumulative positive counts; every
+threshold afterwards is a binary search into those arrays.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence
+from collections import OrderedDict
+import importlib
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+SCORES_FILE = "scores.npz"
+# Prepared (sorted) score arrays kept in memory, one per (file, model).
+CACHE_SIZE = int(os.environ.get("THRESHOLD_CURVE_CACHE", "16"))
+
+
+# ---------------- writing the score cache ----------------
+def label_column(model_name: str) -> Optional[str]:
+    """The outcome column a model is trained on by default (e.g. mortality_1y), if known."""
+    from ...ml_library.model_factory import DynamicModelFactory
+    module_path = DynamicModelFactory.MODEL_REGISTRY.get(model_name)
+    if not module_path:
+        return None
+    try:
+        cls = getattr(importlib.import_module(module_path), model_name)
+        return getattr(cls(), "target", None)
+    except Exception:
+        return None
+
+
+def _labels(df: pd.DataFrame, column: Optional[str]) -> Optional[np.ndarray]:
+    """0/1 outcome per row, -1 where unknown; None when the column is absent or not binary."""
+    if not column or column not in df.columns:
+        return None
+    y = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=np.float64)
+    known = ~np.isnan(y)
+    if not known.any() or not np.isin(y[known], (0.0, 1.0)).all():
+        return None
+    out = np.full(len(y), -1, dtype=np.int8)
+    out[known] = y[known]
+    return out
+
+
+class ScoreCollector:
+    """
+    Gathers every model's output arrays chunk by chunk during a run; `outputs()` gives
+    them back whole (for the top-K index) and `save()` writes the classifier scores.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: Dict[str, List[Dict[str, Any]]] = {}
+
+    def add(self, outputs: Dict[str, Dict[str, Any]]) -> None:
+        for m, out in outputs.items():
+            self._chunks.setdefault(m, []).append(out)
+
+    def outputs(self) -> Dict[str, Dict[str, Any]]:
+        """Per model, the concatenated arrays; a model that failed on any chunk keeps its error."""
+        merged: Dict[str, Dict[str, Any]] = {}
+        for m, chunks in self._chunks.items():
+            kind = chunks[0].get("kind")
+            if any(c.get("kind") != kind for c in chunks) or kind not in ("classification", "regression"):
+                bad = next((c for c in chunks if c.get("kind") not in ("classification", "regression")), chunks[0])
+                merged[m] = {"kind": "error", "error": bad.get("error", "prediction failure")}
+            elif kind == "classification":
+                merged[m] = {"kind": kind,
+                             "scores": np.concatenate([np.asarray(c["scores"]) for c in chunks]),
+                             "preds": np.concatenate([np.asarray(c["preds"]) for c in chunks])}
+            else:
+                merged[m] = {"kind": kind, "values": np.concatenate([np.asarray(c["values"]) for c in chunks])}
+        return merged
+
+    def save(self, base_dir: str, df: pd.DataFrame) -> Optional[str]:
+        arrays: Dict[str, np.ndarray] = {}
+        for m, out in self.outputs().items():
+            if out["kind"] != "classification" or len(out["scores"]) != len(df):
+                continue
+            arrays[f"score__{m}"] = out["scores"]
+            labels = _labels(df, label_column(m))
+            if labels is not None:
+                arrays[f"label__{m}"] = labels
+        if not arrays:
+            return None
+        path = os.path.join(base_dir, SCORES_FILE)
+        tmp = path + ".part.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+        return path
+
+
+# ---------------- curve ----------------
+class _Prepared:
+    """Scores sorted descending with running counts of labelled and positive rows."""
+
+    def __init__(self, scores: np.ndarray, labels: Optional[np.ndarray]):
+        s = np.asarray(scores, dtype=np.float64)
+        keep = ~np.isnan(s)
+        order = np.argsort(-s[keep], kind="stable")
+        self.desc = s[keep][order]
+        self.neg_desc = -self.desc               # ascending, for searchsorted
+        self.n = int(self.desc.shape[0])
+        if labels is not None:
+            lab = np.asarray(labels)[keep][order]
+            self.cum_pos = np.cumsum(lab == 1, dtype=np.int64)
+            self.cum_known = np.cumsum(lab >= 0, dtype=np.int64)
+            self.n_pos = int(self.cum_pos[-1]) if self.n else 0
+        else:
+            self.cum_pos = self.cum_known = None
+            self.n_pos = 0
+
+    def distinct_counts(self) -> np.ndarray:
+        """Alert count k at each distinct score used as threshold (score >= t)."""
+        d = self.desc
+        return np.flatnonzero(np.r_[d[1:] != d[:-1], True]) + 1 if self.n else np.zeros(0, dtype=np.int64)
+
+    def counts_at(self, thresholds: Sequence[float]) -> np.ndarray:
+        return np.searchsorted(self.neg_desc, -np.asarray(thresholds, dtype=np.float64), side="right")
+
+    def metrics(self, k: np.ndarray, thresholds: np.ndarray) -> Dict[str, Any]:
+        k = np.asarray(k, dtype=np.int64)
+        out: Dict[str, Any] = {
+            "threshold": thresholds,
+            "alerts": k,
+            "alert_rate": k / self.n if self.n else np.zeros(len(k)),
+        }
+        if self.cum_pos is not None:
+            idx = np.maximum(k - 1, 0)
+            tp = np.where(k > 0, self.cum_pos[idx], 0) if self.n else np.zeros(len(k), dtype=np.int64)
+            known = np.where(k > 0, self.cum_known[idx], 0) if self.n else np.zeros(len(k), dtype=np.int64)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                precision = np.where(known > 0, tp / np.maximum(known, 1), np.nan)
+                recall = tp / self.n_pos if self.n_pos else np.full(len(k), np.nan)
+                f1 = 2 * precision * recall / (precision + recall)
+            out.update({"true_positives": tp, "precision": precision, "recall": recall, "f1": f1})
+        return out
+
+
+_LOCK = threading.Lock()
+_PREPARED: "OrderedDict[tuple, _Prepared]" = OrderedDict()
+
+
+def _prepared(path: str, model: str) -> _Prepared:
+    st = os.stat(path)
+    key = (path, model, st.st_size, st.st_mtime_ns)
+    with _LOCK:
+        prep = _PREPARED.get(key)
+        if prep is not None:
+            _PREPARED.move_to_end(key)
+            return prep
+    scores, labels = _read_scores(path, model)
+    prep = _Prepared(scores, labels)
+    with _LOCK:
+        _PREPARED[key] = prep
+        while len(_PREPARED) > CACHE_SIZE:
+            _PREPARED.popitem(last=False)
+    return prep
+
+
+def _read_scores(path: str, model: str):
+    if path.endswith(".parquet"):       # sharded runs: scores column of the merged file, no labels
+        import pyarrow.parquet as pq
+        col = f"{model}_score"
+        if col not in pq.ParquetFile(path).schema_arrow.names:
+            raise KeyError(model)
+        return pq.read_table(path, columns=[col]).column(col).to_numpy(zero_copy_only=False), None
+    with np.load(path) as z:
+        if f"score__{model}" not in z.files:
+            raise KeyError(model)
+        labels = z[f"label__{model}"] if f"label__{model}" in z.files else None
+        return z[f"score__{model}"], labels
+
+
+def _jsonable(a: np.ndarray) -> List[Any]:
+    a = np.asarray(a)
+    if a.dtype.kind == "f":
+        return [None if v != v else round(v, 6) for v in a.tolist()]
+    return a.tolist()
+
+
+def threshold_curve(path: str, model: str, at: Optional[Sequence[float]] = None,
+                    max_points: int = 1000) -> Dict[str, Any]:
+    """
+    Curve for `model` from a stored score file. Without `at`, every distinct score is a
+    threshold (subsampled by rank to at most max_points, keeping both ends); with `at`,
+    exactly those thresholds. Raises KeyError when the file holds no scores for `model`.
+    """
+    prep = _prepared(path, model)
+    if at:
+        thr = np.asarray(at, dtype=np.float64)
+        k = prep.counts_at(thr)
+    else:
+        k = prep.distinct_counts()
+        if len(k) > max_points:
+            k = k[np.unique(np.linspace(0, len(k) - 1, max_points).round().astype(np.int64))]
+        thr = prep.desc[k - 1] if len(k) else np.zeros(0)
+    points = prep.metrics(k, thr)
+    return {
+        "model": model,
+        "n": prep.n,
+        "labelled": prep.cum_known is not None,
+        "positives_in_labels": prep.n_pos if prep.cum_known is not None else None,
+        "points": {name: _jsonable(v) for name, v in points.items()},
+    }
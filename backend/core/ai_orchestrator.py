@@ -23,9 +23,10 @@ class AIOrchestrator:
             "null_fraction": float(df.isna().mean().mean())
         }
 
-    async def process_dataset(self, df: pd.DataFrame, medical_context: Dict[str, Any]) -> Dict[str, Any]:
+    async def process_dataset(self, df: pd.DataFrame, medical_context: Dict[str, Any], catalog=None) -> Dict[str, Any]:
+        """`catalog`: df's column_catalog.ColumnCatalog, when there is one; the data-quality score reads it."""
         t0 = time.time()
-        column_analysis = await self.column_mapper.analyze_medical_data(df)
+        column_analysis = await self.column_mapper.analyze_medical_data(df, catalog)
         data_char = self._analyze_dataset_characteristics(df)
 
         strategy = await self.gemini.generate_comprehensive_strategy({
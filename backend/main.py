@@ -1,5 +1,6 @@
 
 import os
+import threading
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .api.endpoints.intelligent_upload import router as upload_router
@@ -7,8 +8,10 @@ from .api.endpoints.ai_analysis import router as analysis_router
 from .api.endpoints.patient_search import router as patient_router
 from .api.endpoints.report_generation import router as report_router
 from .api.endpoints.models import router as models_router
+from .utils.compression import CompressionMiddleware
+from .utils.fast_json import FastJSONResponse
 
-app = FastAPI(title="Medical IntelliAnalytics Pro")
+app = FastAPI(title="Medical IntelliAnalytics Pro", default_response_class=FastJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,12 +20,14 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
 from .api.routes.datasets import router as datasets_router
 from .api.routes.patients import router as patients_router
 from .api.routes.analytics import router as analytics_router
 from .api.routes.strategies import router as strategies_router
 from .api.routes.adhoc import router as adhoc_router
 from .api.routes.reports import router as reports_router
+from .api.routes.predict import router as predict_router
 # in your FastAPI app init (only once)
 from fastapi.staticfiles import StaticFiles
 from backend.api.routes import artifacts as artifacts_routes
@@ -35,6 +40,7 @@ app.include_router(datasets_router)
 app.include_router(patients_router)
 app.include_router(analytics_router)
 app.include_router(strategies_router)
+app.include_router(predict_router)
 
 app.include_router(upload_router)
 app.include_router(analysis_router)
@@ -42,6 +48,44 @@ app.include_router(patient_router)
 app.include_router(report_router)
 app.include_router(models_router)
 
+from .api.routes.strategies import STRATEGIES
+from .api.services import duckdb_catalog, model_cache, patient_access
+from .api.services.micro_batcher import batcher
+from .api.services.job_queue import analysis_jobs
+from .utils.process_stats import memory_usage
+
+_STARTUP: dict = {}
+
+@app.on_event("startup")
+def preload_models():
+    """Load every model the strategy catalog references before serving traffic."""
+    _STARTUP["pid"] = os.getpid()
+    if os.environ.get("PRELOAD_MODELS", "1").lower() in ("0", "false", "no"):
+        _STARTUP["preload"] = "disabled"
+        return
+    names = [m for s in STRATEGIES for m in s["models"]]
+    summary = model_cache.preload(names)
+    _STARTUP["preload"] = "done"
+    _STARTUP["cold_start_seconds"] = summary["seconds"]
+    print(f"Preloaded {len(summary['loaded'])}/{len(set(names))} models "
+          f"({len(summary['compiled'])} compiled) in {summary['seconds']}s")
+
+@app.on_event("startup")
+def build_patient_indexes():
+    """patient_records lookup indexes for databases created before them, built in the background."""
+    def build():
+        try:
+            from .database import engine
+            patient_access.ensure_indexes(engine)
+            _STARTUP["patient_indexes"] = "ready"
+        except Exception as e:
+            _STARTUP["patient_indexes"] = "failed"
+            print(f"patient_records indexes not built: {e}")
+    _STARTUP["patient_indexes"] = "building"
+    threading.Thread(target=build, name="patient-indexes", daemon=True).start()
+
 @app.get("/health")
 async def health():
-    return {"status": "ok"}
+    return {"status": "ok", "worker": {**_STARTUP, **memory_usage()}, "models": model_cache.stats(), "batcher": batcher.stats(),
+            "patient_index": patient_access.stats(), "analysis_jobs": analysis_jobs.stats(),
+            "adhoc_sql": duckdb_catalog.stats()}
@@ -0,0 +1,587 @@
+# -*- coding: utf-8 -*-
+"""
+Compile fitted `pipeline_builders` pipelines into flat numpy arrays.
+
+A compiled pipeline holds:
+  * the ColumnTransformer folded into per-column fill values, an affine
+    (x - center) / scale map for numeric columns and a value -> output-slot
+    map for one-hot columns;
+  * every tree of the RandomForest / XGBoost ensemble concatenated into flat
+    `feature`, `threshold`, `left`, `value` arrays, with nodes renumbered so
+    each right child sits directly after its left sibling.
+
+Traversal is vectorized over (rows x trees): each step advances every active
+node one level, so a batch costs `max_depth` numpy gathers instead of one
+Python-level walk per row and tree. Leaves point to themselves, which keeps
+the loop free of per-tree bookkeeping.
+"""
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+import copy
+import os
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import joblib
+
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sklearn.ensemble import (
+    RandomForestClassifier, RandomForestRegressor,
+    ExtraTreesClassifier, ExtraTreesRegressor,
+)
+
+from .pipeline_builders import IdentifierDropper, LeakageGuard
+
+# Max (rows x trees) cells traversed per block; bounds the traversal buffers.
+_BLOCK_CELLS = 1 << 22
+
+
+class CompilationError(ValueError):
+    """Raised when a pipeline contains a step the compiler cannot fold."""
+
+
+# ---------------------------- Compiled model ----------------------------
+class CompiledPipeline:
+    """
+    Array-only replacement for a fitted preprocessing + tree-ensemble pipeline.
+    Mirrors `predict_proba` / `predict` of the source pipeline on DataFrames.
+    """
+
+    dtype = np.float64    # class default keeps artifacts pickled before float32 support loadable
+
+    def __init__(self) -> None:
+        self.kind: str = "classification"          # or "regression"
+        self.source: str = "sklearn"               # or "xgboost"
+        self.classes_: Optional[np.ndarray] = None
+        self.input_columns: List[str] = []
+
+        # numeric block
+        self.num_cols: List[str] = []
+        self.num_fill: np.ndarray = np.zeros(0)
+        self.num_center: np.ndarray = np.zeros(0)
+        self.num_scale: np.ndarray = np.ones(0)
+
+        # categorical block
+        self.cat_cols: List[str] = []
+        self.cat_fill: List[Any] = []
+        self.cat_categories: List[np.ndarray] = []
+        self.cat_offsets: np.ndarray = np.zeros(0, dtype=np.int64)
+
+        self.n_features: int = 0
+        self.zero_as_missing: bool = False          # XGBoost fed a sparse matrix: absent == missing
+
+        # flat forest
+        self.roots: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.feature: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.threshold: np.ndarray = np.zeros(0)
+        self.left: np.ndarray = np.zeros(0, dtype=np.int32)   # right child is left + 1
+        self.missing_left: np.ndarray = np.zeros(0, dtype=bool)
+        self.is_leaf: np.ndarray = np.zeros(0, dtype=bool)
+        self.value: np.ndarray = np.zeros((0, 1))
+        self.max_depth: int = 0
+        self.strict_less: bool = False              # XGBoost splits on x < t
+        self.base_margin: float = 0.0
+        self.objective: str = "mean"                # "mean" | "logistic" | "identity"
+        self.artifact_stat: Optional[Tuple[int, int]] = None  # (size, mtime_ns) of the source .joblib
+        self.dtype = np.float64                     # float32 after astype_float32()
+
+    # ---------------- preprocessing ----------------
+    def transform(self, X: pd.DataFrame) -> np.ndarray:
+        """Dense feature matrix equal to the source ColumnTransformer output."""
+        n = len(X)
+        out = np.zeros((n, self.n_features), dtype=self.dtype)
+        k = len(self.num_cols)
+        if k:
+            frame = X.reindex(columns=self.num_cols)
+            try:
+                block = frame.to_numpy(dtype=np.float64, na_value=np.nan)
+            except (TypeError, ValueError):
+                block = frame.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            miss = np.isnan(block)
+            if miss.any():
+                block = np.where(miss, self.num_fill, block)
+            # standardized in float64 and rounded once on store, exactly like the
+            # pipeline's float64 output cast to float32 by the forest
+            out[:, :k] = (block - self.num_center) / self.num_scale
+        for j, c in enumerate(self.cat_cols):
+            s = X[c] if c in X.columns else pd.Series([None] * n, index=X.index)
+            s = s.where(pd.notna(s), self.cat_fill[j])
+            codes = pd.Categorical(s, categories=self.cat_categories[j]).codes
+            rows = np.flatnonzero(codes >= 0)
+            out[rows, self.cat_offsets[j] + codes[rows]] = 1.0
+        if self.zero_as_missing:
+            out[out == 0.0] = np.nan
+        return out
+
+    def transform_record(self, record: Mapping[str, Any]) -> np.ndarray:
+        """
+        Single-row `transform` straight from a dict, without pandas: one float32 row
+        built from the precomputed fill / center / scale vectors and category slots.
+        """
+        k = len(self.num_cols)
+        vals = np.empty(k, dtype=np.float64)
+        get = record.get
+        for j, c in enumerate(self.num_cols):
+            v = get(c)
+            try:
+                vals[j] = np.nan if v is None else float(v)
+            except (TypeError, ValueError):
+                vals[j] = np.nan
+        miss = np.isnan(vals)
+        if miss.any():
+            vals[miss] = self.num_fill[miss]
+        row = np.zeros((1, self.n_features), dtype=np.float32)
+        row[0, :k] = (vals - self.num_center) / self.num_scale
+        slots = self._category_slots()
+        for j, c in enumerate(self.cat_cols):
+            v = get(c)
+            if v is None or (isinstance(v, float) and v != v):
+                v = self.cat_fill[j]
+            try:
+                pos = slots[j].get(v)
+            except TypeError:           # unhashable value: treated as an unseen category
+                pos = None
+            if pos is not None:
+                row[0, pos] = 1.0
+        if self.zero_as_missing:
+            row[row == 0.0] = np.nan
+        return row
+
+    def _category_slots(self) -> List[Dict[Any, int]]:
+        # built on first use, not pickled (see __getstate__)
+        slots = self.__dict__.get("_slots")
+        if slots is None:
+            slots = [
+                {v: int(off) + i for i, v in enumerate(cats.tolist())}
+                for cats, off in zip(self.cat_categories, self.cat_offsets)
+            ]
+            self.__dict__["_slots"] = slots
+        return slots
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = dict(self.__dict__)
+        state.pop("_slots", None)
+        return state
+
+    def astype_float32(self) -> "CompiledPipeline":
+        """
+        Single-precision copy: feature matrix, thresholds, leaf values and outputs in
+        float32, halving the per-batch buffers. Standardization still runs in float64
+        (float32 arithmetic there moves inputs across split points). Thresholds are
+        rounded to the float32 neighbour that keeps every float32 input on the same
+        branch, so leaves match float64 exactly and only leaf averaging rounds differently.
+        """
+        if self.dtype == np.float32:
+            return self
+        cp = copy.copy(self)
+        thr = self.threshold.astype(np.float32)
+        if self.strict_less:    # right when x >= t: round up
+            off = thr < self.threshold
+            thr[off] = np.nextafter(thr[off], np.float32(np.inf))
+        else:                   # right when x > t: round down
+            off = thr > self.threshold
+            thr[off] = np.nextafter(thr[off], np.float32(-np.inf))
+        cp.threshold = thr
+        cp.value = self.value.astype(np.float32)
+        cp.dtype = np.float32
+        return cp
+
+    # ---------------- traversal kernel ----------------
+    def _leaves(self, Xf: np.ndarray) -> np.ndarray:
+        """Leaf index per (row, tree) for a float feature block."""
+        n_rows, n_feat = Xf.shape
+        n_trees = self.roots.shape[0]
+        flat = np.ascontiguousarray(Xf).ravel()
+        base = np.repeat(np.arange(n_rows, dtype=np.int64) * n_feat, n_trees)
+        nodes = np.tile(self.roots, n_rows)
+        # preallocated work buffers; every step is a handful of in-place gathers
+        feat = np.empty(nodes.shape, dtype=np.int32)
+        cell = np.empty(nodes.shape, dtype=np.int64)
+        xv = np.empty(nodes.shape, dtype=flat.dtype)
+        thr = np.empty(nodes.shape, dtype=self.threshold.dtype)
+        go_right = np.empty(nodes.shape, dtype=bool)
+        has_nan = bool(np.isnan(flat).any())
+        compare = np.greater_equal if self.strict_less else np.greater
+        for depth in range(self.max_depth):
+            np.take(self.feature, nodes, out=feat, mode="clip")
+            np.add(base, feat, out=cell)
+            np.take(flat, cell, out=xv, mode="clip")
+            np.take(self.threshold, nodes, out=thr, mode="clip")
+            compare(xv, thr, out=go_right)
+            if has_nan:
+                nan = np.isnan(xv)
+                go_right[nan] = ~self.missing_left[nodes[nan]]
+            # siblings are adjacent: right child == left child + 1
+            np.take(self.left, nodes, out=feat, mode="clip")
+            np.add(feat, go_right, out=nodes)
+            if depth % 4 == 3 and self.is_leaf[nodes].all():
+                break
+        return nodes.reshape(n_rows, n_trees)
+
+    def _raw(self, X: pd.DataFrame) -> np.ndarray:
+        """Aggregated leaf values, shape (n_rows, n_outputs)."""
+        return self._raw_features(self.transform(X).astype(np.float32, copy=False))
+
+    def _raw_features(self, Xt: np.ndarray) -> np.ndarray:
+        n_rows, n_trees = Xt.shape[0], max(1, self.roots.shape[0])
+        step = max(1, _BLOCK_CELLS // n_trees)
+        out = np.empty((n_rows, self.value.shape[1]), dtype=self.dtype)
+        for start in range(0, n_rows, step):
+            leaves = self._leaves(Xt[start:start + step])
+            vals = self.value[leaves]                      # (rows, trees, outputs)
+            if self.objective == "mean":
+                out[start:start + step] = vals.mean(axis=1)
+            else:
+                # boosted margins: float32, accumulated in tree order like xgboost
+                # (np.add.accumulate is strictly sequential, unlike the pairwise np.sum)
+                base = np.full((vals.shape[0], 1, vals.shape[2]), self.base_margin, dtype=np.float32)
+                acc = np.add.accumulate(np.concatenate([base, vals.astype(np.float32, copy=False)], axis=1), axis=1)
+                out[start:start + step] = acc[:, -1]
+        return out
+
+    # ---------------- estimator API ----------------
+    @property
+    def predict_proba(self):
+        # property so hasattr(model, "predict_proba") matches sklearn regressors
+        if self.kind != "classification":
+            raise AttributeError("predict_proba is only available for classifiers")
+        return self._predict_proba
+
+    def _predict_proba(self, X: pd.DataFrame) -> np.ndarray:
+        raw = self._raw(X)
+        if self.objective == "logistic":
+            p = 1.0 / (1.0 + np.exp(-raw[:, 0].astype(np.float32)))
+            return np.column_stack([1.0 - p, p]).astype(self.dtype)
+        return raw
+
+    def predict(self, X: pd.DataFrame) -> np.ndarray:
+        if self.kind == "classification":
+            return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+        return self._raw(X)[:, 0]
+
+    def score_record(self, record: Mapping[str, Any]) -> float:
+        """
+        Positive-class probability (classifiers) or prediction (regressors) for one
+        patient dict; the point-of-care path that skips DataFrame construction.
+        """
+        raw = self._raw_features(self.transform_record(record))
+        if self.kind != "classification":
+            return float(raw[0, 0])
+        if self.objective == "logistic":
+            return float(1.0 / (1.0 + np.exp(-np.float32(raw[0, 0]))))
+        return float(raw[0, -1])
+
+    def nbytes(self) -> int:
+        arrays = (self.feature, self.threshold, self.left,
+                  self.missing_left, self.is_leaf, self.value, self.roots)
+        return int(sum(a.nbytes for a in arrays))
+
+
+# ---------------------------- Compiler ----------------------------
+def _unwrap_estimator(obj):
+    return getattr(obj, "best_estimator_", obj)
+
+
+def _split_pipeline(model) -> Tuple[ColumnTransformer, Any]:
+    """Locate the single ColumnTransformer and the final estimator."""
+    model = _unwrap_estimator(model)
+    if not isinstance(model, Pipeline):
+        raise CompilationError("expected an sklearn Pipeline")
+    ct: Optional[ColumnTransformer] = None
+
+    def _walk(steps):
+        nonlocal ct
+        for _, step in steps:
+            if step is None or step == "passthrough":
+                continue
+            if isinstance(step, Pipeline):
+                _walk(step.steps)
+            elif isinstance(step, ColumnTransformer):
+                if ct is not None:
+                    raise CompilationError("multiple ColumnTransformers are not supported")
+                ct = step
+            elif isinstance(step, (IdentifierDropper, LeakageGuard)):
+                # column droppers; the ColumnTransformer already selects by name
+                continue
+            else:
+                raise CompilationError(f"unsupported preprocessing step: {type(step).__name__}")
+
+    _walk(model.steps[:-1])
+    if ct is None:
+        raise CompilationError("no ColumnTransformer found")
+    return ct, model.steps[-1][1]
+
+
+def _numeric_block(trans, cols: List[str]):
+    steps = [] if trans == "passthrough" else (trans.steps if isinstance(trans, Pipeline) else [("only", trans)])
+    fill = np.full(len(cols), np.nan)
+    center = np.zeros(len(cols))
+    scale = np.ones(len(cols))
+    keep = np.ones(len(cols), dtype=bool)
+    for _, step in steps:
+        if isinstance(step, SimpleImputer):
+            stats = np.asarray(step.statistics_, dtype=np.float64)
+            keep = ~np.isnan(stats) | bool(getattr(step, "keep_empty_features", False))
+            fill = np.where(np.isnan(stats), 0.0, stats)
+            if getattr(step, "add_indicator", False):
+                raise CompilationError("SimpleImputer(add_indicator=True) is not supported")
+        elif isinstance(step, StandardScaler):
+            idx = np.flatnonzero(keep)
+            if step.mean_ is not None and step.with_mean:
+                center[idx] = step.mean_
+            if step.scale_ is not None and step.with_std:
+                scale[idx] = step.scale_
+        else:
+            raise CompilationError(f"unsupported numeric step: {type(step).__name__}")
+    return [c for c, k in zip(cols, keep) if k], fill[keep], center[keep], scale[keep]
+
+
+def _categorical_block(trans, cols: List[str]):
+    steps = trans.steps if isinstance(trans, Pipeline) else [("only", trans)]
+    fill: List[Any] = [None] * len(cols)
+    categories: Optional[List[np.ndarray]] = None
+    for _, step in steps:
+        if isinstance(step, SimpleImputer):
+            if getattr(step, "add_indicator", False):
+                raise CompilationError("SimpleImputer(add_indicator=True) is not supported")
+            stats = list(step.statistics_)
+            if any(pd.isna(v) for v in stats) and not getattr(step, "keep_empty_features", False):
+                raise CompilationError("all-missing categorical columns are not supported")
+            fill = stats
+        elif isinstance(step, OneHotEncoder):
+            if step.drop is not None or getattr(step, "_infrequent_enabled", False):
+                raise CompilationError("OneHotEncoder with drop/infrequent categories is not supported")
+            categories = [np.asarray(c) for c in step.categories_]
+        else:
+            raise CompilationError(f"unsupported categorical step: {type(step).__name__}")
+    if categories is None:
+        raise CompilationError("categorical block without OneHotEncoder")
+    return list(cols), fill, categories
+
+
+def _fold_column_transformer(cp: CompiledPipeline, ct: ColumnTransformer) -> None:
+    num_cols: List[str] = []
+    num_parts: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+    cat_cols: List[str] = []
+    cat_fill: List[Any] = []
+    cat_cats: List[np.ndarray] = []
+    order: List[str] = []  # block kinds in output order
+
+    for name, trans, cols in ct.transformers_:
+        if trans == "drop" or cols is None:
+            continue
+        cols = [cols] if isinstance(cols, str) else list(cols)
+        if not cols:
+            continue
+        if any(not isinstance(c, str) for c in cols):
+            raise CompilationError("ColumnTransformer must select columns by name")
+        last = trans.steps[-1][1] if isinstance(trans, Pipeline) else trans
+        if isinstance(last, OneHotEncoder):
+            c, f, cats = _categorical_block(trans, cols)
+            cat_cols += c; cat_fill += f; cat_cats += cats
+            order.append("cat")
+        else:
+            c, f, ce, sc = _numeric_block(trans, cols)
+            num_cols += c; num_parts.append((f, ce, sc))
+            order.append("num")
+
+    if order != sorted(order, key=lambda kind: kind == "cat"):
+        raise CompilationError("numeric blocks must precede one-hot blocks")
+
+    cp.num_cols = num_cols
+    if num_parts:
+        cp.num_fill = np.concatenate([p[0] for p in num_parts])
+        cp.num_center = np.concatenate([p[1] for p in num_parts])
+        cp.num_scale = np.concatenate([p[2] for p in num_parts])
+    cp.cat_cols = cat_cols
+    cp.cat_fill = cat_fill
+    cp.cat_categories = cat_cats
+    sizes = np.array([len(c) for c in cat_cats], dtype=np.int64)
+    cp.cat_offsets = len(num_cols) + np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64) if len(sizes) else sizes
+    cp.n_features = len(num_cols) + int(sizes.sum())
+    cp.input_columns = [str(c) for c in getattr(ct, "feature_names_in_", num_cols + cat_cols)]
+    cp.zero_as_missing = bool(getattr(ct, "sparse_output_", False))
+
+
+def _sibling_order(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Breadth-first node order in which every right child directly follows its left sibling."""
+    order = [0]
+    for node in order:
+        if left[node] >= 0:
+            order.append(int(left[node]))
+            order.append(int(right[node]))
+    return np.asarray(order, dtype=np.int64)
+
+
+def _finish_forest(cp: CompiledPipeline, trees: List[Dict[str, np.ndarray]], value_dtype) -> None:
+    """Concatenate per-tree arrays with node offsets; leaves become self-loops."""
+    feats, thrs, lefts, mls, leafs, vals, roots = [], [], [], [], [], [], []
+    depth, offset = 0, 0
+    for t in trees:
+        order = _sibling_order(t["left"], t["right"])
+        pos = np.empty(t["left"].shape[0], dtype=np.int64)
+        pos[order] = np.arange(order.shape[0])
+        left = t["left"][order]
+        leaf = left < 0
+        idx = np.arange(order.shape[0], dtype=np.int64) + offset
+        feats.append(np.where(leaf, 0, t["feature"][order]).astype(np.int32))
+        thrs.append(np.where(leaf, np.inf, t["threshold"][order]))
+        lefts.append(np.where(leaf, idx, pos[np.where(leaf, 0, left)] + offset).astype(np.int32))
+        mls.append(np.where(leaf, True, t["missing_left"][order]))
+        leafs.append(leaf)
+        vals.append(t["value"][order])
+        roots.append(offset)
+        depth = max(depth, t["depth"])
+        offset += order.shape[0]
+    cp.feature = np.concatenate(feats)
+    cp.threshold = np.concatenate(thrs).astype(value_dtype)
+    cp.left = np.concatenate(lefts)
+    cp.missing_left = np.concatenate(mls).astype(bool)
+    cp.is_leaf = np.concatenate(leafs)
+    cp.value = np.concatenate(vals).astype(value_dtype)
+    cp.roots = np.asarray(roots, dtype=np.int32)
+    cp.max_depth = int(depth)
+
+
+def _compile_sklearn_forest(cp: CompiledPipeline, est) -> None:
+    is_clf = isinstance(est, (RandomForestClassifier, ExtraTreesClassifier))
+    cp.kind = "classification" if is_clf else "regression"
+    cp.source = "sklearn"
+    cp.objective = "mean"
+    cp.zero_as_missing = False  # sklearn trees read sparse zeros as 0.0
+    cp.strict_less = False
+    if is_clf:
+        if getattr(est, "n_outputs_", 1) != 1:
+            raise CompilationError("multi-output forests are not supported")
+        cp.classes_ = np.asarray(est.classes_)
+    trees = []
+    for sub in est.estimators_:
+        tr = sub.tree_
+        value = tr.value[:, 0, :].astype(np.float64)
+        if is_clf:
+            norm = value.sum(axis=1, keepdims=True)
+            norm[norm == 0.0] = 1.0
+            value = value / norm
+        missing = getattr(tr, "missing_go_to_left", None)
+        trees.append({
+            "feature": tr.feature, "threshold": tr.threshold,
+            "left": tr.children_left, "right": tr.children_right,
+            "missing_left": np.zeros(tr.node_count, dtype=bool) if missing is None else np.asarray(missing, dtype=bool),
+            "value": value, "depth": int(tr.max_depth),
+        })
+    _finish_forest(cp, trees, np.float64)
+
+
+def _xgb_float(v) -> float:
+    if isinstance(v, str):
+        v = v.strip("[]")
+    return float(v)
+
+
+def _compile_xgboost(cp: CompiledPipeline, est) -> None:
+    booster = est.get_booster()
+    cfg = json.loads(bytes(booster.save_raw(raw_format="json")).decode("utf-8"))
+    learner = cfg["learner"]
+    gb = learner["gradient_booster"]
+    if gb.get("name") != "gbtree":
+        raise CompilationError(f"unsupported xgboost booster: {gb.get('name')}")
+    objective = learner["objective"]["name"]
+    base_score = _xgb_float(learner["learner_model_param"]["base_score"])
+    if objective == "binary:logistic":
+        cp.kind, cp.objective = "classification", "logistic"
+        cp.classes_ = np.asarray(getattr(est, "classes_", [0, 1]))
+        base_score = float(np.log(base_score / (1.0 - base_score)))
+    elif objective in ("reg:squarederror", "reg:pseudohubererror", "reg:absoluteerror"):
+        cp.kind, cp.objective = "regression", "identity"
+    else:
+        raise CompilationError(f"unsupported xgboost objective: {objective}")
+    if int(learner["learner_model_param"].get("num_class", "0") or 0) > 1:
+        raise CompilationError("multi-class xgboost models are not supported")
+    cp.source = "xgboost"
+    cp.strict_less = True
+    cp.base_margin = base_score
+
+    trees = []
+    for t in gb["model"]["trees"]:
+        left = np.asarray(t["left_children"], dtype=np.int64)
+        right = np.asarray(t["right_children"], dtype=np.int64)
+        cond = np.asarray(t["split_conditions"], dtype=np.float32)
+        # depth by BFS over parent links
+        depth = np.zeros(left.shape[0], dtype=np.int64)
+        for i in range(left.shape[0]):
+            if left[i] >= 0:
+                depth[left[i]] = depth[right[i]] = depth[i] + 1
+        trees.append({
+            "feature": np.asarray(t["split_indices"], dtype=np.int64),
+            "threshold": cond,
+            "left": left, "right": right,
+            "missing_left": np.asarray(t["default_left"], dtype=bool),
+            "value": np.where(left < 0, cond, 0.0).reshape(-1, 1),
+            "depth": int(depth.max()),
+        })
+    _finish_forest(cp, trees, np.float32)
+
+
+def compile_pipeline(model) -> CompiledPipeline:
+    """Compile a fitted pipeline; raises CompilationError if any step is unsupported."""
+    ct, est = _split_pipeline(model)
+    cp = CompiledPipeline()
+    _fold_column_transformer(cp, ct)
+    if isinstance(est, (RandomForestClassifier, RandomForestRegressor, ExtraTreesClassifier, ExtraTreesRegressor)):
+        _compile_sklearn_forest(cp, est)
+    elif type(est).__module__.startswith("xgboost"):
+        _compile_xgboost(cp, est)
+    else:
+        raise CompilationError(f"unsupported estimator: {type(est).__name__}")
+    return cp
+
+
+# ---------------------------- Verification & IO ----------------------------
+def _model_output(model, X: pd.DataFrame) -> np.ndarray:
+    if hasattr(model, "predict_proba"):
+        return np.asarray(model.predict_proba(X), dtype=np.float64)
+    return np.asarray(model.predict(X), dtype=np.float64)
+
+
+def max_abs_difference(compiled: CompiledPipeline, model, X: pd.DataFrame) -> float:
+    """Largest |compiled - original| over predict_proba (classifiers) or predict (regressors)."""
+    ref = _model_output(model, X)
+    got = compiled.predict_proba(X) if compiled.kind == "classification" else compiled.predict(X)
+    return float(np.max(np.abs(ref - got))) if len(X) else 0.0
+
+
+def artifact_signature(path: str | Path) -> Tuple[int, int]:
+    st = Path(path).stat()
+    return int(st.st_size), int(st.st_mtime_ns)
+
+
+def is_current(compiled: CompiledPipeline, artifact_path: str | Path) -> bool:
+    """True when `compiled` was built from the artifact as it exists on disk now."""
+    try:
+        return compiled.artifact_stat == artifact_signature(artifact_path)
+    except OSError:
+        return False
+
+
+def save_compiled(compiled: CompiledPipeline, path: str | Path) -> str:
+    """
+    Uncompressed dump so the tree arrays stay memory-mappable. Written to a temp file
+    and renamed, so processes that still map the previous file keep a valid inode.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    joblib.dump(compiled, tmp)
+    os.replace(tmp, path)
+    return str(path)
+
+
+def load_compiled(path: str | Path, mmap_mode: Optional[str] = None) -> CompiledPipeline:
+    obj = joblib.load(path, mmap_mode=mmap_mode)
+    if not isinstance(obj, CompiledPipeline):
+        raise TypeError(f"{path} does not contain a CompiledPipeline")
+    return obj
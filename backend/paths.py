@@ -4,5 +4,6 @@ from pathlib import Path
 BASE = Path(__file__).resolve().parent.parent
 ARTIFACT_DIR = BASE / "artifacts"
 REPORT_DIR = BASE / "reports"
+COMPILED_DIR = ARTIFACT_DIR / "compiled"
 ARTIFACT_DIR.mkdir(parents=True, exist_ok=True)
 REPORT_DIR.mkdir(parents=True, exist_ok=True)
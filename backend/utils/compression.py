@@ -0,0 +1,136 @@
+"""
+Response compression negotiated from Accept-Encoding: zstd when the client accepts it and
+the zstandard package is installed, otherwise gzip. Bodies under minimum_size are sent
+as is. Streaming responses (NDJSON events, Arrow) are compressed chunk by chunk and
+flushed after every chunk, so a client still sees each event as soon as it is produced.
+"""
+import os
+import zlib
+from typing import List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # optional: gzip only
+    zstandard = None
+
+MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", "6"))
+ZSTD_LEVEL = int(os.environ.get("COMPRESS_ZSTD_LEVEL", "3"))
+# already compressed, or must not be buffered
+SKIP_TYPES = ("image/", "video/", "audio/", "application/zip", "application/gzip", "application/pdf",
+              "text/event-stream")
+
+
+def _accepted(header: str) -> List[str]:
+    """Codings the client accepts (q > 0)."""
+    out = []
+    for part in header.lower().split(","):
+        name, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for p in params:
+            if p.startswith("q="):
+                try:
+                    q = float(p[2:])
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            out.append(name)
+    return out
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = _accepted(accept_encoding)
+    if zstandard is not None and "zstd" in accepted:
+        return "zstd"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "zstd":
+            self._z = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+            self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            self._z = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)    # 31: gzip container
+            self._flush_block = zlib.Z_SYNC_FLUSH
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._z.compress(data) + self._z.flush(self._flush_block)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._z.compress(data) + self._z.flush()
+
+
+class CompressionMiddleware:
+    """ASGI middleware; see the module docstring."""
+
+    def __init__(self, app, minimum_size: int = MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await _Responder(self.app, encoding, self.minimum_size)(scope, receive, send)
+
+
+class _Responder:
+    def __init__(self, app, encoding: str, minimum_size: int):
+        self.app, self.encoding, self.minimum_size = app, encoding, minimum_size
+        self.start: Optional[dict] = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+
+    def _headers(self, extra: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+        """Response headers with a new content-length, and Accept-Encoding added to Vary (CORS sets Origin)."""
+        vary = [v for k, v in self.start["headers"] if k.lower() == b"vary"]
+        kept = [(k, v) for k, v in self.start["headers"] if k.lower() not in (b"content-length", b"vary")]
+        if not any(b"accept-encoding" in v.lower() for v in vary):
+            vary.append(b"Accept-Encoding")
+        return kept + [(b"vary", b", ".join(vary))] + extra
+
+    async def __call__(self, scope, receive, send) -> None:
+        async def wrapped(message) -> None:
+            if message["type"] == "http.response.start":
+                self.start = message
+                headers = {k.lower(): v for k, v in message.get("headers", [])}
+                ctype = headers.get(b"content-type", b"").decode("latin-1")
+                # byte ranges (206, FileResponse) must stay byte ranges of the stored file
+                self.passthrough = (b"content-encoding" in headers or b"content-range" in headers
+                                    or message.get("status") == 206 or ctype.startswith(SKIP_TYPES))
+                if self.passthrough:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or self.passthrough:
+                await send(message)
+                return
+
+            body, more = message.get("body", b""), message.get("more_body", False)
+            if self.compressor is None:
+                if not more and len(body) < self.minimum_size:
+                    # small single-message body: unchanged
+                    self.passthrough = True
+                    await send(self.start)
+                    await send(message)
+                    return
+                self.compressor = _Compressor(self.encoding)
+                enc = [(b"content-encoding", self.encoding.encode())]
+                if not more:
+                    data = self.compressor.finish(body)
+                    start = {**self.start, "headers": self._headers(enc + [(b"content-length", str(len(data)).encode())])}
+                    await send(start)
+                    await send({"type": "http.response.body", "body": data, "more_body": False})
+                    return
+                await send({**self.start, "headers": self._headers(enc)})
+            data = self.compressor.chunk(body) if more else self.compressor.finish(body)
+            await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        await self.app(scope, receive, wrapped)
@@ -0,0 +1,77 @@
+"""
+JSON encoding for API responses, NDJSON streams and JSON artifacts.
+
+orjson writes numpy arrays and scalars directly and turns NaN / inf into null, so frames
+no longer need an astype(object).where(notna) pass before they are returned. Timestamps
+and datetimes keep the "2024-01-01 00:00:00" form the API has always used. Without orjson the
+standard library is used with the same conversions.
+"""
+import datetime
+import decimal
+import json
+import math
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib fallback
+    orjson = None
+
+import numpy as np
+import pandas as pd
+
+if orjson is not None:
+    _OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+def _default(v: Any) -> Any:
+    if v is None or v is pd.NaT or v is pd.NA:
+        return None
+    if isinstance(v, (datetime.date, datetime.time)):      # pd.Timestamp included
+        return str(v)
+    if isinstance(v, np.generic):
+        v = v.item()
+        return None if isinstance(v, float) and not math.isfinite(v) else v
+    if isinstance(v, np.ndarray):
+        return v.tolist()
+    if isinstance(v, decimal.Decimal):
+        return float(v)
+    if isinstance(v, (set, frozenset, tuple)):
+        return list(v)
+    return str(v)
+
+
+def _plain(v: Any) -> Any:
+    """Stdlib fallback: the conversions orjson does natively."""
+    if isinstance(v, float):
+        return v if math.isfinite(v) else None
+    if isinstance(v, dict):
+        return {str(k) if not isinstance(k, str) else k: _plain(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [_plain(x) for x in v]
+    if isinstance(v, (str, int, bool)) or v is None:
+        return v
+    return _plain(_default(v))
+
+
+def dumps(obj: Any, indent: bool = False) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=_OPTS | (orjson.OPT_INDENT_2 if indent else 0))
+    return json.dumps(_plain(obj), indent=2 if indent else None, ensure_ascii=False,
+                      allow_nan=False).encode("utf-8")
+
+
+def ndjson_line(obj: Any) -> bytes:
+    return dumps(obj) + b"\n"
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered by dumps(). Returning one from a route also skips FastAPI's
+    jsonable_encoder walk over the payload, which matters for large row lists.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,27 @@
+import os
+import sys
+from typing import Dict, Optional
+
+
+def memory_usage() -> Dict[str, Optional[float]]:
+    """
+    Memory of this worker in MB. `shared_mb` counts file-backed resident pages
+    (e.g. memory-mapped model artifacts) that other workers map too.
+    """
+    out: Dict[str, Optional[float]] = {"rss_mb": None, "shared_mb": None, "peak_rss_mb": None}
+    page = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+    try:
+        with open("/proc/self/statm", "r") as f:
+            _, resident, shared = (int(x) for x in f.read().split()[:3])
+        out["rss_mb"] = round(resident * page / 1e6, 1)
+        out["shared_mb"] = round(shared * page / 1e6, 1)
+    except (OSError, ValueError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS bytes
+        out["peak_rss_mb"] = round(peak / 1e6 if sys.platform == "darwin" else peak * 1024 / 1e6, 1)
+    except Exception:
+        pass
+    return out
@@ -1,6 +1,6 @@
 import React, { useState, useMemo, useRef } from 'react';
 import { BarChart3, Activity, AlertTriangle, Loader2, CheckCircle, AlertCircle, Navigation, ChevronDown } from 'lucide-react';
-import { api, fetchArtifact } from '../api';
+import { streamNdjson } from '../api';
 import RiskHistogram from './RiskHistogram';
 import RegressorHistogram from './RegressorHistogram';
 import SummaryReadable from './SummaryReadable';
@@ -209,18 +209,40 @@ export default function AnalysisPage() {
     setSummary(null); setRisk(null); setAnom(null);
     setOpenTables({});
     try {
-      const client = api();
       const payload = { dataset_id: Number(datasetId) };
       if (strategyId) payload.strategy_id = Number(strategyId);
-      const r = await client.post('/analytics/run', payload);
-      setSummary(r.data?.summary || null);
-
-      const riskPath = r.data?.risk_json;
-      const anomPath = r.data?.anomaly_json;
-      const riskData = riskPath ? await fetchArtifact(riskPath) : null;
-      const anomData = anomPath ? await fetchArtifact(anomPath) : null;
-      setRisk(riskData);
-      setAnom(anomData);
+      // results arrive chunk by chunk; render patients as soon as the first chunk is scored.
+      // Chunks are appended in place and state is set at most once per animation frame.
+      const riskPatients = [];
+      const anomPatients = [];
+      let frame = null;
+      const flush = () => {
+        frame = null;
+        setRisk((prev) => ({ summary: prev?.summary || null, patients: riskPatients }));
+        if (anomPatients.length) setAnom((prev) => ({ summary: prev?.summary || null, patients: anomPatients }));
+      };
+      const schedule = () => {
+        if (frame === null) frame = requestAnimationFrame(flush);
+      };
+      await streamNdjson('/analytics/run/stream', payload, (ev) => {
+        if (ev.event === 'risk') {
+          riskPatients.push(...ev.patients);
+          schedule();
+        } else if (ev.event === 'risk_summary') {
+          setRisk({ summary: ev.summary, patients: riskPatients });
+        } else if (ev.event === 'anomaly') {
+          anomPatients.push(...ev.patients);
+          schedule();
+        } else if (ev.event === 'done') {
+          if (frame !== null) cancelAnimationFrame(frame);
+          frame = null;
+          setRisk((prev) => ({ summary: prev?.summary || null, patients: riskPatients }));
+          setSummary(ev.summary || null);
+          setAnom({ summary: ev.summary?.anomaly || null, patients: anomPatients });
+        } else if (ev.event === 'error') {
+          throw new Error(ev.detail);
+        }
+      });
     } catch (e) {
       setErr('Failed to run analysis.');
     } finally {
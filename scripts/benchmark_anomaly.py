@@ -0,0 +1,80 @@
+"""
+Anomaly engine benchmark: fit and score time against dataset size, for the previous
+detector (IsolationForest(n_estimators=200) fitted on every row, one decision_function
+call) and for AnomalyEngineConfig (fit on a fit_sample_rows subset, block-parallel
+scoring). Also reports how many flagged rows the two agree on (Jaccard overlap of the
+decision < 0 sets) and the flag rate of each.
+
+Rows come from scripts.generate_synthetic_data.synthesize_patients, so they are
+synthetic vitals and labs with the same columns the API scores.
+
+Run:
+  python -m scripts.benchmark_anomaly --sizes 10000 100000 1000000 5000000
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.ensemble import IsolationForest
+
+from backend.api.services.anomaly_service import NUMERIC_COLS, AnomalyEngineConfig, decision_function
+from scripts.generate_synthetic_data import synthesize_patients
+
+
+def _matrix(n: int) -> np.ndarray:
+    df = synthesize_patients(n)
+    cols = [c for c in NUMERIC_COLS if c in df.columns]
+    X = df[cols]
+    return X.fillna(X.median()).to_numpy(dtype=np.float64)
+
+
+def _baseline(X: np.ndarray):
+    iso = IsolationForest(n_estimators=200, random_state=42, contamination="auto")
+    t0 = time.perf_counter()
+    iso.fit(X)
+    t1 = time.perf_counter()
+    decision = iso.decision_function(X)
+    return t1 - t0, time.perf_counter() - t1, decision < 0
+
+
+def _engine(X: np.ndarray, cfg: AnomalyEngineConfig):
+    iso = cfg.estimator()
+    rows = cfg.fit_rows(len(X))
+    t0 = time.perf_counter()
+    iso.fit(X if rows is None else X[rows])
+    t1 = time.perf_counter()
+    decision = decision_function(iso, X, cfg)
+    return t1 - t0, time.perf_counter() - t1, decision < 0
+
+
+def main(sizes, cfg: AnomalyEngineConfig, skip_baseline_above: int):
+    print(f"engine: {cfg}")
+    print(f"{'rows':>10}{'base fit s':>12}{'base score s':>14}{'eng fit s':>11}{'eng score s':>13}"
+          f"{'base flag%':>12}{'eng flag%':>11}{'jaccard':>9}")
+    for n in sizes:
+        X = _matrix(n)
+        ef, es, eflags = _engine(X, cfg)
+        if n > skip_baseline_above:
+            print(f"{n:>10}{'-':>12}{'-':>14}{ef:>11.2f}{es:>13.2f}{'-':>12}{100 * eflags.mean():>11.2f}{'-':>9}")
+            continue
+        bf, bs, bflags = _baseline(X)
+        union = np.count_nonzero(bflags | eflags)
+        jaccard = np.count_nonzero(bflags & eflags) / union if union else 1.0
+        print(f"{n:>10}{bf:>12.2f}{bs:>14.2f}{ef:>11.2f}{es:>13.2f}"
+              f"{100 * bflags.mean():>12.2f}{100 * eflags.mean():>11.2f}{jaccard:>9.3f}")
+
+
+if __name__ == "__main__":
+    base = AnomalyEngineConfig.from_env()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 5_000_000])
+    ap.add_argument("--fit-rows", type=int, default=base.fit_sample_rows or 0, help="0: fit on every row")
+    ap.add_argument("--n-jobs", type=int, default=base.n_jobs)
+    ap.add_argument("--block-rows", type=int, default=base.score_block_rows)
+    ap.add_argument("--skip-baseline-above", type=int, default=10**9,
+                    help="Only time the engine for larger sizes (the full-fit baseline gets slow)")
+    args = ap.parse_args()
+    cfg = AnomalyEngineConfig(n_estimators=base.n_estimators, max_samples=base.max_samples,
+                              fit_sample_rows=args.fit_rows or None, n_jobs=args.n_jobs,
+                              score_block_rows=args.block_rows, random_state=base.random_state)
+    main(args.sizes, cfg, args.skip_baseline_above)
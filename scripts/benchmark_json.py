@@ -0,0 +1,103 @@
+"""
+JSON response benchmark: serialization time and payload bytes for
+  * a risk artifact ({"patients": [...], "summary": {...}} as /analytics/run writes it)
+    for every patient of a dataset, and
+  * the same dataset as a {"columns", "rows"} table (the /patients/search and ad-hoc
+    SQL shape),
+for the previous path (astype(object).where(notna) pass, FastAPI's jsonable_encoder,
+Starlette's json.dumps) and for utils.fast_json (orjson when installed). Compressed
+sizes are for gzip (level COMPRESS_GZIP_LEVEL) and zstd (when zstandard is installed).
+
+Risk scores are random: only the shape and size of the payload matter here.
+
+Run:
+  python -m scripts.benchmark_json --csv data/uploads/Sunrise_Regional_Medical_Center_2024.csv
+  python -m scripts.benchmark_json --artifact artifacts/analysis/dataset_1/<run>/risk_prediction.json
+"""
+import argparse
+import gzip
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+
+from backend.utils import compression, fast_json
+
+MODELS = ("diabetes_risk", "heart_disease_risk", "readmission_risk")
+
+
+def _risk_artifact(pids) -> dict:
+    rng = np.random.default_rng(0)
+    scores = {m: rng.random(len(pids)) for m in MODELS}
+    patients = [{"patient_id": str(pid), **{m: {"score": float(scores[m][i]), "pred": int(scores[m][i] >= 0.5),
+                                                 "threshold": 0.5, "source": "model"} for m in MODELS}}
+                for i, pid in enumerate(pids)]
+    summary = {m: {"n": len(pids), "positive": int((scores[m] >= 0.5).sum())} for m in MODELS}
+    return {"patients": patients, "summary": summary}
+
+
+def _old_table(df: pd.DataFrame) -> dict:
+    sub = df.copy()
+    for c in sub.select_dtypes(include=["datetime64[ns]", "datetimetz"]).columns:
+        sub[c] = sub[c].apply(lambda v: None if pd.isna(v) else str(v))
+    sub = sub.astype(object).where(pd.notna(sub), None)
+    return {"columns": list(sub.columns), "rows": sub.values.tolist()}
+
+
+def _new_table(df: pd.DataFrame) -> dict:
+    return {"columns": list(df.columns), "rows": df.to_numpy(dtype=object).tolist()}
+
+
+def _starlette(obj) -> bytes:
+    return json.dumps(jsonable_encoder(obj), ensure_ascii=False, allow_nan=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def _best(fn, repeat: int):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def _sizes(body: bytes) -> str:
+    gz = len(gzip.compress(body, compression.GZIP_LEVEL))
+    zs = "-"
+    if compression.zstandard is not None:
+        zs = f"{len(compression.zstandard.ZstdCompressor(level=compression.ZSTD_LEVEL).compress(body)):,}"
+    return f"{len(body):>12,}{gz:>12,}{zs:>12}"
+
+
+def main(payloads, repeat: int):
+    print(f"json backend: {'orjson' if fast_json.orjson is not None else 'stdlib'}; "
+          f"zstd: {'yes' if compression.zstandard is not None else 'not installed'}")
+    print(f"{'payload':<16}{'path':<10}{'ms':>10}{'raw bytes':>12}{'gzip':>12}{'zstd':>12}")
+    for name, old, new in payloads:
+        t_old, b_old = _best(lambda: _starlette(old()), repeat)
+        t_new, b_new = _best(lambda: fast_json.dumps(new()), repeat)
+        print(f"{name:<16}{'previous':<10}{1000 * t_old:>10.1f}{_sizes(b_old)}")
+        print(f"{name:<16}{'fast_json':<10}{1000 * t_new:>10.1f}{_sizes(b_new)}")
+        print(f"{'':<16}{'speedup':<10}{t_old / t_new:>10.1f}x")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--csv", default="data/uploads/Sunrise_Regional_Medical_Center_2024.csv")
+    ap.add_argument("--artifact", help="An existing risk_prediction.json instead of the synthetic one")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    df = pd.read_csv(args.csv)
+    if args.artifact:
+        with open(args.artifact, encoding="utf-8") as f:
+            artifact = json.load(f)
+    else:
+        id_col = next((c for c in df.columns if "patient" in c.lower() and "id" in c.lower()), None)
+        artifact = _risk_artifact(df[id_col] if id_col else df.index)
+    print(f"{len(artifact['patients']):,} patients, table {df.shape[0]:,} x {df.shape[1]}")
+    main([("risk artifact", lambda: artifact, lambda: artifact),
+          ("table rows", lambda: _old_table(df), lambda: _new_table(df))], args.repeat)
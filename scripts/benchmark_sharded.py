@@ -0,0 +1,58 @@
+"""
+Sharded scoring throughput vs worker count, on a Parquet file of patient rows.
+
+A CSV is converted to Parquet first (row groups of --shard-rows / 4, replicated
+--repeat times so there are enough shards to spread). Every worker count scores the
+same shards; the merged output of the first run is the reference the others must
+match exactly.
+
+Run:
+  python -m scripts.benchmark_sharded --models MortalityRiskModel SepsisEarlyWarning --workers 1 2 4
+"""
+import argparse, tempfile, time
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from backend.api.services import sharded_scoring
+from scripts.compile_models import MODELS_DIR, _default_data
+
+
+def _to_parquet(csv: Path, out: Path, repeat: int, row_group: int) -> int:
+    df = pd.read_csv(csv)
+    df = pd.concat([df] * repeat, ignore_index=True)
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), out, row_group_size=row_group)
+    return len(df)
+
+
+def main(data: Path, models, workers, repeat: int, shard_rows: int):
+    models = models or sorted(p.stem for p in MODELS_DIR.glob("*.joblib"))
+    with tempfile.TemporaryDirectory() as tmp:
+        src = Path(tmp) / "rows.parquet"
+        n = _to_parquet(data, src, repeat, max(1, shard_rows // 4))
+        shards = sharded_scoring.plan_parquet(str(src), shard_rows)
+        print(f"{n} rows, {len(shards)} shards, models: {', '.join(models)}")
+        print(f"{'workers':>8}{'seconds':>10}{'rows/s':>12}{'speedup':>9}  identical")
+        ref, base = None, None
+        for w in workers:
+            out_dir = Path(tmp) / f"w{w}"
+            t0 = time.perf_counter()
+            res = sharded_scoring.run_sharded(shards, models, {}, str(out_dir), workers=w)
+            dt = time.perf_counter() - t0
+            table = pq.read_table(res["scores_parquet"])
+            ref = ref or table
+            base = base or dt
+            print(f"{w:>8}{dt:>10.2f}{n / dt:>12.0f}{base / dt:>8.2f}x  {table.equals(ref)}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data", type=Path, default=None, help="CSV with patient rows to score")
+    ap.add_argument("--models", nargs="*", default=None, help="Model names (default: every artifact)")
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--repeat", type=int, default=20, help="Replicate the CSV this many times")
+    ap.add_argument("--shard-rows", type=int, default=20000)
+    args = ap.parse_args()
+    main(args.data or _default_data(), args.models, args.workers, args.repeat, args.shard_rows)
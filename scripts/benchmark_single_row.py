@@ -0,0 +1,69 @@
+"""
+Single-patient scoring latency: sklearn pipeline vs compiled model on a one-row
+DataFrame vs the pandas-free record path (`CompiledPipeline.score_record`).
+
+Needs compiled artifacts (python -m scripts.compile_models).
+
+Run:
+  python -m scripts.benchmark_single_row --data data/uploads/Sunrise_Regional_Medical_Center_2024.csv
+"""
+import argparse, time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import joblib
+
+from backend.ml_library.common.compiled_forest import load_compiled
+from backend.api.services.prediction_service import _align_X_to_model
+from scripts.compile_models import MODELS_DIR, COMPILED_DIR, _default_data
+
+
+def _latencies_us(fn, records, repeat: int) -> np.ndarray:
+    fn(records[0])  # warm-up (schema cache, category slots)
+    out = np.empty(repeat)
+    for i in range(repeat):
+        rec = records[i % len(records)]
+        t0 = time.perf_counter()
+        fn(rec)
+        out[i] = time.perf_counter() - t0
+    return out * 1e6
+
+
+def _positive(model, X: pd.DataFrame) -> float:
+    if hasattr(model, "predict_proba"):
+        return float(model.predict_proba(X)[0, 1])
+    return float(np.ravel(model.predict(X))[0])
+
+
+def main(data: Path, repeat: int):
+    df = pd.read_csv(data)
+    records = df.sample(min(len(df), 200), random_state=0).to_dict(orient="records")
+    paths = sorted(COMPILED_DIR.glob("*.joblib"))
+    if not paths:
+        raise SystemExit(f"No compiled models in {COMPILED_DIR}; run scripts.compile_models first.")
+
+    print(f"{'model':<32}{'pipeline p50/p99':>20}{'compiled df p50/p99':>24}{'record p50/p99':>20}  max|diff|")
+    for cpath in paths:
+        model = joblib.load(MODELS_DIR / cpath.name)
+        compiled = load_compiled(cpath, mmap_mode="r")
+
+        variants = {
+            "pipeline": lambda r: _positive(model, _align_X_to_model(model, pd.DataFrame([r]))),
+            "compiled": lambda r: _positive(compiled, pd.DataFrame([r])),
+            "record": compiled.score_record,
+        }
+        cols = []
+        for fn in variants.values():
+            us = _latencies_us(fn, records, repeat)
+            cols.append(f"{np.percentile(us, 50):>9.0f}/{np.percentile(us, 99):<6.0f}us")
+        diff = max(abs(variants["pipeline"](r) - compiled.score_record(r)) for r in records)
+        print(f"{cpath.stem:<32}{cols[0]:>20}{cols[1]:>24}{cols[2]:>20}  {diff:.2g}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data", type=Path, default=None, help="CSV with patient rows to score")
+    ap.add_argument("--repeat", type=int, default=2000)
+    args = ap.parse_args()
+    main(args.data or _default_data(), args.repeat)
@@ -0,0 +1,89 @@
+"""
+Compile trained pipelines (artifacts/models/*.joblib) into flat-array tree
+ensembles (artifacts/compiled/*.joblib), verify them against the originals and
+optionally benchmark both.
+
+Run:
+  python -m scripts.compile_models --data data/uploads/Sunrise_Regional_Medical_Center_2024.csv --benchmark
+"""
+import argparse, time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import joblib
+
+from backend.ml_library.common.compiled_forest import (
+    compile_pipeline, max_abs_difference, save_compiled, artifact_signature, CompilationError
+)
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+MODELS_DIR = PROJECT_ROOT / "artifacts" / "models"
+COMPILED_DIR = PROJECT_ROOT / "artifacts" / "compiled"
+
+
+def _default_data() -> Path:
+    for p in [PROJECT_ROOT / "data" / "joined_training_sample.csv", PROJECT_ROOT / "data" / "patients.csv"]:
+        if p.exists():
+            return p
+    uploads = sorted((PROJECT_ROOT / "data" / "uploads").glob("*.csv"))
+    if not uploads:
+        raise SystemExit("No sample data found; pass --data")
+    return uploads[-1]
+
+
+def _score(model, X: pd.DataFrame):
+    return model.predict_proba(X) if hasattr(model, "predict_proba") else model.predict(X)
+
+
+def _rows_per_sec(model, X: pd.DataFrame, repeat: int) -> float:
+    _score(model, X)  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        _score(model, X)
+    return len(X) * repeat / (time.perf_counter() - t0)
+
+
+def main(data: Path, atol: float, benchmark: bool, sizes):
+    df = pd.read_csv(data)
+    check = df.head(2000)
+    COMPILED_DIR.mkdir(parents=True, exist_ok=True)
+    paths = sorted(MODELS_DIR.glob("*.joblib"))
+    if not paths:
+        raise SystemExit(f"No model artifacts in {MODELS_DIR}; train first.")
+
+    rng = np.random.default_rng(0)
+    bench_frames = {n: df.iloc[rng.integers(0, len(df), size=n)].reset_index(drop=True) for n in sizes} if benchmark else {}
+
+    for path in paths:
+        name = path.stem
+        model = joblib.load(path)
+        try:
+            compiled = compile_pipeline(model)
+        except CompilationError as e:
+            print(f"[SKIP] {name}: {e}")
+            continue
+        diff = max_abs_difference(compiled, model, check)
+        if diff > atol:
+            print(f"[FAIL] {name}: max |diff| {diff:.3g} > {atol:g}; not exported")
+            continue
+        compiled.artifact_stat = artifact_signature(path)
+        out = save_compiled(compiled, COMPILED_DIR / f"{name}.joblib")
+        print(f"[OK] {name} ({compiled.source}, {len(compiled.roots)} trees, depth {compiled.max_depth}, "
+              f"{compiled.nbytes() / 1e6:.1f} MB) -> {out}  max |diff| {diff:.3g}")
+
+        for n, X in bench_frames.items():
+            repeat = max(1, 2000 // n)
+            orig = _rows_per_sec(model, X, repeat)
+            comp = _rows_per_sec(compiled, X, repeat)
+            print(f"    rows={n:>6}  original {orig:>12,.0f} rows/s  compiled {comp:>12,.0f} rows/s  x{comp / orig:.2f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data", type=Path, default=None, help="CSV used to verify (and benchmark) compiled models")
+    ap.add_argument("--atol", type=float, default=1e-6)
+    ap.add_argument("--benchmark", action="store_true", help="Report rows/sec for original vs compiled models")
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 100_000])
+    args = ap.parse_args()
+    main(args.data or _default_data(), args.atol, args.benchmark, args.sizes)
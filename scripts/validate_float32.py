@@ -0,0 +1,88 @@
+"""
+Float32 inference check: for every trained model, score the same rows in float64
+(the reference) and in float32 (INFERENCE_DTYPE=float32), through both the sklearn
+pipeline and the compiled twin, and report the max |score difference|, the number of
+classifications that flip at --threshold, and the feature matrix size per precision.
+
+The "naive" column casts the input frame to float32 and lets the whole pipeline run
+in single precision; it shows why preprocessing itself stays in float64.
+
+Run:
+  python -m scripts.validate_float32 --data data/uploads/Sunrise_Regional_Medical_Center_2024.csv
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import joblib
+from sklearn.preprocessing import OneHotEncoder
+
+from backend.ml_library.common.compiled_forest import compile_pipeline, CompilationError
+from backend.api.services.prediction_service import _align_X_to_model, _float32_features, _iter_objects
+from scripts.compile_models import MODELS_DIR, _default_data
+
+
+def _positive(model, X: pd.DataFrame) -> np.ndarray:
+    if hasattr(model, "predict_proba"):
+        return np.asarray(model.predict_proba(X)[:, 1], dtype=np.float64)
+    return np.asarray(np.ravel(model.predict(X)), dtype=np.float64)
+
+
+def _naive_float32(path: Path, X: pd.DataFrame) -> np.ndarray:
+    model = joblib.load(path)
+    for node in _iter_objects(model):
+        if isinstance(node, OneHotEncoder):
+            node.dtype = np.float32
+    num = X.select_dtypes(include="number").columns
+    return _positive(model, X.astype(dict.fromkeys(num, np.float32)))
+
+
+def _flips(ref: np.ndarray, got: np.ndarray, threshold: float) -> int:
+    return int(np.count_nonzero((ref >= threshold) != (got >= threshold)))
+
+
+def main(data: Path, rows: int, threshold: float):
+    df = pd.read_csv(data)
+    df = df.head(rows) if rows else df
+    paths = sorted(MODELS_DIR.glob("*.joblib"))
+    if not paths:
+        raise SystemExit(f"No model artifacts in {MODELS_DIR}; train first.")
+
+    print(f"{len(df)} rows")
+    print(f"{'model':<28}{'naive f32 max|diff|':>20}{'flips':>7}{'pipeline f32':>14}{'flips':>7}"
+          f"{'compiled f32':>14}{'flips':>7}{'features f64 MB':>17}{'f32 MB':>8}")
+    for path in paths:
+        model = joblib.load(path)
+        X = _align_X_to_model(model, df)
+        ref = _positive(model, X)
+        is_clf = hasattr(model, "predict_proba")
+
+        def col(got, width):
+            flips = _flips(ref, got, threshold) if is_clf else "-"
+            return f"{np.max(np.abs(got - ref)):>{width}.3g}{flips:>7}"
+
+        cols = [col(_naive_float32(path, X), 20)]
+        split = _float32_features(model, X)
+        if split is None:
+            cols.append(f"{'n/a':>14}{'-':>7}")
+            mb64 = mb32 = float("nan")
+        else:
+            est, Xt = split
+            cols.append(col(_positive(est, Xt), 14))
+            mb32 = Xt.nbytes / 1e6
+            mb64 = mb32 * 2
+        try:
+            cols.append(col(_positive(compile_pipeline(model).astype_float32(), df), 14))
+        except CompilationError:
+            cols.append(f"{'n/a':>14}{'-':>7}")
+        print(f"{path.stem:<28}{''.join(cols)}{mb64:>17.1f}{mb32:>8.1f}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data", type=Path, default=None, help="CSV with patient rows to score")
+    ap.add_argument("--rows", type=int, default=0, help="Only the first N rows (default: all)")
+    ap.add_argument("--threshold", type=float, default=0.5, help="Decision threshold for counting flips")
+    args = ap.parse_args()
+    main(args.data or _default_data(), args.rows, args.threshold)
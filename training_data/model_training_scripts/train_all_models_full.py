@@ -2,10 +2,12 @@
 """
 Train all models directly via pipeline_builder and save artifacts to artifacts/models/*.joblib.
 Bypasses model classes to avoid classifier/regressor mismatches.
+Tree-ensemble pipelines are also compiled to flat numpy arrays in artifacts/compiled/*.joblib.
 Run:
   python -m training_data.model_training_scripts.train_all_models_full
 """
 
+import os
 import json
 from pathlib import Path
 import numpy as np
@@ -16,6 +18,9 @@ from training_data.utils.derive_targets import add_or_update_targets
 from backend.ml_library.common.pipeline_builders import (
     train_eval_classification, train_eval_regression
 )
+from backend.ml_library.common.compiled_forest import (
+    compile_pipeline, max_abs_difference, save_compiled, artifact_signature, CompilationError
+)
 
 # ---------- Paths ----------
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
@@ -23,6 +28,11 @@ ARTIFACT_MODELS_DIR = PROJECT_ROOT / "artifacts" / "models"
 ARTIFACT_MODELS_DIR.mkdir(parents=True, exist_ok=True)
 OUTDIR = PROJECT_ROOT / "training_outputs"
 OUTDIR.mkdir(parents=True, exist_ok=True)
+ARTIFACT_COMPILED_DIR = PROJECT_ROOT / "artifacts" / "compiled"
+
+# compiled twins must reproduce the sklearn/xgboost outputs within this tolerance
+COMPILE_ATOL = 1e-6
+COMPILE_CHECK_ROWS = 2000
 
 # ---------- Task registry ----------
 CLASSIFICATION_MODELS = {
@@ -69,9 +79,29 @@ def _load_data() -> pd.DataFrame:
     df = pd.read_csv(p) if p.exists() else pd.read_csv(PROJECT_ROOT / "data" / "patients.csv")
     return add_or_update_targets(df)
 
-def _save(model_name: str, pipeline, metrics: dict):
+def _export_compiled(model_name: str, pipeline, artifact_path: Path, X_check: pd.DataFrame) -> dict:
+    """Compile the fitted pipeline to flat arrays and keep it only if it matches the original."""
+    try:
+        compiled = compile_pipeline(pipeline)
+    except CompilationError as e:
+        print(f"[SKIP] {model_name}: not compilable ({e})")
+        return {"compiled": False, "reason": str(e)}
+    diff = max_abs_difference(compiled, pipeline, X_check)
+    if diff > COMPILE_ATOL:
+        print(f"[WARN] {model_name}: compiled output differs by {diff:.3g}; not exported")
+        return {"compiled": False, "max_abs_diff": diff}
+    compiled.artifact_stat = artifact_signature(artifact_path)
+    out_path = save_compiled(compiled, ARTIFACT_COMPILED_DIR / f"{_safe(model_name)}.joblib")
+    print(f"[OK] {model_name} compiled -> {out_path} (max |diff| {diff:.3g})")
+    return {"compiled": True, "max_abs_diff": diff}
+
+def _save(model_name: str, pipeline, metrics: dict, X_check: pd.DataFrame):
     out_path = ARTIFACT_MODELS_DIR / f"{_safe(model_name)}.joblib"
-    joblib.dump(pipeline, out_path)
+    # write-then-rename: a running API reloads on mtime change and must never see a partial file
+    tmp_path = out_path.with_name(f".{out_path.name}.{os.getpid()}.tmp")
+    joblib.dump(pipeline, tmp_path)
+    os.replace(tmp_path, out_path)
+    metrics = {**metrics, "compiled_export": _export_compiled(model_name, pipeline, out_path, X_check)}
     with open(OUTDIR / f"{model_name}_metrics.json", "w", encoding="utf-8") as f:
         json.dump(metrics, f, indent=2)
     print(f"[OK] {model_name} -> {out_path}")
@@ -90,7 +120,7 @@ def main():
                 raise ValueError(f"{model_name}: y has a single class; cannot train AUC model.")
             est = _pick_estimator(model_name, True)
             metrics, pipeline = train_eval_classification(X, y, estimator=est, test_size=0.2)
-            _save(model_name, pipeline, metrics)
+            _save(model_name, pipeline, metrics, X.head(COMPILE_CHECK_ROWS))
         except Exception as e:
             with open(OUTDIR / f"{model_name}_metrics.json", "w", encoding="utf-8") as f:
                 json.dump({"error": str(e)}, f, indent=2)
@@ -105,7 +135,7 @@ def main():
             y = pd.to_numeric(df[target], errors="coerce")
             est = _pick_estimator(model_name, False)
             metrics, pipeline = train_eval_regression(X, y, estimator=est, test_size=0.2)
-            _save(model_name, pipeline, metrics)
+            _save(model_name, pipeline, metrics, X.head(COMPILE_CHECK_ROWS))
         except Exception as e:
             with open(OUTDIR / f"{model_name}_metrics.json", "w", encoding="utf-8") as f:
                 json.dump({"error": str(e)}, f, indent=2)